@@ -172,6 +172,20 @@ def create_app(config_override: dict | None = None) -> Flask:
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "warning"
 
+    from .services import (
+        globalpays, job_runner, lead_buffer, mail_outbox, payment_events, render_queue, search_cache, smtp_pool,
+        tenant_registry,
+    )
+    tenant_registry.init_app(app)
+    search_cache.init_app(app)
+    lead_buffer.init_app(app)
+    render_queue.init_app(app)
+    job_runner.init_app(app)
+    mail_outbox.init_app(app)
+    smtp_pool.init_app(app)
+    globalpays.init_app(app)
+    payment_events.init_app(app)
+
     # --------- Middleware: corrige /static/https:/... & /static/http:/... ----------
     @app.before_request
     def _fix_broken_static_external():
@@ -8,17 +8,16 @@ from urllib.parse import urlparse
 from pathlib import Path
 from . import admin_bp
 from sqlalchemy.exc import IntegrityError
-from jinja2.sandbox import SandboxedEnvironment
 from functools import wraps
 import base64, io
 from PIL import Image, ImageDraw, ImageFont
 from sqlalchemy.orm.attributes import InstrumentedAttribute
-from weasyprint import HTML
 import json
 from app.services.mailer import save_tenant_mail_creds, get_tenant_mail_creds, send_test_mail
 from . import admin_bp
 from azure.storage.blob import BlobServiceClient, ContentSettings
 from app.storage import load_tenant_airports, save_tenant_airports
+from app.services import booking, contract_templates, pdf_renderer, tenant_registry
 from azure.identity import DefaultAzureCredential
 from flask import (
     render_template, request, redirect, url_for, flash,
@@ -466,7 +465,12 @@ def _load_tenant():
     slug = getattr(g, "tenant_slug", None)
     if not slug:
         abort(404)
-    g.tenant = Tenant.query.filter_by(slug=slug).first_or_404()
+    snap = tenant_registry.get_tenant_or_404(slug)
+    # leitura usa o snapshot do registry; requests que gravam recebem a linha ORM (por PK)
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        g.tenant = snap
+    else:
+        g.tenant = db.session.get(Tenant, snap.id)
 
 
 # =============================================================================
@@ -874,6 +878,7 @@ def settings():
         if sec == "contract":
             t.contract_template_html = request.form.get("contract_template_html") or None
             db.session.commit()
+            contract_templates.invalidate(t.id)
             flash("Template do contrato salvo.", "success")
             return redirect(url_for("admin.settings"))
 
@@ -1497,9 +1502,10 @@ def reservations():
 @login_required
 def reservation_confirm(reservation_id):
     res = Reservation.query.filter_by(tenant_id=g.tenant.id, id=reservation_id).first_or_404()
-    res.status = "confirmed"
-    if res.vehicle:
-        res.vehicle.status = "booked"
+    if not booking.confirm(res):
+        db.session.rollback()  # aqui o admin decide; não marca under_review
+        flash("Este veículo já tem uma reserva confirmada nesse período.", "danger")
+        return redirect(url_for("admin.reservations"))
     db.session.commit()
     flash("Reserva confirmada.", "success")
     return redirect(url_for("admin.reservations"))
@@ -1676,49 +1682,6 @@ def lead_delete(lead_id):
 # Contratos (admin) — Editor/Preview/Validate limitados aos campos solicitados
 # =============================================================================
 
-def _tpl_env_admin() -> SandboxedEnvironment:
-    env = SandboxedEnvironment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
-
-    def money(value, currency="USD"):
-        try:
-            v = float(value)
-            return f"{currency} {v:,.2f}"
-        except Exception:
-            return f"{currency} {value}"
-
-    def datefmt(dt, fmt="%d/%m/%Y"):
-        if not dt:
-            return "-"
-        if isinstance(dt, str):
-            try:
-                from datetime import datetime as _dt
-                dt = _dt.fromisoformat(dt)
-            except Exception:
-                return dt
-        return dt.strftime(fmt)
-
-    def datefmt_long_pt(value):
-        """Formata datas como '11 de setembro de 2025'."""
-        if isinstance(value, datetime):
-            d = value.date()
-        elif isinstance(value, date):
-            d = value
-        else:
-            try:
-                d = datetime.fromisoformat(str(value)).date()
-            except Exception:
-                d = date.today()
-        meses = [
-            "janeiro","fevereiro","março","abril","maio","junho",
-            "julho","agosto","setembro","outubro","novembro","dezembro"
-        ]
-        return f"{d.day} de {meses[d.month-1]} de {d.year}"
-
-    env.filters["money"] = money
-    env.filters["datefmt"] = datefmt
-    env.filters["datefmt_long_pt"] = datefmt_long_pt
-    return env
-
 # === Somente os campos que você pediu ===
 _ALLOWED_VARS = {
     "cliente_nome",
@@ -1807,9 +1770,9 @@ def _sample_context_for_preview():
 def contract_preview():
     data = request.get_json(silent=True) or {}
     html_src = (data.get("html") or "").strip() or (g.tenant.contract_template_html or "") or _default_contract_template_admin()
-    # renderização sandbox
-    env = _tpl_env_admin()
-    tpl = env.from_string(html_src)
+    # renderização sandbox; rascunho do editor não entra no cache de templates compilados
+    saved = g.tenant.contract_template_html or _default_contract_template_admin()
+    tpl = contract_templates.get_template(g.tenant.id, html_src, store=html_src.strip() == saved.strip())
     rendered = tpl.render(**_sample_context_for_preview())
     # garante base de assets em /static
     static_base = url_for("static", filename="")
@@ -2144,7 +2107,7 @@ def operator_checklists_create():
         if checklist.customer_email:
             try:
                 _send_checklist_email(checklist, res, car_map_path)
-                flash('Checklist de entrega salvo e e-mail enviado ao cliente.', 'success')
+                flash('Checklist de entrega salvo e e-mail para o cliente na fila de envio.', 'success')
             except Exception as e:
                 current_app.logger.exception(e)
                 flash('Checklist salvo, mas houve erro ao enviar e-mail.', 'warning')
@@ -2259,7 +2222,14 @@ def render_checklist_pdf(checklist: OperatorChecklist, reservation: Reservation,
         car_map_path=car_map_path,
         absolute_url=absolute_url_for_static
     )
-    pdf_bytes = HTML(string=html, base_url=request.url_root).write_pdf()
+    # imagens em /static/... deste próprio app são lidas do disco (sem requisição HTTP para nós mesmos)
+    static_prefix = f"{request.url_root.rstrip('/')}{current_app.static_url_path}/"
+    pdf_bytes = pdf_renderer.render_pdf(
+        html,
+        base_url=request.url_root,
+        stylesheets=("checklist",),
+        static_map={static_prefix: current_app.static_folder},
+    )
 
     fname = f"checklist_{checklist.stage}_{uuid.uuid4().hex}.pdf"
     dest = _uploads_ck_dir('checklists', g.tenant.slug, 'pdfs') / fname  # <<< por tenant
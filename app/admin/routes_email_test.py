@@ -3,7 +3,6 @@ from __future__ import annotations
 
 import os
 from flask import Blueprint, jsonify, request
-from app.services.mailer import send_platform_mail_html
 from app.services import mailer as mailer_mod  # acessar flags/funcs internas
 
 try:
@@ -90,8 +89,11 @@ def test_email():
             )
             ok = True
         else:
+            # entrega direta (sem outbox): o diagnóstico precisa do resultado/erro real
             ok = bool(
-                send_platform_mail_html(
+                mailer_mod.deliver(
+                    channel="platform",
+                    tenant=None,
                     subject="Teste Plataforma — 4uFleet",
                     html="<p>Teste de envio 👌</p>",
                     to=to,
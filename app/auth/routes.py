@@ -15,6 +15,7 @@ from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 
 from app.extensions import db
 from app.models import Tenant, User
+from app.services import tenant_registry
 from app.services.mailer import send_platform_mail_html  # plataforma SEMPRE para confirmação
 from app.utils import absolute_url_for  # usa EXTERNAL_BASE_URL se houver
 from . import auth_bp
@@ -53,7 +54,7 @@ def load_tenant():
     slug = getattr(g, "tenant_slug", None)
     if not slug:
         abort(404)
-    g.tenant = Tenant.query.filter_by(slug=slug).first_or_404()
+    g.tenant = tenant_registry.get_tenant_or_404(slug)
 
 
 # -----------------------------------------------------------------------------#
@@ -0,0 +1,69 @@
+# app/cli_payments.py
+"""
+CLI standalone para reconciliar pagamentos com o provedor (GlobalPays).
+Consulta as reservas em aberto (pending/pending_payment/under_review) que têm
+gp_order_id e aplica o status devolvido pelo provedor.
+Uso:
+  python -m app.cli_payments reconcile [--tenant <slug>] [--older-than 15] [--limit N]
+                                       [--concurrency 4] [--rate 5] [--batch 50] [--dry-run]
+Exemplo (contra um gateway local):
+  GP_API_V1_BASE=http://127.0.0.1:8099/v1 python -m app.cli_payments reconcile --dry-run
+"""
+
+import sys
+import click
+from datetime import timedelta
+
+from app import create_app
+from app.models import Tenant
+from app.services import payment_reconcile
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command("reconcile")
+@click.option("--tenant", "tenant_slug", default=None, help="Slug do tenant (padrão: todos)")
+@click.option("--older-than", default=15, show_default=True, type=int,
+              help="Só reservas criadas há mais de N minutos (as mais novas ainda estão no checkout)")
+@click.option("--limit", default=None, type=int, help="Máximo de reservas consultadas")
+@click.option("--concurrency", default=4, show_default=True, type=int, help="Consultas simultâneas ao provedor")
+@click.option("--rate", default=5.0, show_default=True, type=float, help="Consultas (pedidos) por segundo; a primeira de cada tenant pode sondar várias rotas (0 = sem limite)")
+@click.option("--batch", default=50, show_default=True, type=int, help="Reservas por lote (um commit por lote)")
+@click.option("--dry-run", is_flag=True, help="Consulta e mostra o resumo sem gravar nada")
+def reconcile(tenant_slug, older_than, limit, concurrency, rate, batch, dry_run):
+    """Reconcilia o status de pagamento das reservas em aberto com o provedor."""
+    app = create_app()
+    with app.app_context():
+        tenant_id = None
+        if tenant_slug:
+            tenant = Tenant.query.filter_by(slug=tenant_slug).first()
+            if not tenant:
+                click.echo(f"[ERRO] Tenant com slug '{tenant_slug}' não encontrado.", err=True)
+                sys.exit(1)
+            tenant_id = tenant.id
+
+        summary = payment_reconcile.reconcile(
+            tenant_id=tenant_id,
+            older_than=timedelta(minutes=older_than),
+            limit=limit,
+            concurrency=concurrency,
+            rate=rate,
+            batch=batch,
+            dry_run=dry_run,
+        )
+
+        changed = ", ".join(f"{status}={n}" for status, n in sorted(summary.changed.items())) or "nenhuma"
+        click.echo(f"[OK] {summary.checked} reserva(s) consultada(s) em {summary.elapsed:.1f}s"
+                   + (" (dry-run, nada gravado)" if dry_run else ""))
+        click.echo(f"     Alteradas: {changed}")
+        click.echo(f"     Sem mudança: {summary.unchanged} | sem resposta do provedor: {summary.unanswered}"
+                   f" | falhas: {summary.failed}")
+        if summary.failed:
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    cli()
@@ -20,4 +20,60 @@ class Config:
     GP_PUB_KEY = os.getenv("GP_PUB_KEY")
     GP_CHECKOUT_ENDPOINT = os.getenv("GP_CHECKOUT_ENDPOINT")  # /checkoutapi/auth
     GP_API_BASE = os.getenv("GP_API_BASE")  # opcional; default no código
-    GP_PAYMENT_LINK_ENDPOINT = os.getenv("GP_PAYMENT_LINK_ENDPOINT")  # << IMPORTANTE
\ No newline at end of file
+    GP_PAYMENT_LINK_ENDPOINT = os.getenv("GP_PAYMENT_LINK_ENDPOINT")  # << IMPORTANTE
+
+    # Cache de buscas públicas (app/services/search_cache.py)
+    SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1") not in ("0", "false", "False")
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "60"))
+    SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL")  # opcional (tier compartilhado)
+
+    # Leads da busca pública: buffer write-behind (app/services/lead_buffer.py)
+    LEAD_BUFFER_INTERVAL = float(os.getenv("LEAD_BUFFER_INTERVAL", "2"))
+    LEAD_BUFFER_MAX = int(os.getenv("LEAD_BUFFER_MAX", "200"))
+
+    # Checkout: minutos que a pré-reserva segura o carro (app/services/booking.py)
+    BOOKING_HOLD_MINUTES = int(os.getenv("BOOKING_HOLD_MINUTES", "15"))
+
+    # Registry slug → tenant (app/services/tenant_registry.py)
+    TENANT_CACHE_TTL = int(os.getenv("TENANT_CACHE_TTL", "30"))
+
+    # Aeroportos atendidos em memória: intervalo mínimo entre stats do airports.json (app/services/served_airports.py)
+    SERVED_AIRPORTS_CHECK_INTERVAL = float(os.getenv("SERVED_AIRPORTS_CHECK_INTERVAL", "2"))
+
+    # Contratos: processos que geram o PDF em background; 0 = gera na própria requisição (app/services/render_queue.py)
+    CONTRACT_RENDER_WORKERS = int(os.getenv("CONTRACT_RENDER_WORKERS", "2"))
+    # falhas seguidas do mesmo contrato antes de mostrar erro em vez de gerar de novo, e por quantos segundos
+    CONTRACT_RENDER_MAX_ATTEMPTS = int(os.getenv("CONTRACT_RENDER_MAX_ATTEMPTS", "3"))
+    CONTRACT_RENDER_FAILURE_TTL = float(os.getenv("CONTRACT_RENDER_FAILURE_TTL", "600"))
+
+    # Jobs em background (assinatura de contrato, e-mail do assinado); 0 = roda na requisição (app/services/job_runner.py)
+    BACKGROUND_JOB_WORKERS = int(os.getenv("BACKGROUND_JOB_WORKERS", "2"))
+
+    # Outbox de e-mail (app/services/mail_outbox.py): threads de envio (0 = só enfileira), polling,
+    # tentativas, backoff inicial em segundos (dobra a cada falha) e limite por tenant/minuto (0 = sem limite)
+    MAIL_OUTBOX_WORKERS = int(os.getenv("MAIL_OUTBOX_WORKERS", "2"))
+    MAIL_OUTBOX_POLL_INTERVAL = float(os.getenv("MAIL_OUTBOX_POLL_INTERVAL", "5"))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+    MAIL_OUTBOX_BACKOFF = float(os.getenv("MAIL_OUTBOX_BACKOFF", "30"))
+    MAIL_RATE_PER_MINUTE = int(os.getenv("MAIL_RATE_PER_MINUTE", "60"))
+
+    # Pool SMTP por credencial (app/services/smtp_pool.py): conexões ociosas por conta, segundos
+    # até fechar uma ociosa e mensagens por sessão antes de reconectar
+    SMTP_POOL_MAX_IDLE = int(os.getenv("SMTP_POOL_MAX_IDLE", "2"))
+    SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+    SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "100"))
+
+    # GlobalPays (app/services/globalpays.py): validade do token por tenant em segundos, antecedência
+    # da renovação em segundo plano, timeout de cada tentativa de auth e das chamadas à API
+    GP_TOKEN_TTL = float(os.getenv("GP_TOKEN_TTL", "480"))
+    GP_TOKEN_REFRESH_MARGIN = float(os.getenv("GP_TOKEN_REFRESH_MARGIN", "60"))
+    GP_AUTH_TIMEOUT = float(os.getenv("GP_AUTH_TIMEOUT", "20"))
+    GP_API_TIMEOUT = float(os.getenv("GP_API_TIMEOUT", "30"))
+
+    # Webhook de pagamento (app/services/payment_events.py): 1 = thread aplica os eventos gravados,
+    # 0 = aplica na própria requisição; polling, tentativas e backoff inicial em segundos
+    PAYMENT_EVENTS_WORKER = int(os.getenv("PAYMENT_EVENTS_WORKER", "1"))
+    PAYMENT_EVENTS_POLL_INTERVAL = float(os.getenv("PAYMENT_EVENTS_POLL_INTERVAL", "5"))
+    PAYMENT_EVENTS_MAX_ATTEMPTS = int(os.getenv("PAYMENT_EVENTS_MAX_ATTEMPTS", "8"))
+    PAYMENT_EVENTS_BACKOFF = float(os.getenv("PAYMENT_EVENTS_BACKOFF", "10"))
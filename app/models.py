@@ -14,7 +14,8 @@ try:
 except Exception:  # fallback p/ SQLite, MySQL, etc.
     from sqlalchemy.types import JSON as JSONType  # type: ignore
     # app/models.py  (ou onde fica seu modelo Tenant)
-from sqlalchemy import Boolean, String, Text, event
+from sqlalchemy import DDL, Boolean, String, Text, event, func, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 
 from sqlalchemy.ext.mutable import MutableDict
 # =====================================================================
@@ -25,6 +26,10 @@ class TenantScoped:
     pass
 
 
+# nome da constraint/trigger que barra reservas confirmadas sobrepostas
+RESERVATION_OVERLAP_CONSTRAINT = "ex_reservations_vehicle_overlap"
+
+
 # =====================================================================
 # TENANT
 # =====================================================================
@@ -289,6 +294,8 @@ class Reservation(db.Model, TenantScoped):
     status = db.Column(db.String(32), default="pending", index=True)
     total_price = db.Column(db.Float, default=0.0)
     notes = db.Column(db.Text)
+    # pré-reserva do checkout: segura o carro até aqui (ver services/booking.py)
+    hold_expires_at = db.Column(db.DateTime, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
@@ -302,6 +309,19 @@ class Reservation(db.Model, TenantScoped):
     gp_amount_usd = db.Column(db.Numeric(12, 2))
     gp_raw = db.Column(JSONType)  # payload bruto (auditoria)
 
+    __table_args__ = (
+        # cobre availability.overlap_clause(): tenant/carro/status por igualdade + faixa de datas
+        db.Index("ix_reservations_overlap", "tenant_id", "vehicle_id", "status", "pickup_dt", "dropoff_dt"),
+        # Postgres: duas reservas confirmadas do mesmo carro não podem se sobrepor ([pickup, dropoff))
+        ExcludeConstraint(
+            (vehicle_id, "="),
+            (func.tsrange(pickup_dt, dropoff_dt, text("'[)'")), "&&"),
+            name=RESERVATION_OVERLAP_CONSTRAINT,
+            using="gist",
+            where=text("status = 'confirmed' AND vehicle_id IS NOT NULL"),
+        ).ddl_if(dialect="postgresql"),
+    )
+
     tenant = db.relationship("Tenant", back_populates="reservations", lazy=True)
     vehicle = db.relationship("Vehicle", back_populates="reservations", lazy=True)
     category = db.relationship("VehicleCategory", backref=db.backref("reservations", lazy=True))
@@ -319,6 +339,29 @@ class Reservation(db.Model, TenantScoped):
         return f"<Reservation #{self.id} status={self.status}>"
 
 
+# btree_gist é necessário para "vehicle_id WITH =" dentro do índice GiST
+event.listen(
+    Reservation.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+# SQLite (dev/testes): mesma regra via triggers; escritas são serializadas, então não há corrida
+for _op, _extra in (("INSERT", ""), ("UPDATE", " AND r.id <> NEW.id")):
+    event.listen(
+        Reservation.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TRIGGER IF NOT EXISTS trg_reservations_no_overlap_{_op.lower()} "
+            f"BEFORE {_op} ON reservations "
+            "WHEN NEW.status = 'confirmed' AND NEW.vehicle_id IS NOT NULL "
+            "BEGIN SELECT RAISE(ABORT, '" + RESERVATION_OVERLAP_CONSTRAINT + "') "
+            "WHERE EXISTS (SELECT 1 FROM reservations r WHERE r.vehicle_id = NEW.vehicle_id "
+            "AND r.status = 'confirmed' AND r.pickup_dt < NEW.dropoff_dt "
+            f"AND r.dropoff_dt > NEW.pickup_dt{_extra}); END"
+        ).execute_if(dialect="sqlite"),
+    )
+
+
 # =====================================================================
 # MAINTENANCE LOG
 # =====================================================================
@@ -532,3 +575,96 @@ class Prospect(db.Model):
 
     def __repr__(self):
         return f"<Prospect {self.email} status={self.status}>"
+
+
+# =====================================================================
+# EMAIL OUTBOX (fila persistente de e-mails; ver app/services/mail_outbox.py)
+# =====================================================================
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        db.Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenants.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    channel = db.Column(db.String(20), nullable=False, default="auto")  # tenant | platform | auto
+    kind = db.Column(db.String(40))                                     # contract_signed, checklist, crm, ...
+    to_addr = db.Column(db.String(320), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text)
+    text_alt = db.Column(db.Text)
+    attachments = db.Column(db.JSON)  # [{"filename", "mimetype", "path"}] – arquivos em disco
+    campaign_id = db.Column(db.Integer, db.ForeignKey("email_campaigns.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, sending, accepted, sent, skipped, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # accepted: próxima consulta de status
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    provider_op_id = db.Column(db.String(64))  # ACS operation id (envio aceito, status ainda em aberto)
+    accepted_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<EmailOutbox id={self.id} to={self.to_addr} status={self.status}>"
+
+
+# =====================================================================
+# EMAIL CAMPAIGN (e-mail mkt do superadmin; destinatários = linhas do outbox)
+# =====================================================================
+class EmailCampaign(db.Model):
+    __tablename__ = "email_campaigns"
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    prospect_ids = db.Column(db.JSON)  # None = todos os prospects
+
+    status = db.Column(db.String(20), nullable=False, default="preparing")  # preparing, sending, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    queued_at = db.Column(db.DateTime)  # em "preparing": último sinal de vida do job que enfileira
+
+    def __repr__(self):
+        return f"<EmailCampaign id={self.id} status={self.status} total={self.total}>"
+
+
+# =====================================================================
+# PAYMENT EVENT (webhook do provedor gravado e aplicado por um worker)
+# =====================================================================
+class PaymentEvent(db.Model):
+    __tablename__ = "payment_events"
+    __table_args__ = (
+        # a mesma notificação reenviada pelo provedor não gera outra linha
+        db.UniqueConstraint("provider", "tenant_id", "order_ref", "status", name="uq_payment_events_key"),
+        db.Index("ix_payment_events_due", "state", "next_attempt_at"),
+        db.Index("ix_payment_events_reservation", "tenant_id", "reservation_id", "state"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+
+    provider = db.Column(db.String(20), nullable=False, default="globalpays")
+    order_ref = db.Column(db.String(64), nullable=False)   # orderId do provedor (ou a referência da reserva)
+    status = db.Column(db.String(32), nullable=False)      # status de pagamento informado pelo provedor
+    reservation_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.JSON)                           # corpo bruto do webhook (auditoria)
+
+    state = db.Column(db.String(20), nullable=False, default="pending")  # pending, processing, done, ignored, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    result = db.Column(db.String(120))  # status da reserva depois de aplicar (ou motivo de ignorar)
+
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<PaymentEvent id={self.id} order={self.order_ref} status={self.status} state={self.state}>"
@@ -6,39 +6,31 @@ import re
 import json
 import time
 import base64
-import requests
-from io import BytesIO
 from hashlib import sha256
 from datetime import datetime
 from pathlib import Path
-from jinja2.sandbox import SandboxedEnvironment
 from flask import (
     render_template, render_template_string, request, url_for, jsonify, g, abort, current_app,
     redirect, flash, session, make_response, send_file
 )
-from sqlalchemy import and_
 from itsdangerous import URLSafeSerializer, BadSignature
-from app import utils
 
 from app.extensions import db
 from app.models import (
-    Tenant, VehicleCategory, Rate, Vehicle, Lead, Reservation, Contract
+    VehicleCategory, Rate, Vehicle, Reservation, Contract
+)
+from app.services import (
+    airport_catalog, availability, booking, contract_templates, globalpays, job_runner, lead_buffer,
+    mail_outbox, payment_events, render_cache, render_queue, search_cache, served_airports, signature_stamp,
+    tenant_registry,
 )
 from . import public_bp  # blueprint criado no __init__.py
 
-from weasyprint import HTML
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas as rl_canvas
-from PIL import Image
 from markupsafe import escape
 
-# ====== EMAIL: enviar cópia do contrato assinado ao cliente (thread) ======
-from threading import Thread
-import mimetypes
-
+# ====== EMAIL: cópia do contrato assinado ao cliente (outbox) ======
 from flask import current_app, url_for
 from sqlalchemy import select
-from app.services import mailer as mailer_service  # usa seu services/mailer.py
 
 # Se existir um helper de URL absoluta no seu utils, usamos; se não, caímos no url_for(_external=True)
 try:
@@ -47,137 +39,65 @@ except Exception:
     _abs_url = None
 
 
-def _email_contract_async(reserva_id: int):
+def _queue_contract_email(reserva_id: int, signed_path: Path, view_link: str) -> bool:
     """
-    Envia o contrato assinado para o e-mail do cliente.
-    - Tenta anexar o PDF; se não conseguir, envia só o link.
-    - Roda em thread para não atrasar a resposta do POST.
+    Coloca o contrato assinado no outbox de e-mail (app/services/mail_outbox.py),
+    na mesma transação do Contract – quem faz o commit é o job de assinatura.
+    - SMTP do tenant: vai com o PDF anexado; sem ele, a plataforma manda só o link.
+    - Roda fora da requisição: link absoluto e PDF já vêm prontos.
     """
-    with current_app.app_context():
-        # 1) Carrega reserva + tenant
-        from app.models import Reservation  # ajuste se o nome do modelo for diferente
-        reserva = db.session.execute(
-            select(Reservation).where(Reservation.id == reserva_id)
-        ).scalar_one_or_none()
-        if not reserva:
-            current_app.logger.warning("MAIL skip: reserva %s não encontrada", reserva_id)
-            return
-
-        tenant = getattr(reserva, "tenant", None)
-        if not tenant:
-            current_app.logger.warning("MAIL skip: tenant não encontrado para reserva %s", reserva_id)
-            return
-
-        # 2) E-mail do cliente
-        to_addr = (getattr(reserva, "email", None) or getattr(reserva, "customer_email", None) or "").strip()
-        if not to_addr:
-            current_app.logger.warning("MAIL skip: reserva %s sem e-mail do cliente", reserva_id)
-            return
-
-        # 3) Localiza o PDF assinado
-        #    Você já tem helpers para isso no mesmo arquivo:
-        try:
-            paths = _resolve_paths(reserva.id)
-            signed_path: Path | None = None
-            if paths.get("signed") and paths["signed"].exists():
-                signed_path = paths["signed"]
-            elif paths.get("legacy_signed") and paths["legacy_signed"].exists():
-                signed_path = paths["legacy_signed"]
-            else:
-                # fallback: caminho direto se precisar
-                signed_path = _signed_pdf_path(reserva.id)
-                if not signed_path.exists():
-                    signed_path = None
-        except Exception:
-            signed_path = None
-
-        # 4) Assunto / corpo
-        tenant_name = getattr(tenant, "name", "Locadora")
-        subject = f"Seu contrato de locação #{reserva.id} - {tenant_name}"
-
-        # Gera link absoluto para o contrato (caso não dê para anexar)
-        try:
-            if _abs_url:
-                view_link = _abs_url(
-                    "public.view_contract",
-                    tenant_slug=getattr(tenant, "slug", None),
-                    reserva_id=reserva.id
-                )
-            else:
-                view_link = url_for(
-                    "public.view_contract",
-                    tenant_slug=getattr(tenant, "slug", None),
-                    reserva_id=reserva.id,
-                    _external=True
-                )
-        except Exception:
-            # Se der qualquer erro, manda relativo mesmo (último recurso)
-            view_link = url_for(
-                "public.view_contract",
-                tenant_slug=getattr(tenant, "slug", None),
-                reserva_id=reserva.id
-            )
-
-        customer_name = (
-            getattr(reserva, "customer_name", None)
-            or getattr(reserva, "name", None)
-            or ""
-        )
-
-        text_body = (
-            f"Olá {customer_name},\n\n"
-            f"Segue a cópia do seu contrato de locação #{reserva.id}.\n"
-            f"Se preferir, você pode abrir pelo link: {view_link}\n\n"
-            f"Obrigado!\n{tenant_name}"
-        )
-        html_body = (
-            f"<p>Olá {customer_name},</p>"
-            f"<p>Segue a cópia do seu contrato de locação <strong>#{reserva.id}</strong>.</p>"
-            f"<p><a href='{view_link}' target='_blank' rel='noopener'>Abrir contrato</a></p>"
-            f"<p>Obrigado!<br>{tenant_name}</p>"
-        )
+    from app.models import Reservation  # ajuste se o nome do modelo for diferente
+    reserva = db.session.execute(
+        select(Reservation).where(Reservation.id == reserva_id)
+    ).scalar_one_or_none()
+    if not reserva:
+        current_app.logger.warning("MAIL skip: reserva %s não encontrada", reserva_id)
+        return False
+
+    tenant = getattr(reserva, "tenant", None)
+    if not tenant:
+        current_app.logger.warning("MAIL skip: tenant não encontrado para reserva %s", reserva_id)
+        return False
+
+    to_addr = (getattr(reserva, "email", None) or getattr(reserva, "customer_email", None) or "").strip()
+    if not to_addr:
+        current_app.logger.warning("MAIL skip: reserva %s sem e-mail do cliente", reserva_id)
+        return False
+
+    tenant_name = getattr(tenant, "name", "Locadora")
+    subject = f"Seu contrato de locação #{reserva.id} - {tenant_name}"
+    customer_name = (
+        getattr(reserva, "customer_name", None)
+        or getattr(reserva, "name", None)
+        or ""
+    )
+    text_body = (
+        f"Olá {customer_name},\n\n"
+        f"Segue a cópia do seu contrato de locação #{reserva.id}.\n"
+        f"Se preferir, você pode abrir pelo link: {view_link}\n\n"
+        f"Obrigado!\n{tenant_name}"
+    )
+    html_body = (
+        f"<p>Olá {customer_name},</p>"
+        f"<p>Segue a cópia do seu contrato de locação <strong>#{reserva.id}</strong>.</p>"
+        f"<p><a href='{view_link}' target='_blank' rel='noopener'>Abrir contrato</a></p>"
+        f"<p>Obrigado!<br>{tenant_name}</p>"
+    )
 
-        # 5) Envia com anexo (se possível) ou sem anexo (fallback)
-        sent = False
-
-        # Tenta função com anexo (se você a tiver implementado no services/mailer.py)
-        if signed_path and signed_path.exists():
-            try:
-                pdf_bytes = signed_path.read_bytes()
-                mtype = mimetypes.guess_type(str(signed_path))[0] or "application/pdf"
-                filename = f"Contrato_{reserva.id}.pdf"
-
-                if hasattr(mailer_service, "send_email_for_tenant_with_attachments"):
-                    sent = mailer_service.send_email_for_tenant_with_attachments(
-                        tenant=tenant,
-                        recipients=to_addr,
-                        subject=subject,
-                        html=html_body,
-                        text_alt=text_body,
-                        attachments=[(filename, pdf_bytes, mtype)],
-                    )
-            except Exception as e:
-                current_app.logger.error("MAIL attach error rid=%s: %s", reserva.id, e, exc_info=True)
-
-        # Fallback: sem anexo (usa o que você já tem no services/mailer.py)
-        if not sent:
-            try:
-                if hasattr(mailer_service, "send_email_for_tenant"):
-                    mailer_service.send_email_for_tenant(
-                        tenant=tenant,
-                        recipients=to_addr,
-                        subject=subject,
-                        html=html_body,
-                        text_alt=text_body,
-                    )
-                    sent = True
-            except Exception as e:
-                current_app.logger.error("MAIL basic send error rid=%s: %s", reserva.id, e, exc_info=True)
-
-        current_app.logger.info(
-            "MAIL dispatched rid=%s -> %s (attached=%s, ok=%s)",
-            reserva.id, to_addr, bool(signed_path), sent
-        )
+    mail_outbox.enqueue(
+        to=to_addr,
+        subject=subject,
+        html=html_body,
+        text_alt=text_body,
+        tenant_id=tenant.id,
+        channel="auto",
+        kind="contract_signed",
+        attachments=[{"filename": f"Contrato_{reserva.id}.pdf", "mimetype": "application/pdf",
+                      "path": str(signed_path)}],
+        commit=False,
+    )
+    current_app.logger.info("MAIL queued rid=%s -> %s", reserva.id, to_addr)
+    return True
 # ====== /EMAIL ===============================================================
 
 
@@ -203,7 +123,7 @@ def _load_tenant():
     slug = getattr(g, "tenant_slug", None)
     if not slug:
         abort(404)
-    g.tenant = Tenant.query.filter_by(slug=slug).first_or_404()
+    g.tenant = tenant_registry.get_tenant_or_404(slug)  # snapshot cacheado, sem query
 
 
 # =========================
@@ -248,34 +168,8 @@ def _cfg_float(key: str, default: float = 0.0) -> float:
 
 
 def _tenant_pay_creds() -> dict:
-    """
-    Tenta carregar as credenciais do tenant a partir do Key Vault usando
-    tenant.payment_secret_id (ex.: 'gpay-locadora1-dev').
-    Formato esperado do segredo (JSON):
-      { "public_key": "...", "merchant_code": "...", "token": "", "env": "dev", ... }
-    Se não existir, cai para variáveis de ambiente/config (_cfg).
-    """
-    alias = getattr(getattr(g, "tenant", None), "payment_secret_id", None)
-    if alias:
-        try:
-            raw = utils.kv_get_secret(alias)  # string JSON
-            data = json.loads(raw or "{}")
-            return {
-                "public_key": (data.get("public_key") or "").strip(),
-                "merchant_code": (data.get("merchant_code") or "").strip(),
-                "token": (data.get("token") or "").strip(),
-                "endpoint": (data.get("endpoint") or "").strip(),
-            }
-        except Exception:
-            current_app.logger.exception("Falha ao ler segredo do KV para %s", alias)
-
-    # fallback: variáveis
-    return {
-        "public_key": _cfg_str("GP_PUB_KEY"),
-        "merchant_code": _cfg_str("GP_MERCHANT_CODE"),
-        "token": _cfg_str("GP_TOKEN"),
-        "endpoint": _cfg_str("GP_PAYMENT_LINK_ENDPOINT"),
-    }
+    """Credenciais de pagamento do tenant atual (Key Vault com cache, senão config/env; ver globalpays.tenant_creds)."""
+    return globalpays.tenant_creds(getattr(g, "tenant", None))
 
 
 # =========================
@@ -285,6 +179,13 @@ def _digits(s: str) -> str:
     return "".join(ch for ch in (s or "") if ch.isdigit())
 
 
+def _float_or_none(v):
+    try:
+        return float(v) if v not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
 def _calc_days(pu, do):
     if not pu or not do:
         return 1
@@ -337,11 +238,7 @@ def _parse_query(args):
 
 def _overlap_clause(start_dt, end_dt):
     # conflito quando: inicio_existente < novo_fim  E  fim_existente > novo_inicio
-    return and_(
-        Reservation.pickup_dt < end_dt,
-        Reservation.dropoff_dt > start_dt,
-        Reservation.status.in_(("confirmed",))
-    )
+    return availability.overlap_clause(start_dt, end_dt)
 
 
 # =========================
@@ -363,14 +260,8 @@ def results():
     q = _parse_query(request.args)
 
     # ---- valida pickup/dropoff contra a lista de atendidos ----
-    served_lower = _served_set_lower()
-    def _ok(label: str) -> bool:
-        if not label:
-            return False
-        s_cmp = re.sub(r'[\u2010-\u2015\u2212]', '-', label).strip().lower()
-        return s_cmp in served_lower
-
-    if not _ok(q.get('pickup_airport')) or not _ok(q.get('dropoff_airport')):
+    served = _served_airports()
+    if not served.serves(q.get('pickup_airport')) or not served.serves(q.get('dropoff_airport')):
         # opcional: você pode dar flash + redirect para a / (search)
         # return redirect(url_for('public.search', tenant_slug=g.tenant.slug))
         return (
@@ -393,49 +284,18 @@ def results():
         pu = do = None
         days = 1
 
-    # CRM (Lead)
-    try:
-        contact_ok = bool(q.get("name") or q.get("email") or q.get("phone"))
-        if contact_ok and hasattr(g, "tenant") and g.tenant:
-            existing = None
-            if q.get("email"):
-                existing = Lead.query.filter(
-                    Lead.tenant_id == g.tenant.id,
-                    Lead.email == q["email"]
-                ).order_by(Lead.created_at.desc()).first()
-            if not existing and q.get("phone"):
-                existing = Lead.query.filter(
-                    Lead.tenant_id == g.tenant.id,
-                    Lead.phone == q["phone"]
-                ).order_by(Lead.created_at.desc()).first()
-
-            if not existing:
-                lead = Lead(
-                    tenant_id=g.tenant.id,
-                    name=q.get("name"),
-                    email=q.get("email"),
-                    phone=q.get("phone"),
-                    pickup_airport=q.get("pickup_airport"),
-                    dropoff_airport=q.get("dropoff_airport"),
-                    pickup_dt=pu,
-                    dropoff_dt=do,
-                    stage="new",
-                )
-                db.session.add(lead)
-                db.session.commit()
-            else:
-                existing.pickup_airport = q.get("pickup_airport") or existing.pickup_airport
-                existing.dropoff_airport = q.get("dropoff_airport") or existing.dropoff_airport
-                if pu:
-                    existing.pickup_dt = pu
-                existing.name = q.get("name") or existing.name
-                existing.email = q.get("email") or existing.email
-                existing.phone = q.get("phone") or existing.phone
-                if do:
-                    existing.dropoff_dt = do
-                db.session.commit()
-    except Exception:
-        current_app.logger.exception("CRM lead capture failed")
+    # CRM (Lead): write-behind, gravado em lote fora do request
+    if q.get("name") or q.get("email") or q.get("phone"):
+        lead_buffer.get_buffer().record(
+            g.tenant.id,
+            name=q.get("name"),
+            email=q.get("email"),
+            phone=q.get("phone"),
+            pickup_airport=q.get("pickup_airport"),
+            dropoff_airport=q.get("dropoff_airport"),
+            pickup_dt=pu,
+            dropoff_dt=do,
+        )
 
     # filtros auxiliares
     seats_min = None
@@ -453,78 +313,27 @@ def results():
         .order_by(VehicleCategory.name.asc())
         .all()
     )
-    rate_map = {r.category_id: r for r in Rate.query.filter_by(tenant_id=g.tenant.id).all()}
-
-    query = Vehicle.query.filter_by(tenant_id=g.tenant.id)
-    if q['cat_ids']:
-        query = query.filter(Vehicle.category_id.in_(q['cat_ids']))
-    vehicles = query.order_by(Vehicle.model.asc()).all()
-
-    results_list = []
-    for v in vehicles:
-        r = rate_map.get(v.category_id)
-        if not r:
-            continue
-
-        seats = v.category.seats if v.category and v.category.seats else 5
-        if seats_min is not None and seats < seats_min:
-            continue
-
-        item = {
-            'id': v.id,
-            'model': v.model,
-            'brand': v.brand,
-            'year': v.year,
-            'image_url': v.image_url,
-            'category_name': v.category.name if v.category else '',
-            'daily': float(r.daily_rate),
-            'currency': r.currency or 'USD',
-            'days': days,
-            'total': float(r.daily_rate) * days,
-            'discount': 10 if days >= 7 else None,
-            'seats': seats,
-            'transmission': (v.category.transmission if v.category else 'Automatic'),
-            'large_bags': v.category.large_bags if v.category else 1,
-            'small_bags': v.category.small_bags if v.category else 1,
-            'mileage_text': v.category.mileage_text if v.category else 'Unlimited mileage',
-        }
-        # filtros de preço
-        try:
-            if q['min_price'] and item['daily'] < float(q['min_price']):  # noqa: SIM108
-                continue
-        except ValueError:
-            pass
-        try:
-            if q['max_price'] and item['daily'] > float(q['max_price']):  # noqa: SIM108
-                continue
-        except ValueError:
-            pass
-
-        # Excluir veículos com sobreposição de reserva confirmada
-        if q.get('pickup_date') and q.get('dropoff_date'):
-            conflict = (Reservation.query
-                        .filter_by(tenant_id=g.tenant.id, vehicle_id=v.id)
-                        .filter(Reservation.pickup_dt < do,
-                                Reservation.dropoff_dt > pu,
-                                Reservation.status.in_(('confirmed',)))
-                        .first())
-            if conflict:
-                continue
-
-        results_list.append(item)
-
-    if q['sort'] == 'price_asc':
-        results_list.sort(key=lambda x: x['daily'])
-    elif q['sort'] == 'price_desc':
-        results_list.sort(key=lambda x: -x['daily'])
-
-    # paginação em memória
-    total = len(results_list)
-    pages = max((total + q['per_page'] - 1) // q['per_page'], 1)
-    page = min(q['page'], pages) if pages else 1
-    start = (page - 1) * q['per_page']
-    end = start + q['per_page']
-    results_paged = results_list[start:end]
+
+    # filtros, ordenação e paginação no banco (COUNT separado + LIMIT/OFFSET),
+    # atrás do cache por tenant (invalidado ao gravar reservas/frota/tarifas)
+    has_dates = bool(q.get('pickup_date') and q.get('dropoff_date'))
+    found = search_cache.cached_search(
+        g.tenant.id,
+        start_dt=pu if has_dates else None,
+        end_dt=do if has_dates else None,
+        category_ids=q['cat_ids'],
+        seats_min=seats_min,
+        min_price=_float_or_none(q['min_price']),
+        max_price=_float_or_none(q['max_price']),
+        sort=q['sort'],
+        page=q['page'],
+        per_page=q['per_page'],
+        days=days,
+    )
+
+    # cards já vêm projetados (VehicleCard): sem lazy-load de categoria por carro
+    results_paged = found.items
+    total, pages, page = found.total, found.pages, found.page
 
     pagination = {
         'page': page, 'per_page': q['per_page'], 'total': total, 'pages': pages,
@@ -533,7 +342,7 @@ def results():
         'next_page': page + 1 if page < pages else pages,
     }
 
-    currency = results_paged[0]['currency'] if results_paged else 'USD'
+    currency = results_paged[0].currency if results_paged else 'USD'
     return render_template(
         'public/results.html',
         q=q,
@@ -566,13 +375,7 @@ def reserve_modal():
         days = 1
 
     # server-side: bloquear sobreposição com reservas confirmadas
-    conflict = (Reservation.query
-                .filter_by(tenant_id=g.tenant.id, vehicle_id=vehicle.id)
-                .filter(Reservation.pickup_dt < do,
-                        Reservation.dropoff_dt > pu,
-                        Reservation.status.in_(("confirmed",)))
-                .first())
-    if conflict:
+    if not availability.is_vehicle_available(g.tenant.id, vehicle.id, pu, do):
         abort(409, "Veiculo indisponivel no periodo selecionado.")
     rate = Rate.query.filter_by(tenant_id=g.tenant.id, category_id=vehicle.category_id).first()
     if not rate:
@@ -613,24 +416,24 @@ def reserve():
     days = max(1, (do_dt - pu_dt).days)
     total = float(rate.daily_rate) * days
 
-    # cria pré-reserva (pending)
-    res = Reservation(
-        tenant_id=g.tenant.id,
-        vehicle_id=vehicle.id,
-        category_id=vehicle.category_id,
+    # pré-reserva (pending) com hold: trava o carro sob lock até o pagamento
+    res = booking.place_hold(
+        g.tenant.id,
+        vehicle.id,
+        pu_dt,
+        do_dt,
         customer_name=q.get('name') or '',
         phone=q.get('phone') or '',
         email=q.get('email') or '',
         pickup_airport=q.get('pickup_airport') or '',
         dropoff_airport=q.get('dropoff_airport') or '',
-        pickup_dt=pu_dt,
-        dropoff_dt=do_dt,
-        status='pending',
         total_price=total,
-        notes=None
+        notes=None,
     )
-    db.session.add(res)
-    db.session.commit()
+    if res is None:
+        return jsonify({'error': 'Veiculo indisponivel no periodo selecionado.'}), 409
+
+    _pregenerate_contract(res)  # contrato já fica pronto até o cliente chegar na assinatura
 
     return jsonify({'redirect': url_for('public.checkout', tenant_slug=g.tenant.slug, reservation_id=res.id)})
 
@@ -638,67 +441,17 @@ def reserve():
 # =========================
 # PAYMENT LINK / AUTH
 # =========================
-def _gp_pl_token(force: bool = False) -> str | None:
-    """Autentica e guarda token na sessão (TTL ~8min)."""
-    TTL = 8 * 60
-    now = int(time.time())
-    if not force:
-        tok = session.get("gp_pl_token")
-        ts = session.get("gp_pl_ts", 0)
-        if tok and (now - ts) < TTL:
-            return tok
+def _gp_base() -> str:
+    return globalpays.api_base()
 
-    creds = _tenant_pay_creds()
-    pub = creds.get("public_key") or ""
-    mch = creds.get("merchant_code") or ""
-    base = _cfg_str("GP_API_V1_BASE", "https://apihml.tryglobalpays.com/v1").rstrip("/")
-
-    # se não tiver pub no KV, tenta token direto do KV/env
-    env_tok = creds.get("token") or ""
-    if not pub and env_tok:
-        session["gp_pl_token"] = env_tok
-        session["gp_pl_ts"] = now
-        return env_tok
-
-    if not pub:
-        return None
 
-    auth_urls = [f"{base}/paymentapi/auth", f"{base}/checkoutapi/auth"]
-    for auth_url in auth_urls:
-        for payload in ({"pubKey": pub, "merchantCode": mch}, {"pubKey": pub}):
-            try:
-                resp = requests.post(auth_url, data=payload, timeout=20)
-                data = resp.json() if "application/json" in resp.headers.get("content-type", "") else {}
-                token = (
-                    (data or {}).get("token")
-                    or ((data or {}).get("data") or {}).get("token")
-                    or ((data or {}).get("data") if isinstance((data or {}).get("data"), str) else None)
-                )
-                if token and resp.status_code < 400:
-                    session["gp_pl_token"] = token
-                    session["gp_pl_ts"] = now
-                    current_app.logger.info("PaymentLink auth OK em %s", auth_url)
-                    return token
-            except Exception:
-                current_app.logger.exception("Falha ao autenticar em %s", auth_url)
-                continue
-
-    if env_tok:
-        session["gp_pl_token"] = env_tok
-        session["gp_pl_ts"] = now
-        current_app.logger.warning("Usando GP_TOKEN do KV/env como fallback (Payment Link).")
-        return env_tok
-    return None
-
-
-def _header_variants(tok: str):
-    base = {"Accept": "application/json", "Content-Type": "application/json"}
-    return [
-        dict(base, **{"token": tok}),
-        dict(base, **{"Authorization": f"Bearer {tok}"}),
-        dict(base, **{"authorization": f"Bearer {tok}"}),
-        dict(base, **{"Token": tok}),
-    ]
+def _gp_pl_token(force: bool = False, stale: str | None = None) -> str | None:
+    """
+    Token do provedor (Payment Link) por tenant, compartilhado pelo processo
+    (app/services/globalpays.py). stale = token que acabou de tomar 401.
+    """
+    tenant_id = getattr(getattr(g, "tenant", None), "id", None)
+    return globalpays.tokens.get(tenant_id, _tenant_pay_creds(), _gp_base(), force=force, stale=stale)
 
 
 def _service_charge(total: float) -> float:
@@ -766,6 +519,9 @@ def checkout(reservation_id):
     # pronto para pagar se tiver pubKey ou token vindos do KV/env
     creds = _tenant_pay_creds()
     pl_ready = bool((creds.get("public_key") or "").strip() or (creds.get("token") or "").strip())
+    if pl_ready:
+        # autentica no provedor enquanto o cliente lê a página (não no clique em pagar)
+        globalpays.tokens.warm(g.tenant.id, creds, _gp_base())
 
     return render_template(
         'public/checkout.html',
@@ -924,8 +680,6 @@ def checkout_pay_link(reservation_id):
         flash(msg, "danger")
         return redirect(url_for('public.checkout', tenant_slug=g.tenant.slug, reservation_id=reservation_id))
 
-    header_variants = _header_variants(tok)
-
     def build_payload(include_split: bool) -> dict:
         invoice_unique = f"RES-{r.id}-{mode.upper()}-{int(time.time())}"
         payload = {
@@ -952,80 +706,52 @@ def checkout_pay_link(reservation_id):
 
         return payload
 
+    def link_of(data: dict) -> str | None:
+        return (
+            (data.get("data") or {}).get("url")
+            or data.get("url")
+            or data.get("paymentUrl")
+            or data.get("redirectUrl")
+        )
+
     try:
-        last_status = last_text = last_url = None
         # STRICT_COMMISSION_SPLIT: se True, só tenta com split; se False, tenta com e depois sem (fallback).
         strict_raw = _cfg("STRICT_COMMISSION_SPLIT", False)
         strict_split = (str(strict_raw).strip().lower() in ("1", "true", "yes", "on"))
+        if commission_amount > 0:
+            include_opts = [True] if strict_split else [True, False]
+        else:
+            include_opts = [False]
 
-        for url in endpoints:
-            if commission_amount > 0:
-                include_opts = [True] if strict_split else [True, False]
-            else:
-                include_opts = [False]
-
-            for include_split in include_opts:
-                payload = build_payload(include_split)
-                for hdr in header_variants:
-                    resp = requests.post(url, json=payload, headers=hdr, timeout=30)
-                    last_status, last_url = resp.status_code, url
-                    ct = resp.headers.get("content-type", "")
-                    try:
-                        data = resp.json() if "application/json" in ct else {}
-                    except Exception:
-                        data = {}
-                        last_text = resp.text
-
-                    if resp.status_code == 401:
-                        # reauth e tenta novamente uma vez
-                        tok2 = _gp_pl_token(force=True)
-                        if tok2:
-                            if "token" in hdr:
-                                hdr["token"] = tok2
-                            if "Token" in hdr:
-                                hdr["Token"] = tok2
-                            if "Authorization" in hdr:
-                                hdr["Authorization"] = f"Bearer {tok2}"
-                            if "authorization" in hdr:
-                                hdr["authorization"] = f"Bearer {tok2}"
-                            resp = requests.post(url, json=payload, headers=hdr, timeout=30)
-                            ct = resp.headers.get("content-type", "")
-                            try:
-                                data = resp.json() if "application/json" in ct else {}
-                            except Exception:
-                                last_text = resp.text
-                            last_status = resp.status_code
-
-                    if isinstance(data, dict) and (data.get("msg", "").lower().strip() == "rota não encontrada"):
-                        # tenta próximo endpoint
-                        break
-
-                    link = None
-                    if isinstance(data, dict):
-                        link = (
-                            (data.get("data") or {}).get("url")
-                            or data.get("url")
-                            or data.get("paymentUrl")
-                            or data.get("redirectUrl")
-                        )
-                        kyc_url = (
-                            (data.get("data") or {}).get("clientAreaUrl")
-                            or data.get("clientAreaUrl")
-                            or data.get("client_area_url")
-                            or (data.get("data") or {}).get("kycUrl")
-                        )
-                        if kyc_url:
-                            session["kyc_url"] = kyc_url
-
-                    if resp.status_code < 400 and link:
-                        r.status = "pending_payment"
-                        db.session.commit()
-                        if want_json:
-                            return jsonify(ok=True, link=link)
-                        return redirect(link)
+        # endpoint/header que já funcionaram para este tenant vão primeiro (app/services/globalpays.py)
+        reply, last = globalpays.client.call(
+            "order", g.tenant.id, creds, _gp_base(), "POST", endpoints,
+            payloads=[(lambda inc=inc: build_payload(inc)) for inc in include_opts],
+            accept=lambda rep: rep.status < 400 and bool(link_of(rep.data)),
+        )
+
+        data = (reply or last).data if (reply or last) else {}
+        kyc_url = (
+            (data.get("data") or {}).get("clientAreaUrl")
+            or data.get("clientAreaUrl")
+            or data.get("client_area_url")
+            or (data.get("data") or {}).get("kycUrl")
+        )
+        if kyc_url:
+            session["kyc_url"] = kyc_url
+
+        if reply is not None:
+            r.status = "pending_payment"
+            r.gp_order_id = globalpays.order_id_of(reply.data) or r.gp_order_id  # reconciliação consulta por ele
+            db.session.commit()
+            link = link_of(reply.data)
+            if want_json:
+                return jsonify(ok=True, link=link)
+            return redirect(link)
 
         current_app.logger.error(
-            "payment/link error %s url=%s resp_text=%s", last_status, last_url, last_text
+            "payment/link error %s url=%s resp_text=%s",
+            getattr(last, "status", None), getattr(last, "url", None), getattr(last, "text", None),
         )
         msg = "Não foi possível gerar o link de pagamento. Verifique credenciais/endpoint."
         if want_json:
@@ -1049,46 +775,8 @@ def _gp_consult_order(order_id: str | int) -> dict:
     tok = _gp_pl_token(False) or _gp_pl_token(True)
     if not tok:
         return {}
-
-    base = _cfg_str("GP_API_V1_BASE", "https://apihml.tryglobalpays.com/v1").rstrip("/")
-    urls = [
-        f"{base}/paymentapi/order/{order_id}",
-        f"{base}/paymentapi/order?id={order_id}",
-        f"{base}/paymentapi/transaction/{order_id}",
-        f"{base}/paymentapi/transaction?id={order_id}",
-    ]
-    for url in urls:
-        for hdr in _header_variants(tok):
-            try:
-                resp = requests.get(url, headers=hdr, timeout=20)
-                if resp.status_code >= 400:
-                    continue
-                data = resp.json() if "application/json" in resp.headers.get("content-type", "") else {}
-            except Exception:
-                continue
-
-            bloc = data.get("data") if isinstance(data.get("data"), dict) else None
-            if (data.get("msg") or "").lower().strip() == "rota não encontrada":
-                continue
-
-            status = (data.get("status") or (bloc or {}).get("status") or "").lower()
-            order = str(data.get("orderId") or (bloc or {}).get("orderId") or order_id)
-            extref = (data.get("externalReference") or data.get("reference")
-                      or (bloc or {}).get("externalReference") or (bloc or {}).get("reference"))
-            invoice = (data.get("invoice") or (bloc or {}).get("invoice") or "")
-            kyc_url = (data.get("clientAreaUrl") or (bloc or {}).get("clientAreaUrl")
-                       or data.get("url_checkout") or (bloc or {}).get("url_checkout"))
-            installment = (data.get("installment") or (bloc or {}).get("installment"))
-
-            return {
-                "status": status,
-                "order_id": order,
-                "external_reference": extref,
-                "invoice": invoice,
-                "client_area_url": kyc_url,
-                "installment": installment,
-            }
-    return {}
+    tenant_id = getattr(getattr(g, "tenant", None), "id", None)
+    return globalpays.consult_order(tenant_id, _tenant_pay_creds(), _gp_base(), order_id)
 
 
 # Alias de retorno: /checkout/retorno -> reaproveita a lógica de /payments/return
@@ -1146,16 +834,7 @@ def payment_return():
     if reservation_id:
         r = Reservation.query.filter_by(tenant_id=g.tenant.id, id=reservation_id).first()
         if r:
-            st = (status or "").lower().strip()
-            if st in {"approved", "paid", "success", "confirmed", "delivered"}:
-                r.status = "confirmed"
-                v = Vehicle.query.filter_by(tenant_id=g.tenant.id, id=r.vehicle_id).first()
-                if v:
-                    v.status = "booked"
-            elif st in {"canceled", "refused", "failed", "error", "aborted"}:
-                r.status = "canceled"
-            elif st in {"analysis", "under_review", "review", "pending"}:
-                r.status = "under_review"
+            payment_events.apply(r, status, order_id=info.get("order_id") or order_id)  # mesmas transições do webhook
             db.session.commit()
 
     if status in {"analysis", "under_review", "review", "pending"} and session.get("kyc_url"):
@@ -1167,35 +846,14 @@ def payment_return():
 @public_bp.post('/payments/webhook')
 def payment_webhook():
     data = request.get_json(silent=True) or {}
-    status = (data.get('status') or "").lower()
-
-    ref = str(data.get('externalReference') or data.get('reference') or data.get('orderId') or "")
-    if not ref.isdigit():
-        inv = data.get("invoice") or ""
-        m = re.search(r'RES-(\d+)', inv)
-        if m:
-            ref = m.group(1)
 
     kyc_url = (data.get('clientAreaUrl') or data.get('client_area_url')
                or data.get('url_checkout') or data.get('kycUrl'))
     if kyc_url:
         session["kyc_url"] = kyc_url
 
-    if ref.isdigit():
-        r = Reservation.query.filter_by(tenant_id=g.tenant.id, id=int(ref)).first()
-        if r:
-            st = (status or "").lower().strip()
-            if st in {"approved", "paid", "success", "confirmed", "delivered"}:
-                r.status = "confirmed"
-                v = Vehicle.query.filter_by(tenant_id=g.tenant.id, id=r.vehicle_id).first()
-                if v:
-                    v.status = "booked"
-            elif st in {"canceled", "refused", "failed", "error", "aborted"}:
-                r.status = "canceled"
-            elif st in {"analysis", "under_review", "review", "pending"}:
-                r.status = "under_review"
-            db.session.commit()
-
+    # só grava o evento (reenvio do provedor = no-op) e responde; o worker aplica na reserva
+    payment_events.ingest(g.tenant.id, data)
     return ("", 200)
 
 
@@ -1225,91 +883,17 @@ def thanks():
         """
         return html
 
-def _tenant_settings_dir() -> Path:
-    """Pasta de settings do tenant (privada, em instance/)."""
-    p = Path(current_app.instance_path) / "uploads" / "tenant_settings" / _tenant_slug()
-    p.mkdir(parents=True, exist_ok=True)
-    return p
-
-def _tenant_airports_served_path() -> Path:
-    return _tenant_settings_dir() / "airports.json"
+def _served_airports() -> served_airports.ServedAirports:
+    """Aeroportos atendidos do tenant (cache em memória, recarrega pelo mtime do airports.json)."""
+    return served_airports.get(current_app.instance_path, _tenant_slug())
 
 def _tenant_airports_served_list() -> list[str]:
-    """
-    Lê a lista salva no Settings do tenant e devolve rótulos prontos
-    no formato: "Nome (IATA) - Cidade".
-    Aceita dois formatos de arquivo:
-      A) {"items": [ ... ]}
-      B) [ ... ]
-    Onde cada item pode ser:
-      - string já no formato final
-      - dict com "label"
-      - dict com "name"/"code"(/"iata") e opcional "city"
-    """
-    def _mk_label_from_dict(d: dict) -> str | None:
-        # 1) se já vier "label"
-        lbl = (d.get("label") or "").strip()
-        if lbl:
-            return lbl
-        # 2) se vier name/code(/iata)/city
-        name = (d.get("name") or "").strip()
-        code = (d.get("code") or d.get("iata") or "").strip().upper()
-        city = (d.get("city") or "").strip()
-        if name and code:
-            return f"{name} ({code})" + (f" - {city}" if city else "")
-        return None
+    """Rótulos prontos no formato "Nome (IATA) - Cidade" (ver app/services/served_airports.py)."""
+    return list(_served_airports().labels)
 
-    try:
-        p = _tenant_airports_served_path()
-        if not p.exists():
-            return []
-
-        raw = p.read_text(encoding="utf-8") or ""
-        data = json.loads(raw)
-
-        # normaliza para uma lista de itens
-        if isinstance(data, dict):
-            items = data.get("items") if isinstance(data.get("items"), list) else []
-        elif isinstance(data, list):
-            items = data
-        else:
-            items = []
-
-        out: list[str] = []
-        for it in items:
-            if isinstance(it, str):
-                s = it.strip()
-                if s:
-                    out.append(s)
-            elif isinstance(it, dict):
-                lbl = _mk_label_from_dict(it) or ""
-                if lbl:
-                    out.append(lbl)
-
-        # remove duplicados preservando ordem
-        seen = set()
-        normed = []
-        for s in out:
-            # normaliza hifens exóticos só para comparação
-            s_cmp = re.sub(r'[\u2010-\u2015\u2212]', '-', s)
-            if s_cmp not in seen:
-                seen.add(s_cmp)
-                normed.append(s)
-
-        return normed
-    except Exception:
-        current_app.logger.exception("Falha ao ler airports.json do tenant")
-        return []
-
-def _served_set_lower() -> set[str]:
+def _served_set_lower() -> frozenset[str]:
     """Conjunto (lowercase, hífen normalizado) de labels atendidos do tenant."""
-    served = _tenant_airports_served_list()
-    out = set()
-    for s in served:
-        s_cmp = re.sub(r'[\u2010-\u2015\u2212]', '-', s or '').strip().lower()
-        if s_cmp:
-            out.add(s_cmp)
-    return out
+    return _served_airports().keys
 
 
 def _parse_air_label(label: str) -> tuple[str, str, str]:
@@ -1354,36 +938,6 @@ def airports_json():
     q = (request.args.get("q") or "").strip().lower()
     scope = (request.args.get("scope") or "all").strip().lower()
 
-    def _load_base_items():
-        # carrega base local (preferida)
-        try:
-            root_dir = os.path.abspath(os.path.join(current_app.root_path, os.pardir))
-            candidates = [
-                os.path.join(root_dir, "static", "data", "airports_us.json"),
-                os.path.join(current_app.root_path, "static", "data", "airports_us.json"),
-                os.path.join(root_dir, "static", "data", "airports_us_iata.json"),
-            ]
-            path = next((p for p in candidates if os.path.isfile(p)), None)
-            if not path:
-                return []
-
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            out = []
-            for a in data:
-                code = (a.get("code") or a.get("iata") or "").strip().upper()
-                name = (a.get("name") or "").strip()
-                city = (a.get("city") or "").strip()
-                if not (code and name):
-                    continue
-                city_txt = f" - {city}" if city else ""
-                out.append(f"{name} ({code}){city_txt}")
-            return out
-        except Exception:
-            current_app.logger.exception("airports_json: falha ao carregar base local")
-            return []
-
     def _tenant_served_items():
         # tenta ler do campo JSON do tenant
         try:
@@ -1400,13 +954,12 @@ def airports_json():
             current_app.logger.exception("airports_json: falha ao ler lista do tenant")
             return []
 
-    # fonte de dados
-    if scope == "served":
-        base_items = _tenant_served_items()
-    else:
-        base_items = _load_base_items()
+    # base completa: catálogo indexado (carregado uma vez por processo)
+    if scope != "served":
+        items = airport_catalog.get_catalog().labels(q, limit=50) if len(q) >= 2 else []
+        return jsonify({"items": items})
 
-    # sem fonte -> vazio
+    base_items = _tenant_served_items()
     if not base_items:
         return jsonify({"items": []})
 
@@ -1415,8 +968,8 @@ def airports_json():
         ql = q.lower()
         items = [s for s in base_items if ql in s.lower()]
     else:
-        # sem q: se scope=served devolve todos os servidos; se all, devolve vazio para não listar tudo
-        items = base_items if scope == "served" else []
+        # sem q: devolve todos os servidos
+        items = base_items
 
     # normaliza hífens estranhos
     items = [re.sub(r'[\u2010-\u2015\u2212]', '-', s) for s in items][:50]
@@ -1565,32 +1118,6 @@ def _static_base_dir() -> str:
     return str(Path(current_app.root_path) / "static")
 
 
-def _tpl_env() -> SandboxedEnvironment:
-    env = SandboxedEnvironment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
-
-    # filtros
-    def money(value, currency="USD"):
-        try:
-            v = float(value)
-            return f"{currency} {v:,.2f}"
-        except Exception:
-            return f"{currency} {value}"
-
-    def datefmt(dt, fmt="%d/%m/%Y"):
-        if not dt:
-            return "-"
-        if isinstance(dt, str):
-            try:
-                dt = datetime.fromisoformat(dt)
-            except Exception:
-                return dt
-        return dt.strftime(fmt)
-
-    env.filters["money"] = money
-    env.filters["datefmt"] = datefmt
-    return env
-
-
 def _default_contract_template() -> str:
     # Template de exemplo com CSS embutido e placeholders.
     # Pode editar no admin depois (aba Contrato).
@@ -1707,51 +1234,118 @@ def _render_contract_html(reserva) -> str:
     if not html_src:
         html_src = _default_contract_template()
 
-    # sandbox + filtros
-    env = _tpl_env()
-    template = env.from_string(html_src)
-    return template.render(**ctx)
-
-
-def _ensure_base_pdf(reserva) -> Path:
-    """
-    Garante que o PDF base existe (gera se não existir) e atualiza/insere o Contract.
-    Agora passamos base_url=/static para imagens funcionarem no WeasyPrint.
-    """
-    paths = _resolve_paths(reserva.id)
-
-    # Reutiliza base existente
-    for p in (paths["base"], paths["legacy_base"]):
-        if p.exists():
-            contrato = Contract.query.filter_by(reservation_id=reserva.id).first()
-            if not contrato:
-                contrato = Contract(reservation_id=reserva.id)
-                db.session.add(contrato)
-            contrato.file_path = str(p)
-            contrato.signature_type = contrato.signature_type or "generated"
-            try:
-                contrato.signature_hash = sha256(p.read_bytes()).hexdigest()
-            except Exception:
-                pass
-            db.session.commit()
-            return p
+    # sandbox + filtros; template compilado fica em cache (tenant + hash do HTML)
+    return contract_templates.render(getattr(t, "id", None), html_src, **ctx)
 
-    # Gera novo PDF (com base_url correto)
-    html = _render_contract_html(reserva)
-    out = paths["base"]
-    out.parent.mkdir(parents=True, exist_ok=True)
-    pdf_bytes = HTML(string=html, base_url=_static_base_dir()).write_pdf()
-    out.write_bytes(pdf_bytes)
 
+def _register_base_pdf(reserva, p: Path, digest: str | None = None) -> None:
+    """Atualiza/insere o Contract apontando para o PDF base (só grava se algo mudou)."""
+    if digest is None:
+        try:
+            digest = sha256(p.read_bytes()).hexdigest()
+        except Exception:
+            digest = None
     contrato = Contract.query.filter_by(reservation_id=reserva.id).first()
+    if contrato and contrato.file_path == str(p) and contrato.signature_type and \
+            (digest is None or contrato.signature_hash == digest):
+        return
     if not contrato:
         contrato = Contract(reservation_id=reserva.id)
         db.session.add(contrato)
-    contrato.file_path = str(out)
-    contrato.signature_type = "generated"
-    contrato.signature_hash = sha256(pdf_bytes).hexdigest()
+    contrato.file_path = str(p)
+    contrato.signature_type = contrato.signature_type or "generated"
+    if digest is not None:
+        contrato.signature_hash = digest
     db.session.commit()
-    return out
+
+
+def _base_pdf_render(reserva, base: Path):
+    """
+    (html, fingerprint, digest) do PDF base: digest só vem quando o arquivo em disco
+    foi gerado exatamente desses dados (ver app/services/render_cache.py).
+    """
+    html = _render_contract_html(reserva)
+    fp = render_cache.fingerprint(html, _static_base_dir())
+    digest = render_cache.current_digest(base, fp)
+    if digest is None and base.exists() and render_queue.get_queue().pending(base) is None:
+        digest = render_cache.adopt(base, fp)  # PDF anterior ao fingerprint: mantém, como antes
+    return html, fp, digest
+
+
+def _submit_base_pdf(base: Path, html: str, fp: str):
+    queue = render_queue.get_queue()
+    job = queue.pending(base)
+    if job is not None and job.fingerprint == fp:
+        return job
+    return queue.submit(base, html, _static_base_dir(), fingerprint=fp)
+
+
+def _pregenerate_contract(reserva) -> None:
+    """
+    Gera o PDF base em background antes do cliente abrir a assinatura (ou de novo, se os
+    dados mudaram). Contrato assinado nunca é tocado; erros não derrubam a requisição.
+    """
+    try:
+        paths = _resolve_paths(reserva.id)
+        if paths["signed"].exists() or paths["legacy_signed"].exists():
+            return
+        html, fp, digest = _base_pdf_render(reserva, paths["base"])
+        if digest is None:
+            _submit_base_pdf(paths["base"], html, fp)
+    except Exception:
+        current_app.logger.exception("Falha ao enfileirar contrato da reserva %s", reserva.id)
+
+
+def _ensure_base_pdf(reserva, *, wait: float = 0) -> Path | None:
+    """
+    Devolve o PDF base em dia com os dados da reserva (e atualiza o Contract se mudou).
+    Faltando ou desatualizado, enfileira a geração e espera até `wait` segundos;
+    None = ainda preparando. Com CONTRACT_RENDER_WORKERS=0 gera na hora (como antes).
+    Levanta render_queue.RenderFailed quando a geração falhou e não vai ser tentada de novo
+    agora (modo inline, ou CONTRACT_RENDER_MAX_ATTEMPTS falhas seguidas dos mesmos dados).
+    """
+    paths = _resolve_paths(reserva.id)
+    base = paths["base"]
+
+    # legado (antes dos caminhos por tenant): reutiliza como sempre
+    if not base.exists() and paths["legacy_base"].exists():
+        _register_base_pdf(reserva, paths["legacy_base"])
+        return paths["legacy_base"]
+
+    html, fp, digest = _base_pdf_render(reserva, base)
+    if digest is None:
+        queue = render_queue.get_queue()
+        job = _submit_base_pdf(base, html, fp)
+        job.done.wait(wait)
+        digest = render_cache.current_digest(base, fp)
+        if digest is None:
+            failed = job.done.is_set() and not job.ok
+            if failed and (not queue.background or queue.gave_up(base, fp)):
+                raise render_queue.RenderFailed(repr(job.future.exception()))
+            return None
+    _register_base_pdf(reserva, base, digest)
+    return base
+
+
+def _contract_preparing():
+    """Resposta curta enquanto o PDF é gerado em background (a página se recarrega sozinha)."""
+    html = """<!doctype html><html><head><meta charset="utf-8">
+<meta http-equiv="refresh" content="2"><title>Preparando contrato…</title></head>
+<body style="font-family:system-ui,Arial,sans-serif;color:#444;text-align:center;padding:48px 16px">
+<p>Preparando o contrato… esta página será atualizada automaticamente.</p>
+</body></html>"""
+    resp = make_response(html, 202)
+    resp.headers["Retry-After"] = "2"
+    return _no_cache(resp)
+
+
+def _contract_failed():
+    """Geração do PDF falhou (e não será tentada de novo agora): erro em vez de "preparando" em loop."""
+    html = """<!doctype html><html><head><meta charset="utf-8"><title>Contrato indisponível</title></head>
+<body style="font-family:system-ui,Arial,sans-serif;color:#444;text-align:center;padding:48px 16px">
+<p>Não foi possível gerar o contrato agora. Tente novamente mais tarde ou fale com a locadora.</p>
+</body></html>"""
+    return _no_cache(make_response(html, 503))
 
 
 def _no_cache(resp):
@@ -1786,11 +1380,17 @@ def view_contract(reserva_id):
     reserva = _res_by_tenant_or_404(reserva_id)
 
     paths = _resolve_paths(reserva.id)
-    pdf = (
-        (paths["signed"] if paths["signed"].exists() else None)
-        or (paths["legacy_signed"] if paths["legacy_signed"].exists() else None)
-        or (_ensure_base_pdf(reserva))
-    )
+    try:
+        pdf = (
+            (paths["signed"] if paths["signed"].exists() else None)
+            or (paths["legacy_signed"] if paths["legacy_signed"].exists() else None)
+            or (_ensure_base_pdf(reserva))
+        )
+    except render_queue.RenderFailed:
+        current_app.logger.exception("Contrato da reserva %s não pôde ser gerado", reserva.id)
+        return _contract_failed()
+    if pdf is None:  # PDF base ainda na fila
+        return _contract_preparing()
 
     resp = make_response(send_file(str(pdf), mimetype="application/pdf", conditional=False))
     return _no_cache(resp)
@@ -1814,7 +1414,7 @@ def sign_contract(reserva_id):
     # mesma lógica de tolerância em DEBUG
     require_contract_token(reserva_id, strict=not current_app.debug)
     reserva = _res_by_tenant_or_404(reserva_id)
-    _ensure_base_pdf(reserva)  # garante PDF base
+    _pregenerate_contract(reserva)  # garante PDF base (em background; o iframe mostra "preparando")
 
     # se veio token na query, deixa registrado na sessão pro POST subsequente
     qt = request.args.get("t")
@@ -1824,139 +1424,43 @@ def sign_contract(reserva_id):
     return render_template("public/contrato_sign.html", reserva_id=reserva.id, cache_ts=int(time.time()))
 
 
-# ---------- POST: recebe desenho e assina ----------
-@public_bp.post("/contrato/<int:reserva_id>/apply-signature", endpoint="apply_signature")
-def apply_signature(reserva_id):
-    # aqui o token é sempre exigido (POST sensível)
-    require_contract_token(reserva_id, strict=True)
-    _ = _res_by_tenant_or_404(reserva_id)
+# ---------- POST: recebe desenho e enfileira a assinatura ----------
+def _run_signing_job(reserva_id: int, sign_bytes: bytes, *, base_pdf: Path, fingerprint: str | None,
+                     signed_path: Path, png_path: Path, audit_path: Path,
+                     layout, signed_at: datetime, client_ip: str, user_agent: str,
+                     redirect_url: str, view_link: str) -> dict:
+    """
+    Assina fora da requisição (app/services/job_runner.py): PNG + auditoria em disco,
+    carimbo no PDF e Contract no DB, com o e-mail do assinado no outbox na mesma transação.
+    Sem g.tenant aqui: caminhos e URLs já vêm resolvidos pela requisição.
+    """
+    # salva PNG bruto (auditoria) — privado
+    png_path.write_bytes(sign_bytes)
 
-    # entrada (dataURL)
-    data = request.get_json(silent=True) or {}
-    data_url = (data.get("image") or "").strip()
-    if "," not in data_url:
-        return jsonify(ok=False, error="Nenhuma assinatura recebida"), 400
+    # PDF base na fila: espera aqui, não no worker web
+    if fingerprint is not None:
+        render_queue.get_queue().wait(base_pdf, 30)
+        if render_cache.current_digest(base_pdf, fingerprint) is None:
+            raise job_runner.JobError("Contrato ainda em preparação, tente novamente.")
 
-    _, b64 = data_url.split(",", 1)
-    try:
-        sign_bytes = base64.b64decode(b64)
-    except Exception:
-        return jsonify(ok=False, error="Imagem inválida"), 400
-
-    # salva PNG bruto (auditoria) — privado
-    _signature_png_path(reserva_id).write_bytes(sign_bytes)
-
-    # PDF base
-    base_pdf = _base_pdf_path(reserva_id)
-    if not base_pdf.exists():
-        legacy = _legacy_base(reserva_id)
-        if not legacy.exists():
-            return jsonify(ok=False, error="Contrato não encontrado"), 404
-        base_pdf = legacy
-
-    # metadados/auditoria
-    signed_at = datetime.utcnow()
-    client_ip = (request.headers.get("X-Forwarded-For") or request.remote_addr or "-").split(",")[0].strip()
-    user_agent = request.headers.get("User-Agent", "-")
     audit = {
         "reservation_id": reserva_id,
         "signed_at_utc": signed_at.isoformat(timespec="seconds") + "Z",
         "ip": client_ip,
         "user_agent": user_agent,
     }
-    _audit_json_path(reserva_id).write_text(json.dumps(audit, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    # conf de assinatura do tenant
-    conf = _sign_conf()
-    SIGN_FULL_W = conf["w"]
-    SIGN_FULL_H = conf["h"]
-    SIGN_FULL_X_REL = conf["x_rel"]
-    SIGN_FULL_Y_REL = conf["y_rel"]
-    RUB_W = conf["rub_w"]
-    RUB_H = conf["rub_h"]
-    RUB_MARGIN = conf["rub_m"]
-    RUBRICA_ON_LAST = conf["rub_on_last"]
-    AUDIT_STAMP = conf["audit"]
-
-    # abre PDF e aplica: rubrica nas anteriores + assinatura completa na última
-    with base_pdf.open("rb") as fh:
-        reader = PdfReader(fh)
-        writer = PdfWriter()
-
-        # prepara imagens (full e rubrica)
-        full_img = Image.open(BytesIO(sign_bytes)).convert("RGBA").resize((SIGN_FULL_W, SIGN_FULL_H))
-        rubric_img = Image.open(BytesIO(sign_bytes)).convert("RGBA").resize((RUB_W, RUB_H))
-
-        tmp_full = _signatures_root() / f"__tmp_full_{reserva_id}.png"
-        tmp_rub = _signatures_root() / f"__tmp_rub_{reserva_id}.png"
-        full_img.save(tmp_full)
-        rubric_img.save(tmp_rub)
+    audit_path.write_text(json.dumps(audit, ensure_ascii=False, indent=2), encoding="utf-8")
 
-        try:
-            last_idx = len(reader.pages) - 1
-
-            for i, page in enumerate(reader.pages):
-                w = float(page.mediabox.width)
-                h = float(page.mediabox.height)
-
-                packet = BytesIO()
-                can = rl_canvas.Canvas(packet, pagesize=(w, h))
-
-                # RUBRICA (todas as páginas, exceto a última se RUBRICA_ON_LAST=False)
-                if (i != last_idx) or RUBRICA_ON_LAST:
-                    can.drawImage(
-                        str(tmp_rub),
-                        w - RUB_W - RUB_MARGIN,
-                        RUB_MARGIN,
-                        width=RUB_W,
-                        height=RUB_H,
-                        mask="auto",
-                    )
-
-                # CARIMBO DE AUDITORIA (rodapé)
-                if AUDIT_STAMP:
-                    can.setFont("Helvetica", 7)
-                    carimbo = f"Signed {signed_at:%Y-%m-%d %H:%M UTC} - IP {client_ip}"
-                    can.drawString(24, 14, carimbo)
-
-                # ASSINATURA COMPLETA SOMENTE NA ÚLTIMA PÁGINA
-                if i == last_idx:
-                    x_full = w * SIGN_FULL_X_REL
-                    y_full = h * SIGN_FULL_Y_REL
-
-                    if CALIBRATE_SIGNATURE_BOX:
-                        # retângulo magenta para ajudar a calibrar posição/tamanho
-                        can.setStrokeColorRGB(1, 0, 1)
-                        can.setLineWidth(1)
-                        can.rect(x_full, y_full, SIGN_FULL_W, SIGN_FULL_H)
-
-                    can.drawImage(
-                        str(tmp_full),
-                        x_full,
-                        y_full,
-                        width=SIGN_FULL_W,
-                        height=SIGN_FULL_H,
-                        mask="auto",
-                    )
-
-                can.save()
-                packet.seek(0)
-                overlay_pdf = PdfReader(packet)
-                page.merge_page(overlay_pdf.pages[0])
-                writer.add_page(page)
-
-            signed_path = _signed_pdf_path(reserva_id)
-            with signed_path.open("wb") as out:
-                writer.write(out)
-        finally:
-            try:
-                tmp_full.unlink(missing_ok=True)
-            except Exception:
-                pass
-            try:
-                tmp_rub.unlink(missing_ok=True)
-            except Exception:
-                pass
+    # aplica rubrica nas anteriores + assinatura completa na última (app/services/signature_stamp.py)
+    tmp_path = signed_path.with_name(f".{signed_path.name}.{os.getpid()}.tmp")
+    try:
+        signature_stamp.stamp_signature(
+            base_pdf, sign_bytes, tmp_path,
+            layout=layout, signed_at=signed_at, client_ip=client_ip,
+        )
+        os.replace(tmp_path, signed_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
     # persiste no DB
     contrato = Contract.query.filter_by(reservation_id=reserva_id).first()
@@ -1968,12 +1472,88 @@ def apply_signature(reserva_id):
     contrato.signature_type = "drawn"
     contrato.signature_hash = sha256(sign_bytes).hexdigest()
     contrato.signed_at = signed_at
+    _queue_contract_email(reserva_id, signed_path, view_link)  # sai junto com o commit
     db.session.commit()
+    return {"redirect_url": redirect_url}
+
+
+def _signing_job_response(reserva_id: int, job):
+    """JSON comum ao POST e ao polling: pronto -> redirect_url; falha -> erro; senão status_url."""
+    if job is None:
+        # job de outro worker (ou já esquecido): o PDF assinado em disco é a prova
+        paths = _resolve_paths(reserva_id)
+        if paths["signed"].exists():
+            return jsonify(ok=True, status=job_runner.DONE, redirect_url=url_for(
+                "public.checkout", tenant_slug=_tenant_slug(), reservation_id=reserva_id))
+        return jsonify(ok=True, status=job_runner.RUNNING, retry_after=1)
+    if job.status == job_runner.FAILED:
+        return jsonify(ok=False, status=job.status, error=job.error or "Falha ao aplicar assinatura."), 503
+    if job.status == job_runner.DONE:
+        return jsonify(ok=True, status=job.status, job_id=job.id, **(job.result or {}))
+    status_url = url_for("public.signing_status", tenant_slug=_tenant_slug(),
+                         reserva_id=reserva_id, job_id=job.id)
+    return jsonify(ok=True, status=job.status, job_id=job.id, status_url=status_url, retry_after=1), 202
+
+
+@public_bp.post("/contrato/<int:reserva_id>/apply-signature", endpoint="apply_signature")
+def apply_signature(reserva_id):
+    # aqui o token é sempre exigido (POST sensível)
+    require_contract_token(reserva_id, strict=True)
+    reserva = _res_by_tenant_or_404(reserva_id)
+
+    # entrada (dataURL)
+    data = request.get_json(silent=True) or {}
+    data_url = (data.get("image") or "").strip()
+    if "," not in data_url:
+        return jsonify(ok=False, error="Nenhuma assinatura recebida"), 400
 
-    return jsonify(
-        ok=True,
-        redirect_url=url_for("public.checkout", tenant_slug=_tenant_slug(), reservation_id=reserva_id)
+    _, b64 = data_url.split(",", 1)
+    try:
+        sign_bytes = base64.b64decode(b64)
+    except Exception:
+        return jsonify(ok=False, error="Imagem inválida"), 400
+
+    # PDF base: aqui só confere o fingerprint e enfileira se preciso; o job espera o render
+    paths = _resolve_paths(reserva.id)
+    base_pdf, fp = paths["base"], None
+    if not base_pdf.exists() and paths["legacy_base"].exists():
+        base_pdf = paths["legacy_base"]  # legado: reutiliza como sempre
+    else:
+        html, fp, digest = _base_pdf_render(reserva, base_pdf)
+        if digest is None:
+            _submit_base_pdf(base_pdf, html, fp)
+
+    # metadados/auditoria (dependem da requisição; o resto roda no job)
+    client_ip = (request.headers.get("X-Forwarded-For") or request.remote_addr or "-").split(",")[0].strip()
+    link_args = dict(tenant_slug=_tenant_slug(), reserva_id=reserva.id)
+    view_link = _abs_url("public.view_contract", **link_args) if _abs_url \
+        else url_for("public.view_contract", _external=True, **link_args)
+    job = job_runner.get_runner().submit(
+        "contract_sign", _run_signing_job, reserva_id, sign_bytes,
+        base_pdf=base_pdf,
+        fingerprint=fp,
+        signed_path=paths["signed"],
+        png_path=_signature_png_path(reserva_id),
+        audit_path=_audit_json_path(reserva_id),
+        layout=signature_stamp.StampLayout.from_conf(_sign_conf(), calibrate=CALIBRATE_SIGNATURE_BOX),
+        signed_at=datetime.utcnow(),
+        client_ip=client_ip,
+        user_agent=request.headers.get("User-Agent", "-"),
+        redirect_url=url_for("public.checkout", tenant_slug=_tenant_slug(), reservation_id=reserva_id),
+        view_link=view_link,
     )
+    return _signing_job_response(reserva_id, job)
+
+
+# ---------- status da assinatura (polling da página) ----------
+@public_bp.get("/contrato/<int:reserva_id>/sign-status/<job_id>", endpoint="signing_status")
+def signing_status(reserva_id, job_id):
+    require_contract_token(reserva_id, strict=True)
+    _res_by_tenant_or_404(reserva_id)
+    job = job_runner.get_runner().get(job_id)
+    if job is not None and job.kind != "contract_sign":
+        job = None
+    return _no_cache(make_response(_signing_job_response(reserva_id, job)))
 
 
 # ---------- download do assinado ----------
@@ -2013,6 +1593,7 @@ def public_contract_start():
     res.flight_no = (request.form.get("flight_no") or "").strip() or None
 
     db.session.commit()
+    _pregenerate_contract(res)  # dados novos -> fingerprint novo -> contrato gerado de novo
 
     # URL da sua página de assinatura já existente
     next_url = request.form.get("next_url") or url_for(
@@ -9,6 +9,7 @@ from sqlalchemy.orm import joinedload
 
 from . import public_bp  # blueprint público
 from app.models import Tenant
+from app.services import tenant_registry
 from app.models_site import Site, SitePage
 
 
@@ -33,9 +34,7 @@ def _resolve_tenant_slug(incoming: Optional[str] = None) -> str:
 
 
 def _get_tenant_or_404(tenant_slug: str) -> Tenant:
-    tenant = Tenant.query.filter_by(slug=tenant_slug).first()
-    if not tenant:
-        abort(404, description="Tenant não encontrado")
+    tenant = tenant_registry.get_tenant_or_404(tenant_slug, description="Tenant não encontrado")
     g.tenant = tenant
     return tenant
 
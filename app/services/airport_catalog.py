@@ -0,0 +1,179 @@
+"""
+Airport autocomplete catalog, loaded once per process.
+
+Two indexes are built at load time:
+  * a sorted list of (token, airport) for IATA codes and name/city words,
+    so prefix lookups are a ``bisect`` plus the matching slice;
+  * a 2/3-gram → airports map, used as a fallback for substrings in the middle
+    of a word (the old endpoint matched any substring of the label).
+
+Results are ranked: exact code, code prefix, name word prefix, city word
+prefix, then plain substring; ties keep the dataset order (busiest first in
+the bundled file). Lookups only touch matching entries, so a world-wide
+dataset (``AIRPORTS_DATA_PATH``) is as cheap as the US one.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from typing import NamedTuple
+
+from flask import current_app
+
+_HYPHENS = re.compile(r"[\u2010-\u2015\u2212]")
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+
+RANK_CODE_EXACT = 0
+RANK_CODE_PREFIX = 1
+RANK_NAME_PREFIX = 2
+RANK_CITY_PREFIX = 3
+RANK_SUBSTRING = 4
+
+
+class Airport(NamedTuple):
+    code: str
+    name: str
+    city: str
+    label: str  # "Nome (IATA) - Cidade", hífens normalizados
+
+
+def fold(text: str) -> str:
+    """Lowercase, accents stripped, exotic hyphens turned into '-'."""
+    text = unicodedata.normalize("NFKD", _HYPHENS.sub("-", text or ""))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def make_label(name: str, code: str, city: str = "") -> str:
+    return _HYPHENS.sub("-", f"{name} ({code})" + (f" - {city}" if city else ""))
+
+
+class AirportCatalog:
+    def __init__(self, airports: list[Airport]):
+        self.airports = airports
+        self._folded = [fold(a.label) for a in airports]
+        postings: dict[str, set[tuple[int, int]]] = {}
+        grams: dict[str, set[int]] = {}
+        for idx, a in enumerate(airports):
+            postings.setdefault(a.code.lower(), set()).add((RANK_CODE_PREFIX, idx))
+            for text, rank in ((a.name, RANK_NAME_PREFIX), (a.city, RANK_CITY_PREFIX)):
+                for tok in _TOKEN_SPLIT.split(fold(text)):
+                    if tok:
+                        postings.setdefault(tok, set()).add((rank, idx))
+            label = self._folded[idx]
+            for n in (2, 3):
+                for i in range(len(label) - n + 1):
+                    grams.setdefault(label[i:i + n], set()).add(idx)
+        # um token distinto -> lista ordenada por (rank, posição no dataset)
+        self._token_keys = sorted(postings)
+        self._postings = {tok: sorted(entries) for tok, entries in postings.items()}
+        self._grams = grams
+
+    @classmethod
+    def from_records(cls, records) -> "AirportCatalog":
+        airports = []
+        for a in records or []:
+            code = (a.get("code") or a.get("iata") or "").strip().upper()
+            name = (a.get("name") or "").strip()
+            city = (a.get("city") or "").strip()
+            if code and name:
+                airports.append(Airport(code, name, city, make_label(name, code, city)))
+        return cls(airports)
+
+    @classmethod
+    def from_file(cls, path: str) -> "AirportCatalog":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_records(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.airports)
+
+    def _prefix_hits(self, q: str, limit: int) -> dict[int, int]:
+        """Best rank per airport among tokens starting with q, stopping at `limit`."""
+        lists = []
+        i = bisect_left(self._token_keys, q)
+        while i < len(self._token_keys) and self._token_keys[i].startswith(q):
+            tok = self._token_keys[i]
+            entries = self._postings[tok]
+            if tok == q:  # código exato sobe para o topo (a lista continua ordenada)
+                entries = ((RANK_CODE_EXACT if r == RANK_CODE_PREFIX else r, idx) for r, idx in entries)
+            lists.append(entries)
+            i += 1
+        best: dict[int, int] = {}
+        for rank, idx in heapq.merge(*lists):
+            if idx not in best:
+                best[idx] = rank
+                if len(best) >= limit:
+                    break
+        return best
+
+    def _substring_hits(self, q: str, best: dict[int, int], limit: int) -> None:
+        n = 3 if len(q) >= 3 else 2
+        candidates: set[int] | None = None
+        for i in range(len(q) - n + 1):
+            ids = self._grams.get(q[i:i + n])
+            if not ids:
+                return
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return
+        for idx in sorted(candidates or ()):
+            if idx not in best and q in self._folded[idx]:
+                best[idx] = RANK_SUBSTRING
+                if len(best) >= limit:
+                    return
+
+    def search(self, q: str, limit: int = 50) -> list[Airport]:
+        q = fold(q).strip()
+        if len(q) < 2 or limit <= 0:
+            return []
+        best = self._prefix_hits(q, limit)
+        if len(best) < limit:  # substring só completa; nunca supera um prefixo
+            self._substring_hits(q, best, limit)
+        ranked = sorted(best.items(), key=lambda kv: (kv[1], kv[0]))
+        return [self.airports[idx] for idx, _rank in ranked]
+
+    def labels(self, q: str, limit: int = 50) -> list[str]:
+        return [a.label for a in self.search(q, limit)]
+
+
+# =========================
+# Instância por processo
+# =========================
+EXT_KEY = "airport_catalog"
+_lock = threading.Lock()
+
+
+def _data_path() -> str | None:
+    configured = current_app.config.get("AIRPORTS_DATA_PATH")
+    if configured:
+        return configured
+    root_dir = os.path.abspath(os.path.join(current_app.root_path, os.pardir))
+    candidates = [
+        os.path.join(root_dir, "static", "data", "airports_us.json"),
+        os.path.join(current_app.root_path, "static", "data", "airports_us.json"),
+        os.path.join(root_dir, "static", "data", "airports_us_iata.json"),
+    ]
+    return next((p for p in candidates if os.path.isfile(p)), None)
+
+
+def get_catalog() -> AirportCatalog:
+    """Catalog of the current app; built on first use and then reused."""
+    catalog = current_app.extensions.get(EXT_KEY)
+    if catalog is not None:
+        return catalog
+    with _lock:
+        catalog = current_app.extensions.get(EXT_KEY)
+        if catalog is None:
+            path = _data_path()
+            try:
+                catalog = AirportCatalog.from_file(path) if path else AirportCatalog([])
+            except Exception:
+                current_app.logger.exception("airport catalog: falha ao carregar %s", path)
+                catalog = AirportCatalog([])
+            current_app.extensions[EXT_KEY] = catalog
+    return catalog
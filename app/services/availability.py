@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import and_, or_, select
+
+from app.extensions import db
+from app.models import RESERVATION_OVERLAP_CONSTRAINT, Reservation, Vehicle
+
+# Reservation statuses that take a vehicle out of the pool for their interval.
+BLOCKING_STATUSES: tuple[str, ...] = ("confirmed",)
+# Checkout holds (booking.place_hold) also block, but only until hold_expires_at.
+HOLD_STATUSES: tuple[str, ...] = ("pending",)
+
+
+def overlap_clause(
+    start_dt: datetime,
+    end_dt: datetime,
+    statuses: Iterable[str] = BLOCKING_STATUSES,
+    *,
+    include_holds: bool = True,
+    now: datetime | None = None,
+):
+    """
+    Half-open interval overlap: an existing reservation conflicts with
+    [start_dt, end_dt) when it starts before the new end and ends after
+    the new start. Unexpired holds count as blocking unless include_holds
+    is False.
+    """
+    blocking = Reservation.status.in_(tuple(statuses))
+    if include_holds:
+        blocking = or_(
+            blocking,
+            and_(
+                Reservation.status.in_(HOLD_STATUSES),
+                Reservation.hold_expires_at > (now or datetime.utcnow()),
+            ),
+        )
+    return and_(
+        Reservation.pickup_dt < end_dt,
+        Reservation.dropoff_dt > start_dt,
+        blocking,
+    )
+
+
+def _conflict_exists(tenant_id: int, start_dt: datetime, end_dt: datetime):
+    """Correlated EXISTS against the enclosing Vehicle row (anti-join when negated)."""
+    return (
+        select(Reservation.id)
+        .where(
+            Reservation.tenant_id == tenant_id,
+            Reservation.vehicle_id == Vehicle.id,
+            overlap_clause(start_dt, end_dt),
+        )
+        .exists()
+    )
+
+
+def filter_available(query, tenant_id: int, start_dt: datetime | None, end_dt: datetime | None):
+    """
+    Restrict a Vehicle query/select to vehicles free in [start_dt, end_dt).
+
+    Without a complete interval nothing is filtered, which mirrors the public
+    search when the customer has not picked dates yet.
+    """
+    if start_dt is None or end_dt is None:
+        return query
+    return query.filter(~_conflict_exists(tenant_id, start_dt, end_dt))
+
+
+def available_vehicle_ids(
+    tenant_id: int,
+    start_dt: datetime | None,
+    end_dt: datetime | None,
+    *,
+    category_ids: Iterable[int] | None = None,
+) -> list[int]:
+    """Ids of the tenant's vehicles free in the interval, in a single statement."""
+    stmt = select(Vehicle.id).where(Vehicle.tenant_id == tenant_id)
+    cat_ids = [int(c) for c in (category_ids or [])]
+    if cat_ids:
+        stmt = stmt.where(Vehicle.category_id.in_(cat_ids))
+    stmt = filter_available(stmt, tenant_id, start_dt, end_dt)
+    return list(db.session.scalars(stmt.order_by(Vehicle.id)))
+
+
+def busy_vehicle_ids(
+    tenant_id: int,
+    start_dt: datetime | None,
+    end_dt: datetime | None,
+    *,
+    vehicle_ids: Iterable[int] | None = None,
+) -> set[int]:
+    """Bulk interval lookup: every vehicle with a blocking reservation in the interval."""
+    if start_dt is None or end_dt is None:
+        return set()
+    stmt = (
+        select(Reservation.vehicle_id)
+        .where(
+            Reservation.tenant_id == tenant_id,
+            Reservation.vehicle_id.isnot(None),
+            overlap_clause(start_dt, end_dt),
+        )
+        .distinct()
+    )
+    ids = [int(v) for v in (vehicle_ids or [])]
+    if ids:
+        stmt = stmt.where(Reservation.vehicle_id.in_(ids))
+    return set(db.session.scalars(stmt))
+
+
+def is_vehicle_available(
+    tenant_id: int,
+    vehicle_id: int,
+    start_dt: datetime | None,
+    end_dt: datetime | None,
+) -> bool:
+    return vehicle_id not in busy_vehicle_ids(tenant_id, start_dt, end_dt, vehicle_ids=[vehicle_id])
+
+
+def is_overlap_violation(exc: Exception) -> bool:
+    """True when the database refused a write because of the no-double-booking rule."""
+    return RESERVATION_OVERLAP_CONSTRAINT in str(getattr(exc, "orig", exc))
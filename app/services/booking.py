@@ -0,0 +1,138 @@
+"""
+Hold → confirm booking primitive.
+
+``place_hold()`` locks the vehicle row with ``SELECT ... FOR UPDATE SKIP
+LOCKED``. If another checkout already owns the lock the car is reported busy
+right away instead of queueing behind it, so hot dates do not turn into a
+retry storm. Under the lock the interval is re-checked and a ``pending``
+reservation is inserted that blocks the car until ``hold_expires_at``.
+
+``confirm()`` takes the same lock (waiting this time: a paid booking must not
+be dropped), re-checks against confirmed reservations and flips the status.
+The exclusion constraint / SQLite trigger on ``reservations`` remains the last
+line of defence. SQLite ignores FOR UPDATE; its single writer is enough for
+development.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Reservation, Vehicle
+from app.services import availability
+
+DEFAULT_HOLD_MINUTES = 15
+CONFLICT_STATUS = "under_review"
+
+
+def hold_minutes() -> int:
+    return int(current_app.config.get("BOOKING_HOLD_MINUTES", DEFAULT_HOLD_MINUTES))
+
+
+def _lock_vehicle(tenant_id: int, vehicle_id: int, *, skip_locked: bool) -> Vehicle | None:
+    stmt = (
+        select(Vehicle)
+        .where(Vehicle.tenant_id == tenant_id, Vehicle.id == vehicle_id)
+        .with_for_update(skip_locked=skip_locked)
+    )
+    return db.session.scalars(stmt).first()
+
+
+def place_hold(
+    tenant_id: int,
+    vehicle_id: int,
+    start_dt: datetime,
+    end_dt: datetime,
+    **fields,
+) -> Reservation | None:
+    """
+    Create a pending reservation that holds the car for BOOKING_HOLD_MINUTES.
+    Returns None (nothing written) when the car is locked by a concurrent
+    checkout or already taken in the interval. Commits on success.
+    """
+    try:
+        vehicle = _lock_vehicle(tenant_id, vehicle_id, skip_locked=True)
+        if vehicle is None or not availability.is_vehicle_available(tenant_id, vehicle.id, start_dt, end_dt):
+            db.session.rollback()
+            return None
+        res = Reservation(
+            tenant_id=tenant_id,
+            vehicle_id=vehicle.id,
+            category_id=vehicle.category_id,
+            pickup_dt=start_dt,
+            dropoff_dt=end_dt,
+            status="pending",
+            hold_expires_at=datetime.utcnow() + timedelta(minutes=hold_minutes()),
+            **fields,
+        )
+        db.session.add(res)
+        db.session.commit()
+    except IntegrityError as exc:
+        db.session.rollback()
+        if availability.is_overlap_violation(exc):
+            return None
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    return res
+
+
+def _confirmed_conflict(res: Reservation) -> bool:
+    stmt = (
+        select(Reservation.id)
+        .where(
+            Reservation.tenant_id == res.tenant_id,
+            Reservation.vehicle_id == res.vehicle_id,
+            Reservation.id != res.id,
+            availability.overlap_clause(res.pickup_dt, res.dropoff_dt, include_holds=False),
+        )
+        .limit(1)
+    )
+    return db.session.scalar(stmt) is not None
+
+
+def _flag_conflict(res: Reservation) -> None:
+    current_app.logger.warning(
+        "booking: reserva #%s aprovada mas o veículo #%s já está confirmado no período",
+        res.id, res.vehicle_id,
+    )
+    res.status = CONFLICT_STATUS
+    note = "[booking] pagamento aprovado, mas o veículo já tinha reserva confirmada no período."
+    res.notes = f"{res.notes}\n{note}" if res.notes else note
+
+
+def confirm(res: Reservation) -> bool:
+    """
+    Turn a (held) reservation into a confirmed one, under the vehicle lock.
+
+    Idempotent for already confirmed rows. When the car was taken meanwhile
+    the reservation goes to CONFLICT_STATUS for manual handling and False is
+    returned. Does not commit: the caller's commit releases the lock.
+    """
+    if res.status == "confirmed":
+        return True
+
+    vehicle = None
+    if res.vehicle_id:
+        vehicle = _lock_vehicle(res.tenant_id, res.vehicle_id, skip_locked=False)
+        if _confirmed_conflict(res):
+            _flag_conflict(res)
+            return False
+
+    try:
+        with db.session.begin_nested():
+            res.status = "confirmed"
+            res.hold_expires_at = None
+            if vehicle is not None:
+                vehicle.status = "booked"
+    except IntegrityError as exc:
+        if not availability.is_overlap_violation(exc):
+            raise
+        _flag_conflict(res)
+        return False
+    return True
@@ -0,0 +1,140 @@
+"""
+Compiled contract templates, shared by the public contract flow and the
+admin preview.
+
+Every render used to build a ``SandboxedEnvironment`` and compile the
+tenant's ``contract_template_html`` from scratch (lexing, parsing and
+``compile()`` of the generated Python), which costs far more than the render
+itself. The environment is now a module-level singleton and compiled
+templates are kept in an LRU keyed by ``(tenant_id, sha256(source))``.
+
+Because the key carries the source hash, a saved template can never be
+served stale, in this worker or in any other; ``invalidate()`` (called when
+the settings page saves a new template) only frees the old entries early.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from hashlib import sha256
+
+from jinja2 import Template
+from jinja2.sandbox import SandboxedEnvironment
+
+DEFAULT_CACHE_SIZE = 128
+
+
+# ---------- filtros disponíveis nos templates ----------
+def money(value, currency="USD"):
+    try:
+        v = float(value)
+        return f"{currency} {v:,.2f}"
+    except Exception:
+        return f"{currency} {value}"
+
+
+def datefmt(dt, fmt="%d/%m/%Y"):
+    if not dt:
+        return "-"
+    if isinstance(dt, str):
+        try:
+            dt = datetime.fromisoformat(dt)
+        except Exception:
+            return dt
+    return dt.strftime(fmt)
+
+
+def datefmt_long_pt(value):
+    """Formata datas como '11 de setembro de 2025'."""
+    if isinstance(value, datetime):
+        d = value.date()
+    elif isinstance(value, date):
+        d = value
+    else:
+        try:
+            d = datetime.fromisoformat(str(value)).date()
+        except Exception:
+            d = date.today()
+    meses = [
+        "janeiro", "fevereiro", "março", "abril", "maio", "junho",
+        "julho", "agosto", "setembro", "outubro", "novembro", "dezembro",
+    ]
+    return f"{d.day} de {meses[d.month - 1]} de {d.year}"
+
+
+def _make_env() -> SandboxedEnvironment:
+    env = SandboxedEnvironment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+    env.filters["money"] = money
+    env.filters["datefmt"] = datefmt
+    env.filters["datefmt_long_pt"] = datefmt_long_pt
+    return env
+
+
+ENV = _make_env()
+
+
+def source_hash(source: str) -> str:
+    return sha256((source or "").encode("utf-8")).hexdigest()
+
+
+class TemplateCache:
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple[int | None, str], Template] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tenant_id: int | None, source: str, *, store: bool = True) -> Template:
+        """
+        Compiled template for the source. ``store=False`` compiles without
+        caching (drafts typed in the admin editor).
+        """
+        key = (tenant_id, source_hash(source))
+        with self._lock:
+            tpl = self._items.get(key)
+            if tpl is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return tpl
+            self.misses += 1
+
+        tpl = ENV.from_string(source)
+        if store:
+            with self._lock:
+                self._items[key] = tpl
+                self._items.move_to_end(key)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        return tpl
+
+    def invalidate(self, tenant_id: int | None = None) -> None:
+        with self._lock:
+            if tenant_id is None:
+                self._items.clear()
+                return
+            for key in [k for k in self._items if k[0] == tenant_id]:
+                del self._items[key]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+_cache = TemplateCache()
+
+
+def get_template(tenant_id: int | None, source: str, *, store: bool = True) -> Template:
+    return _cache.get(tenant_id, source, store=store)
+
+
+def render(tenant_id: int | None, source: str, **ctx) -> str:
+    return _cache.get(tenant_id, source).render(**ctx)
+
+
+def invalidate(tenant_id: int | None = None) -> None:
+    _cache.invalidate(tenant_id)
+
+
+def stats() -> dict:
+    return {"size": len(_cache), "hits": _cache.hits, "misses": _cache.misses}
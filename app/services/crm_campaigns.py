@@ -0,0 +1,265 @@
+"""
+Superadmin marketing campaigns (CRM "E-mail mkt").
+
+``crm_bulk_email()`` used to load every prospect, render
+``emails/marketing_generic.html`` once per lead and enqueue them one by one
+inside the HTTP request. A campaign is now an ``EmailCampaign`` row plus one
+``EmailOutbox`` row per recipient:
+
+  * the template is rendered once per campaign (with and without a name
+    line) around placeholder tokens; each recipient only costs two
+    ``str.replace`` of the escaped e-mail/name;
+  * prospects are read in keyset pages of ``BATCH`` and inserted into the
+    outbox by a ``job_runner`` job, deduplicated by e-mail, one commit per
+    page. The job first claims the campaign (``queued_at`` stamped while it
+    is still ``preparing``) and renews the stamp with every page, checking
+    it is still its own; a campaign whose job was lost with a restart is
+    picked up again by the outbox worker (``resume_stale()``) after
+    ``STALE_AFTER`` and continues after the recipients already queued;
+  * delivery, retries, concurrency and rate limiting are the outbox's
+    (campaign mail is claimed after the transactional mail that is due);
+  * per-recipient results are the outbox rows themselves, so ``progress()``
+    is a ``GROUP BY status`` on ``campaign_id``.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from flask import render_template
+from markupsafe import escape
+from sqlalchemy import func, or_, select, update
+
+from app.extensions import db
+from app.models import EmailCampaign, EmailOutbox, Prospect
+from app.services import mail_outbox
+
+TEMPLATE = "emails/marketing_generic.html"
+EMAIL_TOKEN = "[[campaign:email]]"  # nada aqui é alterado pelo autoescape
+NAME_TOKEN = "[[campaign:name]]"
+BATCH = 500
+MAX_FAILURES_LISTED = 50
+STALE_AFTER = timedelta(minutes=10)  # campanha em "preparing" sem job vivo há esse tempo é retomada
+log = logging.getLogger(__name__)
+
+PREPARING, SENDING, FAILED, DONE = "preparing", "sending", "failed", "done"
+
+
+class _Lead(NamedTuple):
+    email: str
+    name: str
+
+
+# =========================
+# Render (uma vez por campanha)
+# =========================
+def render_variants(subject: str, body: str) -> tuple[str, str]:
+    """
+    Render the campaign HTML for a lead with a name and for one without.
+    Needs a request context (the template context processors read it).
+    """
+    body_html = body.replace("\n", "<br>")
+
+    def _render(name: str) -> str:
+        try:
+            return render_template(TEMPLATE, lead=_Lead(EMAIL_TOKEN, name), subject=subject, body_html=body_html)
+        except Exception:
+            # fallback simples em HTML (mesmo do envio antigo)
+            return f"<div style='font-family:system-ui,Segoe UI,Arial'><p>{body_html}</p></div>"
+
+    return _render(NAME_TOKEN), _render("")
+
+
+def personalize(variants: tuple[str, str], email: str, name: str | None) -> str:
+    html = variants[0] if name else variants[1]
+    html = html.replace(EMAIL_TOKEN, str(escape(email)))
+    return html.replace(NAME_TOKEN, str(escape(name))) if name else html
+
+
+# =========================
+# Campanha
+# =========================
+def create(subject: str, body: str, prospect_ids: list[int] | None = None) -> EmailCampaign:
+    campaign = EmailCampaign(subject=subject, body=body, prospect_ids=prospect_ids or None, status=PREPARING)
+    db.session.add(campaign)
+    db.session.commit()
+    return campaign
+
+
+class ClaimLost(RuntimeError):
+    """Another job took the campaign over (ours looked stale)."""
+
+
+def _claim(campaign_id: int) -> datetime | None:
+    """
+    Take a ``preparing`` campaign nobody is working on (or whose job went
+    stale). Returns the ``queued_at`` stamp that identifies this job.
+    """
+    now = datetime.utcnow()
+    res = db.session.execute(
+        update(EmailCampaign)
+        .where(
+            EmailCampaign.id == campaign_id,
+            EmailCampaign.status == PREPARING,
+            or_(EmailCampaign.queued_at.is_(None), EmailCampaign.queued_at < now - STALE_AFTER),
+        )
+        .values(queued_at=now)
+    )
+    db.session.commit()
+    return now if res.rowcount == 1 else None
+
+
+def _renew(campaign_id: int, stamp: datetime, **values) -> datetime:
+    """Commit the current page and renew our claim; ClaimLost if the campaign is no longer ours."""
+    now = datetime.utcnow()
+    res = db.session.execute(
+        update(EmailCampaign)
+        .where(EmailCampaign.id == campaign_id, EmailCampaign.status == PREPARING, EmailCampaign.queued_at == stamp)
+        .values(queued_at=now, **values)
+    )
+    if res.rowcount != 1:
+        raise ClaimLost(f"campanha #{campaign_id} foi retomada por outro job")
+    db.session.commit()
+    return now
+
+
+def queue_recipients(campaign_id: int, variants: tuple[str, str]) -> dict:
+    """
+    Job body: page through the campaign's prospects and put one outbox row
+    per distinct e-mail, ``BATCH`` rows per INSERT and commit. Recipients
+    already in the outbox (an earlier, interrupted run) are skipped.
+    """
+    stamp = _claim(campaign_id)
+    if stamp is None:  # já enfileirada, ou outro processo está nela
+        campaign = db.session.get(EmailCampaign, campaign_id)
+        return {"campaign_id": campaign_id, "total": getattr(campaign, "total", 0)}
+    campaign = db.session.get(EmailCampaign, campaign_id)
+    subject, body, prospect_ids = campaign.subject, campaign.body, campaign.prospect_ids
+
+    base = select(Prospect.id, Prospect.name, Prospect.email).where(
+        Prospect.email.isnot(None), Prospect.email != ""
+    )
+    if prospect_ids:
+        base = base.where(Prospect.id.in_(prospect_ids))
+
+    try:
+        seen = {
+            addr.lower() for (addr,) in
+            db.session.query(EmailOutbox.to_addr).filter(EmailOutbox.campaign_id == campaign_id)
+        }
+        last_id = None
+        while True:
+            # keyset (mais novos primeiro): nenhum cursor fica aberto entre os commits
+            stmt = base.order_by(Prospect.id.desc()).limit(BATCH)
+            if last_id is not None:
+                stmt = stmt.where(Prospect.id < last_id)
+            part = db.session.execute(stmt).all()
+            if not part:
+                break
+            last_id = part[-1][0]
+            rows = []
+            for _pid, name, email in part:
+                email = (email or "").strip()
+                key = email.lower()
+                if not email or key in seen:
+                    continue
+                seen.add(key)
+                rows.append({
+                    "to": email,
+                    "subject": subject,
+                    "html": personalize(variants, email, (name or "").strip()),
+                    "text_alt": body,
+                    "channel": "platform",
+                    "kind": "crm",
+                    "campaign_id": campaign_id,
+                })
+            mail_outbox.enqueue_many(rows)
+            stamp = _renew(campaign_id, stamp)
+
+        total = db.session.query(func.count(EmailOutbox.id)).filter(EmailOutbox.campaign_id == campaign_id).scalar()
+        _renew(campaign_id, stamp, total=total, status=SENDING)
+    except ClaimLost:
+        db.session.rollback()
+        log.warning("crm: campanha #%s retomada por outro job; este para aqui", campaign_id)
+        return {"campaign_id": campaign_id, "total": None}
+    except Exception as exc:
+        db.session.rollback()
+        campaign = db.session.get(EmailCampaign, campaign_id)
+        campaign.status = FAILED
+        campaign.error = str(exc)[:1000]
+        db.session.commit()
+        raise
+    return {"campaign_id": campaign_id, "total": total}
+
+
+def resume_stale(app) -> int:
+    """
+    Queue the recipients of campaigns left in ``preparing`` for longer than
+    ``STALE_AFTER`` (their job died with the process). Runs from the outbox
+    worker; needs an app context. Returns how many were resumed.
+    """
+    cutoff = datetime.utcnow() - STALE_AFTER
+    ids = [
+        cid for (cid,) in db.session.query(EmailCampaign.id)
+        .filter(
+            EmailCampaign.status == PREPARING,
+            func.coalesce(EmailCampaign.queued_at, EmailCampaign.created_at) < cutoff,
+        )
+        .order_by(EmailCampaign.id)
+        .all()
+    ]
+    resumed = 0
+    for cid in ids:
+        campaign = db.session.get(EmailCampaign, cid)
+        with app.test_request_context("/"):  # render_variants precisa de request
+            variants = render_variants(campaign.subject, campaign.body)
+        try:
+            queue_recipients(cid, variants)
+        except Exception:
+            log.exception("crm: falha ao retomar a campanha #%s", cid)
+            continue
+        resumed += 1
+        log.warning("crm: campanha #%s retomada (estava em preparing)", cid)
+    return resumed
+
+
+def progress(campaign: EmailCampaign, *, with_failures: bool = True) -> dict:
+    counts = dict(
+        db.session.query(EmailOutbox.status, func.count(EmailOutbox.id))
+        .filter(EmailOutbox.campaign_id == campaign.id)
+        .group_by(EmailOutbox.status)
+        .all()
+    )
+    open_ = sum(counts.get(s, 0) for s in (mail_outbox.PENDING, mail_outbox.SENDING, mail_outbox.ACCEPTED))
+    status = campaign.status
+    if status == SENDING and not open_:
+        status = DONE  # derivado: todos os destinatários já têm resultado
+
+    data = {
+        "id": campaign.id,
+        "subject": campaign.subject,
+        "status": status,
+        "error": campaign.error,
+        "created_at": campaign.created_at.isoformat() if campaign.created_at else None,
+        "total": campaign.total,
+        "pending": open_,
+        "sent": counts.get(mail_outbox.SENT, 0),
+        "skipped": counts.get(mail_outbox.SKIPPED, 0),
+        "dead": counts.get(mail_outbox.DEAD, 0),
+    }
+    if with_failures:
+        failed = (
+            db.session.query(EmailOutbox.to_addr, EmailOutbox.last_error)
+            .filter(EmailOutbox.campaign_id == campaign.id, EmailOutbox.status == mail_outbox.DEAD)
+            .order_by(EmailOutbox.id)
+            .limit(MAX_FAILURES_LISTED)
+            .all()
+        )
+        data["failures"] = [{"to": to, "error": err} for to, err in failed]
+    return data
+
+
+def recent(limit: int = 5) -> list[dict]:
+    rows = EmailCampaign.query.order_by(EmailCampaign.created_at.desc(), EmailCampaign.id.desc()).limit(limit).all()
+    return [progress(c, with_failures=False) for c in rows]
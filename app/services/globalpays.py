@@ -0,0 +1,523 @@
+"""
+GlobalPays (payment link provider) integration helpers.
+
+Auth tokens: ``_gp_pl_token()`` used to keep the token in the customer's
+Flask session, so every new session authenticated again – up to two auth
+URLs × two payload shapes, tried one after another with 20 s timeouts, right
+on the checkout click. ``TokenManager`` keeps one token per tenant for the
+whole process instead:
+
+  * a token is reused until ``ttl``; within ``refresh_margin`` of expiry the
+    caller still gets it and a background thread fetches the next one;
+  * concurrent refreshes for the same tenant make one auth call; after a
+    401, ``get(stale=<token>)`` only re-authenticates if nobody replaced
+    that token yet;
+  * the auth URL/payload variant that worked is remembered per tenant and
+    tried first next time;
+  * a failed auth is remembered for ``fail_ttl`` (the ``GP_TOKEN`` fallback,
+    if any, is served meanwhile) so a provider outage doesn't cost every
+    checkout the full sequence of timeouts.
+
+Entries are keyed by tenant plus a hash of the credentials, so rotated keys
+(``save_tenant_payment_creds``) never reuse an old token.
+
+API calls: the provider's order/consult routes and the token header format
+were found by trial – ``checkout_pay_link()`` walked up to five endpoints ×
+four header variants × with/without split, each a fresh ``requests`` call.
+``GatewayClient`` does the same probing once and remembers, per tenant and
+operation, the (endpoint, header) pair that answered; later calls go straight
+to it and only fall back to probing when it stops working (no answer, route
+missing, 401/403/405 – a business error such as an unknown order keeps it).
+A URL that says "rota não encontrada" or does not answer at all is skipped
+for the remaining header variants. All traffic (auth included) goes through one pooled
+``requests.Session`` with keep-alive and retries on connection errors (and on
+502/503/504 for GETs only – creating an order is not idempotent).
+
+``tenant_creds()``/``api_base()``/``consult_order()`` only need an app
+context, so the reconciliation job (app/services/payment_reconcile.py) uses
+the same credentials, routes and parsing as the checkout pages.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import Callable
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import utils
+
+log = logging.getLogger(__name__)
+
+AUTH_PATHS = ("/paymentapi/auth", "/checkoutapi/auth")
+PAYLOAD_SHAPES = ("pub_merchant", "pub_only")
+HEADER_STYLES = ("token", "bearer", "bearer_lower", "Token")
+ROUTE_NOT_FOUND = "rota não encontrada"
+# resposta da rota aprendida que indica rota/header errados (um 404 comum é "pedido não existe")
+BROKEN_ROUTE_STATUSES = (None, 401, 403, 405)
+DEFAULT_API_BASE = "https://apihml.tryglobalpays.com/v1"
+CONSULT_PATHS = ("/paymentapi/order/{id}", "/paymentapi/order?id={id}",
+                 "/paymentapi/transaction/{id}", "/paymentapi/transaction?id={id}")
+
+
+def new_session(pool_size: int = 10) -> requests.Session:
+    """Keep-alive session; connection errors are retried, 5xx only for GET."""
+    retry = Retry(
+        total=3, connect=2, read=1, status=2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=0.3,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def _auth_payload(shape: str, pub: str, mch: str) -> dict:
+    if shape == "pub_merchant":
+        return {"pubKey": pub, "merchantCode": mch}
+    return {"pubKey": pub}
+
+
+def _token_from(resp) -> str | None:
+    data = (resp.json() if "application/json" in resp.headers.get("content-type", "") else {}) or {}
+    inner = data.get("data")
+    return (
+        data.get("token")
+        or (inner.get("token") if isinstance(inner, dict) else None)
+        or (inner if isinstance(inner, str) else None)
+    )
+
+
+@dataclass
+class _Entry:
+    token: str | None = None
+    expires_at: float = 0.0
+    gen: int = 0  # incrementa a cada autenticação
+    variant: tuple[str, str] | None = None  # (auth_url, shape) que funcionou
+    refreshing: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class TokenManager:
+    def __init__(
+        self,
+        *,
+        ttl: float = 480.0,
+        refresh_margin: float = 60.0,
+        fail_ttl: float = 30.0,
+        timeout: float = 20.0,
+        post: Callable[..., requests.Response] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.fail_ttl = fail_ttl
+        self.timeout = timeout
+        self._post = post
+        self._clock = clock
+        self._entries: dict[tuple, _Entry] = {}
+        self._lock = threading.Lock()
+        self.auth_calls = 0
+        self.hits = 0
+
+    @staticmethod
+    def key(tenant_key, creds: dict, base: str) -> tuple:
+        secret = "|".join((creds.get("public_key") or "", creds.get("merchant_code") or "", creds.get("token") or ""))
+        return (tenant_key, base, sha256(secret.encode("utf-8")).hexdigest())
+
+    def _entry(self, key: tuple) -> _Entry:
+        with self._lock:
+            return self._entries.setdefault(key, _Entry())
+
+    # ---------- auth ----------
+    def _variants(self, base: str, remembered: tuple[str, str] | None) -> list[tuple[str, str]]:
+        variants = [(f"{base}{path}", shape) for path in AUTH_PATHS for shape in PAYLOAD_SHAPES]
+        if remembered in variants:
+            variants.remove(remembered)
+            variants.insert(0, remembered)
+        return variants
+
+    def _authenticate(self, entry: _Entry, creds: dict, base: str) -> None:
+        """Refresh ``entry`` in place. Caller holds ``entry.lock``."""
+        pub = (creds.get("public_key") or "").strip()
+        mch = (creds.get("merchant_code") or "").strip()
+        env_tok = (creds.get("token") or "").strip()
+        now = self._clock()
+        post = self._post or session().post
+
+        token = variant = None
+        if pub:
+            for auth_url, shape in self._variants(base, entry.variant):
+                self.auth_calls += 1
+                try:
+                    resp = post(auth_url, data=_auth_payload(shape, pub, mch), timeout=self.timeout)
+                    tok = _token_from(resp)
+                except Exception:
+                    log.exception("Falha ao autenticar em %s", auth_url)
+                    continue
+                if tok and resp.status_code < 400:
+                    token, variant = tok, (auth_url, shape)
+                    log.info("PaymentLink auth OK em %s", auth_url)
+                    break
+
+        entry.gen += 1
+        if token:
+            entry.token, entry.variant = token, variant
+            entry.expires_at = now + self.ttl
+        elif env_tok:
+            # sem pubKey: o token direto do KV/env é o token; com pubKey, é o fallback
+            if pub:
+                log.warning("Usando GP_TOKEN do KV/env como fallback (Payment Link).")
+            entry.token = env_tok
+            entry.expires_at = now + (self.ttl if not pub else self.fail_ttl)
+        else:
+            entry.token = None
+            entry.expires_at = now + self.fail_ttl
+
+    def _refresh(self, key: tuple, creds: dict, base: str) -> None:
+        entry = self._entry(key)
+        try:
+            with entry.lock:
+                self._authenticate(entry, creds, base)
+        except Exception:
+            log.exception("Falha ao renovar token do provedor em segundo plano")
+        finally:
+            entry.refreshing = False
+
+    def _refresh_async(self, key: tuple, entry: _Entry, creds: dict, base: str) -> None:
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        threading.Thread(target=self._refresh, args=(key, dict(creds), base),
+                         name="gp-token-refresh", daemon=True).start()
+
+    # ---------- API ----------
+    def get(self, tenant_key, creds: dict, base: str, *, force: bool = False, stale: str | None = None) -> str | None:
+        """
+        Token for this tenant/credentials. ``force`` skips the cache; ``stale``
+        (the token that just got a 401) re-authenticates only if it is still
+        the cached one.
+        """
+        if not (creds.get("public_key") or creds.get("token")):
+            return None
+        key = self.key(tenant_key, creds, base)
+        entry = self._entry(key)
+        now = self._clock()
+        if stale is not None:
+            force = entry.token == stale
+        if not force and now < entry.expires_at:
+            self.hits += 1
+            token = entry.token
+            if token and entry.expires_at - now < self.refresh_margin:
+                self._refresh_async(key, entry, creds, base)
+            return token
+
+        gen = entry.gen
+        with entry.lock:
+            if entry.gen != gen:  # outra thread autenticou enquanto esperávamos o lock
+                return entry.token
+            self._authenticate(entry, creds, base)
+            return entry.token
+
+    def warm(self, tenant_key, creds: dict, base: str) -> None:
+        """Start an auth in the background if there is no usable token (e.g. when the checkout page opens)."""
+        if not (creds.get("public_key") or creds.get("token")):
+            return
+        key = self.key(tenant_key, creds, base)
+        entry = self._entry(key)
+        if self._clock() < entry.expires_at - self.refresh_margin:
+            return
+        self._refresh_async(key, entry, creds, base)
+
+    def invalidate(self, tenant_key=None) -> None:
+        with self._lock:
+            if tenant_key is None:
+                self._entries.clear()
+            else:
+                for k in [k for k in self._entries if k[0] == tenant_key]:
+                    del self._entries[k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        return {"entries": entries, "hits": self.hits, "auth_calls": self.auth_calls}
+
+
+# =========================
+# Cliente da API (rotas aprendidas)
+# =========================
+def auth_headers(style: str, token: str) -> dict:
+    base = {"Accept": "application/json", "Content-Type": "application/json"}
+    if style == "token":
+        return dict(base, token=token)
+    if style == "bearer":
+        return dict(base, Authorization=f"Bearer {token}")
+    if style == "bearer_lower":
+        return dict(base, authorization=f"Bearer {token}")
+    return dict(base, Token=token)
+
+
+@dataclass
+class Reply:
+    url: str
+    style: str
+    status: int | None  # None = sem resposta (timeout/conexão)
+    data: dict = field(default_factory=dict)
+    text: str | None = None
+
+    @property
+    def route_missing(self) -> bool:
+        return (self.data.get("msg") or "").lower().strip() == ROUTE_NOT_FOUND
+
+
+class GatewayClient:
+    def __init__(self, tokens: TokenManager, *, http: requests.Session | None = None, timeout: float = 30.0):
+        self.tokens = tokens
+        self._http = http
+        self.timeout = timeout
+        self._learned: dict[tuple, tuple[str, str]] = {}  # (tenant, op) -> (url template, header style)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.probes = 0
+
+    @property
+    def http(self) -> requests.Session:
+        return self._http or session()
+
+    def learned(self, tenant_key, op: str) -> tuple[str, str] | None:
+        return self._learned.get((tenant_key, op))
+
+    def forget(self, tenant_key=None) -> None:
+        with self._lock:
+            for k in [k for k in self._learned if tenant_key is None or k[0] == tenant_key]:
+                del self._learned[k]
+
+    def _routes(self, tenant_key, op: str, urls: list[str]) -> list[tuple[str, str]]:
+        learned = self._learned.get((tenant_key, op))
+        # sem rota aprendida para esta operação, o header que já funcionou em outra vem primeiro
+        style = learned[1] if learned else next(
+            (v[1] for k, v in list(self._learned.items()) if k[0] == tenant_key), None
+        )
+        styles = sorted(HEADER_STYLES, key=lambda s: s != style)
+        routes = [(u, s) for u in urls for s in styles]
+        if learned in routes:
+            routes.remove(learned)
+            routes.insert(0, learned)
+        return routes
+
+    def _send(self, method: str, url: str, style: str, token: str, payload, timeout: float) -> Reply:
+        self.calls += 1
+        try:
+            resp = self.http.request(method, url, json=payload, headers=auth_headers(style, token), timeout=timeout)
+        except requests.RequestException as exc:
+            return Reply(url, style, None, text=str(exc))
+        reply = Reply(url, style, resp.status_code)
+        try:
+            data = resp.json() if "application/json" in resp.headers.get("content-type", "") else {}
+            reply.data = data if isinstance(data, dict) else {}
+        except ValueError:
+            reply.text = resp.text
+        return reply
+
+    def call(
+        self,
+        op: str,
+        tenant_key,
+        creds: dict,
+        base: str,
+        method: str,
+        urls: list[str],
+        *,
+        accept: Callable[[Reply], bool],
+        params: dict | None = None,
+        payloads: list[Callable[[], dict]] | None = None,
+        timeout: float | None = None,
+    ) -> tuple[Reply | None, Reply | None]:
+        """
+        Try the learned route first, then probe ``urls`` × header styles (×
+        ``payloads``, in order, per route). Returns (accepted reply or None,
+        last reply seen). The first 401 re-authenticates and retries.
+
+        ``urls`` may be templates filled with ``params`` (``.../order/{id}``);
+        the template is what gets learned, so the next call with another id
+        goes straight to it. When the learned route answers and is not broken
+        (a business error such as "unknown order" or a 422), that answer is
+        returned as is: nothing else is probed.
+        """
+        token = self.tokens.get(tenant_key, creds, base)
+        if not token:
+            return None, None
+        payloads = payloads or [lambda: None]
+        timeout = timeout or self.timeout
+        key = (tenant_key, op)
+        learned = self._learned.get(key)
+        dead: set[str] = set()
+        reauthed = False
+        learned_broken = False
+        last = None
+        for template, style in self._routes(tenant_key, op, urls):
+            if template in dead:
+                continue
+            is_learned = (template, style) == learned
+            if not is_learned:
+                self.probes += 1
+            url = template.format_map(params) if params else template
+            for make_payload in payloads:
+                reply = self._send(method, url, style, token, make_payload(), timeout)
+                if reply.status == 401 and not reauthed:
+                    # uma reautenticação por chamada; 401 depois disso é header errado
+                    reauthed = True
+                    token = self.tokens.get(tenant_key, creds, base, stale=token) or token
+                    reply = self._send(method, url, style, token, make_payload(), timeout)
+                last = reply
+                if is_learned and (reply.status in BROKEN_ROUTE_STATUSES or reply.route_missing):
+                    learned_broken = True
+                if reply.status is None or reply.route_missing:
+                    dead.add(template)  # não responde / rota não existe: nenhum header vai mudar isso
+                    break
+                if accept(reply):
+                    if not is_learned:
+                        with self._lock:
+                            self._learned[key] = (template, style)
+                        log.info("GlobalPays %s: rota aprendida %s (header %s)", op, template, style)
+                    return reply, last
+            if is_learned and not learned_broken:
+                return None, last  # a rota funciona; a recusa é do negócio (pedido inexistente, 422...)
+        if learned_broken:
+            with self._lock:
+                if self._learned.get(key) == learned:
+                    del self._learned[key]  # rota/header pararam de funcionar: próxima chamada sonda de novo
+        return None, last
+
+    def stats(self) -> dict:
+        with self._lock:
+            learned = len(self._learned)
+        return {"learned": learned, "calls": self.calls, "probes": self.probes}
+
+
+# =========================
+# Instâncias do processo
+# =========================
+tokens = TokenManager()
+client = GatewayClient(tokens)
+
+
+# =========================
+# Credenciais / consulta (precisam de app context)
+# =========================
+def _cfg_str(key: str, default: str = "") -> str:
+    val = current_app.config.get(key)
+    if val in (None, ""):
+        val = os.getenv(key) or default
+    return str(val).strip()
+
+
+def api_base() -> str:
+    return _cfg_str("GP_API_V1_BASE", DEFAULT_API_BASE).rstrip("/")
+
+
+def tenant_creds(tenant) -> dict:
+    """
+    Credenciais do tenant a partir do Key Vault (tenant.payment_secret_id, ex.:
+    'gpay-locadora1-dev'), via cache de segredos do processo
+    (utils.get_secret_cached: TTL + refresh em segundo plano).
+    Formato esperado do segredo (JSON):
+      { "public_key": "...", "merchant_code": "...", "token": "", "env": "dev", ... }
+    Se não existir, cai para config/variáveis de ambiente.
+    """
+    alias = getattr(tenant, "payment_secret_id", None)
+    if alias:
+        try:
+            raw = utils.get_secret_cached(alias)  # string JSON (None = segredo não existe)
+            if raw is None:
+                raise LookupError(f"segredo {alias} não encontrado")
+            data = json.loads(raw)
+            return {
+                "public_key": (data.get("public_key") or "").strip(),
+                "merchant_code": (data.get("merchant_code") or "").strip(),
+                "token": (data.get("token") or "").strip(),
+                "endpoint": (data.get("endpoint") or "").strip(),
+            }
+        except Exception:
+            current_app.logger.exception("Falha ao ler segredo do KV para %s", alias)
+
+    # fallback: variáveis
+    return {
+        "public_key": _cfg_str("GP_PUB_KEY"),
+        "merchant_code": _cfg_str("GP_MERCHANT_CODE"),
+        "token": _cfg_str("GP_TOKEN"),
+        "endpoint": _cfg_str("GP_PAYMENT_LINK_ENDPOINT"),
+    }
+
+
+def order_id_of(data: dict) -> str | None:
+    """Order id in a createOrder/consult/webhook body, if the provider sent one."""
+    bloc = data.get("data") if isinstance(data.get("data"), dict) else {}
+    oid = data.get("orderId") or data.get("order_id") or bloc.get("orderId") or bloc.get("order_id")
+    return str(oid).strip()[:64] if oid else None
+
+
+def consult_order(tenant_key, creds: dict, base: str, order_id, *, timeout: float = 20) -> dict:
+    """
+    Look an order up (learned consult route first) and normalise the answer;
+    {} when the provider gave none. Does not touch the app context, so it can
+    run in worker threads.
+    """
+    urls = [base + path for path in CONSULT_PATHS]
+    reply, _last = client.call("consult", tenant_key, creds, base, "GET", urls, params={"id": order_id},
+                               accept=lambda rep: rep.status < 400, timeout=timeout)
+    if reply is None:
+        return {}
+
+    data = reply.data
+    bloc = data.get("data") if isinstance(data.get("data"), dict) else None
+    status = (data.get("status") or (bloc or {}).get("status") or "").lower()
+    extref = (data.get("externalReference") or data.get("reference")
+              or (bloc or {}).get("externalReference") or (bloc or {}).get("reference"))
+    invoice = (data.get("invoice") or (bloc or {}).get("invoice") or "")
+    kyc_url = (data.get("clientAreaUrl") or (bloc or {}).get("clientAreaUrl")
+               or data.get("url_checkout") or (bloc or {}).get("url_checkout"))
+    installment = (data.get("installment") or (bloc or {}).get("installment"))
+
+    return {
+        "status": status,
+        "order_id": order_id_of(data) or str(order_id),
+        "external_reference": extref,
+        "invoice": invoice,
+        "client_area_url": kyc_url,
+        "installment": installment,
+    }
+
+
+def init_app(app) -> TokenManager:
+    tokens.ttl = float(app.config.get("GP_TOKEN_TTL", 480))
+    tokens.refresh_margin = float(app.config.get("GP_TOKEN_REFRESH_MARGIN", 60))
+    tokens.timeout = float(app.config.get("GP_AUTH_TIMEOUT", 20))
+    client.timeout = float(app.config.get("GP_API_TIMEOUT", 30))
+    return tokens
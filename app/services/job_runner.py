@@ -0,0 +1,168 @@
+"""
+In-process background jobs with a status registry.
+
+Request handlers that used to do slow, disk-bound work inline (signing a
+contract: decode the PNG, stamp every page, write the signed copy and the
+audit JSON, commit) now ``submit()`` it here and answer right away with a job
+id. A small thread pool runs each job inside an application context and the
+registry keeps its status so the page can poll for it::
+
+    job = job_runner.get_runner().submit("contract_sign", fn, *args)
+    job.id            # returned to the browser
+    runner.get(id)    # {"status": "queued" | "running" | "done" | "failed", ...}
+
+Follow-up work (e-mailing the signed copy) is submitted from inside the job
+to the same runner. Finished jobs are forgotten after ``JOB_RETENTION_S``.
+
+``job.error`` is shown to the (anonymous) client, so only the message of a
+``JobError`` ends up there; any other exception is logged and the job fails
+with ``error=None``, leaving the wording to the caller.
+
+The registry lives in this process only: with several gunicorn workers the
+poll may land on a worker that never saw the job, so callers keep a durable
+fallback (for signing: the signed PDF on disk). ``BACKGROUND_JOB_WORKERS=0``
+runs jobs inline in the caller (development and tests).
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from flask import current_app
+
+EXT_KEY = "job_runner"
+JOB_RETENTION_S = 3600
+MAX_JOBS = 2000
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobError(Exception):
+    """A job failure whose message is safe to show to the user."""
+
+
+class Job:
+    __slots__ = ("id", "kind", "status", "result", "error", "created_at", "finished_at", "done")
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.done = threading.Event()
+
+    def as_dict(self) -> dict:
+        data = {"id": self.id, "kind": self.kind, "status": self.status}
+        if self.result:
+            data.update(self.result)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class JobRunner:
+    def __init__(self, app=None, *, workers: int = 2):
+        self.app = app
+        self.workers = max(0, int(workers))
+        self._pool: ThreadPoolExecutor | None = None
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self._pool
+
+    def submit(self, kind: str, fn: Callable[..., dict | None], *args, **kwargs) -> Job:
+        """
+        Run ``fn(*args, **kwargs)`` in the background inside an app context.
+        Whatever dict it returns is merged into the job status; an exception
+        marks the job failed (message kept only for ``JobError``).
+        """
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        if self.workers:
+            try:
+                self._executor().submit(self._run, job, fn, args, kwargs)
+                return job
+            except RuntimeError:  # pool já encerrado (shutdown do processo)
+                log.warning("job runner: pool encerrado, executando %s na requisição", kind)
+        self._run(job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict) -> None:
+        job.status = RUNNING
+        try:
+            with self.app.app_context():
+                result = fn(*args, **kwargs)
+            job.result = result if isinstance(result, dict) else None
+            job.status = DONE
+            self.completed += 1
+        except Exception as exc:
+            job.error = (str(exc) or None) if isinstance(exc, JobError) else None  # detalhe só no log
+            job.status = FAILED
+            self.failed += 1
+            log.exception("job runner: %s %s falhou", job.kind, job.id)
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_RETENTION_S
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if len(self._jobs) > MAX_JOBS or (job.finished_at and job.finished_at < cutoff):
+                del self._jobs[job_id]
+            elif len(self._jobs) <= MAX_JOBS:
+                break  # ordem de criação: o resto é mais novo
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Job | None:
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if not j.done.is_set())
+        return {"workers": self.workers, "pending": pending, "completed": self.completed, "failed": self.failed}
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> JobRunner:
+    runner = JobRunner(app, workers=int(app.config.get("BACKGROUND_JOB_WORKERS", 2)))
+    app.extensions[EXT_KEY] = runner
+    atexit.register(runner.shutdown, False)
+    return runner
+
+
+def get_runner() -> JobRunner:
+    return current_app.extensions[EXT_KEY]
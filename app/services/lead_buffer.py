@@ -0,0 +1,239 @@
+"""
+Write-behind buffer for CRM leads captured by the public search.
+
+``record()`` only merges the contact into an in-memory dict and returns; a
+daemon thread flushes the buffer every ``LEAD_BUFFER_INTERVAL`` seconds (or
+as soon as ``LEAD_BUFFER_MAX`` contacts are waiting) with one SELECT per
+tenant and a single commit, upserting on tenant + email, then tenant + phone
+– the same matching rules the search route used inline.
+
+Repeated searches by the same contact between two flushes coalesce into one
+write. Values are trimmed to the column sizes before they are buffered, so
+one oversized field cannot fail the batch. If a tenant's batch still fails,
+its contacts are retried one by one and whatever could not be written goes
+back into the buffer for the next flush (up to ``MAX_ATTEMPTS`` flushes).
+Leads are best effort: a hard crash may lose the last few seconds of
+buffered contacts, which is the trade-off for keeping them off the request.
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.extensions import db
+from app.models import Lead
+
+EXT_KEY = "lead_buffer"
+_FIELDS = ("name", "email", "phone", "pickup_airport", "dropoff_airport", "pickup_dt", "dropoff_dt")
+_DATES = ("pickup_dt", "dropoff_dt")
+_LIMITS = {f: getattr(Lead.__table__.c[f].type, "length", None) for f in _FIELDS if f not in _DATES}
+MAX_ATTEMPTS = 3  # flushes que um contato pode falhar antes de ser descartado
+
+
+def _fit(field: str, value):
+    """Value as the column takes it: trimmed strings, datetimes only; None when unusable."""
+    if value is None:
+        return None
+    if field in _DATES:
+        return value if isinstance(value, datetime) else None
+    value = str(value).strip()
+    limit = _LIMITS.get(field)
+    return (value[:limit] if limit else value) or None
+
+
+def _clean(data: dict) -> dict:
+    return {f: _fit(f, data.get(f)) for f in _FIELDS if data.get(f) is not None}
+
+
+def _contact_key(tenant_id: int, data: dict):
+    email = (data.get("email") or "").strip()
+    if email:
+        return (tenant_id, "email", email)
+    phone = (data.get("phone") or "").strip()
+    if phone:
+        return (tenant_id, "phone", phone)
+    return None  # só nome: cada busca vira um lead, como antes
+
+
+def _merge(into: dict, data: dict) -> dict:
+    for field in _FIELDS:
+        if data.get(field):
+            into[field] = data[field]
+    return into
+
+
+def _apply(lead: Lead, data: dict) -> None:
+    """Update an existing lead; empty values never erase what we have."""
+    for field in _FIELDS:
+        value = _fit(field, data.get(field))
+        if value:
+            setattr(lead, field, value)
+
+
+class LeadBuffer:
+    def __init__(self, app=None, *, interval: float = 2.0, max_pending: int = 200, autostart: bool = True):
+        self.app = app
+        self.interval = interval
+        self.max_pending = max_pending
+        self.autostart = autostart
+        self._pending: dict = {}
+        self._anonymous: list[tuple[int, dict]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.flushed = 0
+        self.failed = 0
+
+    # ---------- lado do request ----------
+    def record(self, tenant_id: int, **data) -> None:
+        data = _clean(data)
+        key = _contact_key(tenant_id, data)
+        with self._lock:
+            if key is None:
+                self._anonymous.append((tenant_id, dict(data)))
+            else:
+                _merge(self._pending.setdefault(key, {}), data)
+            size = len(self._pending) + len(self._anonymous)
+        if size >= self.max_pending:
+            self._wake.set()
+        self._ensure_worker()
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._anonymous)
+
+    # ---------- flush ----------
+    def _drain(self) -> dict[int, list[dict]]:
+        with self._lock:
+            pending, anonymous = self._pending, self._anonymous
+            self._pending, self._anonymous = {}, []
+        by_tenant: dict[int, list[dict]] = {}
+        for (tenant_id, _kind, _value), data in pending.items():
+            by_tenant.setdefault(tenant_id, []).append(data)
+        for tenant_id, data in anonymous:
+            by_tenant.setdefault(tenant_id, []).append(data)
+        return by_tenant
+
+    def _requeue(self, tenant_id: int, data: dict) -> None:
+        """Put back an entry that was not written; what arrived since the drain wins."""
+        attempts = data.get("_attempts", 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            self.failed += 1
+            self._log("CRM lead dropped after %s failed flushes (tenant %s)", attempts, tenant_id)
+            return
+        entry = dict(data, _attempts=attempts)
+        key = _contact_key(tenant_id, entry)
+        with self._lock:
+            if key is None:
+                self._anonymous.append((tenant_id, entry))
+            else:
+                self._pending[key] = _merge(entry, self._pending.get(key, {}))
+
+    def _log(self, msg: str, *args, exc_info: bool = False) -> None:
+        if self.app is not None:
+            self.app.logger.error(msg, *args, exc_info=exc_info)
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Needs an app context."""
+        by_tenant = self._drain()
+        written = 0
+        for tenant_id, entries in by_tenant.items():
+            try:
+                written += self._upsert_tenant(tenant_id, entries)
+                db.session.commit()
+                continue
+            except Exception:
+                db.session.rollback()
+                self._log("CRM lead capture failed for tenant %s; retrying one by one", tenant_id, exc_info=True)
+            # lote do tenant falhou: um contato por transação, o que falhar volta para o buffer
+            for data in entries:
+                try:
+                    written += self._upsert_tenant(tenant_id, [data])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self._requeue(tenant_id, data)
+        self.flushed += written
+        return written
+
+    @staticmethod
+    def _upsert_tenant(tenant_id: int, entries: list[dict]) -> int:
+        emails = {e["email"] for e in entries if e.get("email")}
+        phones = {e["phone"] for e in entries if e.get("phone")}
+        by_email: dict[str, Lead] = {}
+        by_phone: dict[str, Lead] = {}
+        if emails or phones:
+            conds = []
+            if emails:
+                conds.append(Lead.email.in_(emails))
+            if phones:
+                conds.append(Lead.phone.in_(phones))
+            rows = (
+                Lead.query
+                .filter(Lead.tenant_id == tenant_id, or_(*conds))
+                .order_by(Lead.created_at.desc())
+                .all()
+            )
+            # mais recente primeiro: setdefault mantém o lead mais novo por contato
+            for lead in rows:
+                if lead.email:
+                    by_email.setdefault(lead.email, lead)
+                if lead.phone:
+                    by_phone.setdefault(lead.phone, lead)
+
+        for data in entries:
+            existing = by_email.get(data.get("email")) if data.get("email") else None
+            if existing is None and data.get("phone"):
+                existing = by_phone.get(data["phone"])
+            if existing is None:
+                existing = Lead(tenant_id=tenant_id, stage="new")
+                db.session.add(existing)
+            _apply(existing, data)
+            if existing.email:
+                by_email.setdefault(existing.email, existing)
+            if existing.phone:
+                by_phone.setdefault(existing.phone, existing)
+        return len(entries)
+
+    # ---------- worker ----------
+    def _ensure_worker(self) -> None:
+        if not self.autostart or self.app is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="lead-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush_in_context()
+
+    def flush_in_context(self) -> int:
+        if self.app is None or not len(self):
+            return 0
+        with self.app.app_context():
+            return self.flush()
+
+
+def init_app(app) -> LeadBuffer:
+    buf = LeadBuffer(
+        app,
+        interval=float(app.config.get("LEAD_BUFFER_INTERVAL", 2)),
+        max_pending=int(app.config.get("LEAD_BUFFER_MAX", 200)),
+        autostart=not app.config.get("TESTING", False),
+    )
+    app.extensions[EXT_KEY] = buf
+    atexit.register(buf.flush_in_context)
+    return buf
+
+
+def get_buffer() -> LeadBuffer:
+    return current_app.extensions[EXT_KEY]
@@ -0,0 +1,577 @@
+"""
+Persistent e-mail outbox.
+
+Every message sent through ``app/services/mailer.py`` becomes an
+``EmailOutbox`` row and the request moves on; SMTP/ACS round trips happen in
+a small thread pool owned by this module. The mailer API commits the row at
+once – and with it whatever else is pending on the caller's session – so a
+later rollback does not unsend it; code that must tie a message to its own
+transaction calls ``enqueue(..., commit=False)`` and commits itself:
+
+  * rows are *claimed* with a conditional UPDATE (``pending`` → ``sending``),
+    so several gunicorn workers can poll the same table without sending a
+    message twice; a row stuck in ``sending`` (process died mid-send) goes
+    back to ``pending`` after ``STALE_AFTER``;
+  * failures are retried with exponential backoff (``MAIL_OUTBOX_BACKOFF``
+    seconds, doubling, capped at one hour) up to ``MAIL_OUTBOX_MAX_ATTEMPTS``;
+    then – or at once for permanent SMTP 5xx/refused recipients – the row is
+    dead-lettered (``dead``) with the last error kept for inspection;
+  * a token bucket per tenant (``MAIL_RATE_PER_MINUTE``) keeps one tenant's
+    burst from starving everyone else: rate-limited tenants are simply left
+    out of the next claim. The bucket is per process;
+  * campaign rows (``campaign_id``, see app/services/crm_campaigns.py) are
+    claimed only after the transactional mail that is due;
+  * ACS sends are not waited on: the worker only submits the message and
+    stores the operation id (``accepted``); later passes look the operation
+    up (``ACCEPTED_RECHECK`` apart, growing with age) and settle the row as
+    ``sent`` or ``dead``. A row with no verdict after ``ACCEPTED_TIMEOUT`` is
+    dead-lettered.
+
+Attachments are files on disk referenced by path (bytes handed to the mailer
+are spooled under ``instance/mail_outbox/``); spooled copies are removed once
+the message is sent. The worker wakes up right after a commit that queued
+mail and otherwise polls every ``MAIL_OUTBOX_POLL_INTERVAL`` seconds; every
+``CAMPAIGN_RESUME_EVERY`` seconds it also finishes queuing campaigns whose
+recipient job was lost (``crm_campaigns.resume_stale()``).
+``MAIL_OUTBOX_WORKERS=0`` leaves this process enqueue-only.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+from flask import current_app
+from sqlalchemy import event, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import EmailOutbox, Tenant
+
+EXT_KEY = "mail_outbox"
+_SESSION_KEY = "mail_outbox.queued"
+SPOOL_DIRNAME = "mail_outbox"
+STALE_AFTER = timedelta(minutes=10)
+MAX_BACKOFF_S = 3600
+ACCEPTED_RECHECK = (5.0, 60.0)  # s: primeira consulta / intervalo máximo entre consultas
+ACCEPTED_TIMEOUT = timedelta(hours=1)
+CAMPAIGN_RESUME_EVERY = 60.0  # s entre buscas por campanhas presas em "preparing"
+log = logging.getLogger(__name__)
+
+PENDING, SENDING, ACCEPTED, SENT, SKIPPED, DEAD = "pending", "sending", "accepted", "sent", "skipped", "dead"
+
+
+# =========================
+# Fila (lado do request)
+# =========================
+def spool(filename: str, content: bytes, mimetype: str | None = None) -> dict:
+    """Write attachment bytes under instance/mail_outbox/ and return its outbox reference."""
+    folder = Path(current_app.instance_path) / SPOOL_DIRNAME
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{uuid.uuid4().hex}_{os.path.basename(filename) or 'anexo'}"
+    path.write_bytes(content)
+    return {"filename": filename, "mimetype": mimetype, "path": str(path), "spooled": True}
+
+
+def enqueue(
+    *,
+    to: str,
+    subject: str,
+    html: str = "",
+    text_alt: str = "",
+    tenant_id: int | None = None,
+    channel: str = "auto",
+    kind: str | None = None,
+    attachments: list[dict] | None = None,
+    campaign_id: int | None = None,
+    commit: bool = True,
+) -> EmailOutbox:
+    """
+    Queue a message. ``channel``: ``tenant`` (tenant SMTP), ``platform``
+    (ACS → platform SMTP) or ``auto`` (tenant, falling back to platform).
+    With ``commit=False`` it goes out with the caller's own commit.
+    """
+    row = EmailOutbox(
+        tenant_id=tenant_id,
+        channel=channel,
+        kind=kind,
+        to_addr=(to or "").strip(),
+        subject=subject or "",
+        html=html or "",
+        text_alt=text_alt or "",
+        attachments=attachments or None,
+        campaign_id=campaign_id,
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(row)
+    if commit:
+        db.session.commit()
+    return row
+
+
+def enqueue_many(rows: list[dict]) -> int:
+    """
+    Bulk insert of already rendered messages (keys as in ``enqueue``: to,
+    subject, html, text_alt, tenant_id, channel, kind, campaign_id). No ORM
+    objects are built; the caller commits.
+    """
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    db.session.execute(insert(EmailOutbox), [
+        {
+            "tenant_id": r.get("tenant_id"),
+            "channel": r.get("channel") or "auto",
+            "kind": r.get("kind"),
+            "to_addr": (r["to"] or "").strip(),
+            "subject": r.get("subject") or "",
+            "html": r.get("html") or "",
+            "text_alt": r.get("text_alt") or "",
+            "campaign_id": r.get("campaign_id"),
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for r in rows
+    ])
+    db.session.info[_SESSION_KEY] = True  # acorda o worker no commit
+    return len(rows)
+
+
+# =========================
+# Rate limit por tenant
+# =========================
+class TenantRateLimiter:
+    """Token bucket per tenant (``None`` = platform mail without a tenant)."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = max(0, int(per_minute))
+        self._buckets: dict[int | None, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now: float) -> float:
+        tokens, last = self._buckets.get(key, (float(self.per_minute), now))
+        return min(float(self.per_minute), tokens + (now - last) * self.per_minute / 60.0)
+
+    def acquire(self, key) -> bool:
+        if not self.per_minute:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+    def refund(self, key) -> None:
+        if not self.per_minute:
+            return
+        with self._lock:
+            tokens, last = self._buckets.get(key, (0.0, time.monotonic()))
+            self._buckets[key] = (min(float(self.per_minute), tokens + 1), last)
+
+    def limited(self) -> set:
+        if not self.per_minute:
+            return set()
+        now = time.monotonic()
+        with self._lock:
+            return {key for key in self._buckets if self._tokens(key, now) < 1}
+
+
+def _is_permanent(exc: Exception) -> bool:
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(exc, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+# =========================
+# Worker
+# =========================
+class MailOutbox:
+    def __init__(
+        self,
+        app=None,
+        *,
+        workers: int = 2,
+        poll_interval: float = 5.0,
+        batch: int = 20,
+        max_attempts: int = 6,
+        backoff: float = 30.0,
+        rate_per_minute: int = 60,
+        autostart: bool = True,
+        deliver: Callable[..., bool] | None = None,
+        resolve: Callable[[str], tuple[str, str | None]] | None = None,
+    ):
+        self.app = app
+        self.workers = max(0, int(workers))
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.limiter = TenantRateLimiter(rate_per_minute)
+        self.autostart = autostart
+        self._deliver = deliver
+        self._resolve = resolve
+        self._pool: ThreadPoolExecutor | None = None
+        self._thread: threading.Thread | None = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._campaigns_checked: float | None = None
+        self.sent = 0
+        self.accepted = 0
+        self.retried = 0
+        self.dead = 0
+
+    @property
+    def deliver(self) -> Callable[..., bool]:
+        if self._deliver is None:
+            from app.services import mailer
+            return mailer.deliver
+        return self._deliver
+
+    @property
+    def resolve(self) -> Callable[[str], tuple[str, str | None]]:
+        if self._resolve is None:
+            from app.services import mailer
+            return mailer.acs_operation_status
+        return self._resolve
+
+    # ---------- claim ----------
+    def claim(self, limit: int) -> list[int]:
+        """Mark up to ``limit`` due rows as ``sending`` for this process. Needs an app context."""
+        now = datetime.utcnow()
+        # quem morreu no meio do envio volta para a fila
+        db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.status == SENDING, EmailOutbox.locked_at < now - STALE_AFTER)
+            .values(status=PENDING, locked_at=None)
+        )
+
+        q = db.session.query(EmailOutbox.id, EmailOutbox.tenant_id).filter(
+            EmailOutbox.status == PENDING, EmailOutbox.next_attempt_at <= now,
+        )
+        limited = self.limiter.limited()
+        if limited:
+            ids = [k for k in limited if k is not None]
+            if ids:
+                q = q.filter(or_(EmailOutbox.tenant_id.is_(None), EmailOutbox.tenant_id.notin_(ids)))
+            if None in limited:
+                q = q.filter(EmailOutbox.tenant_id.isnot(None))
+        # transacional antes de campanha; dentro de cada grupo, o mais antigo primeiro
+        candidates = q.order_by(
+            EmailOutbox.campaign_id.isnot(None), EmailOutbox.next_attempt_at, EmailOutbox.id,
+        ).limit(limit * 2).all()
+
+        claimed: list[int] = []
+        for row_id, tenant_id in candidates:
+            if len(claimed) >= limit:
+                break
+            if not self.limiter.acquire(tenant_id):
+                continue
+            res = db.session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == row_id, EmailOutbox.status == PENDING)
+                .values(status=SENDING, locked_at=now)
+            )
+            if res.rowcount == 1:
+                claimed.append(row_id)
+            else:  # outro processo pegou antes
+                self.limiter.refund(tenant_id)
+        db.session.commit()
+        return claimed
+
+    # ---------- envio ----------
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(MAX_BACKOFF_S, self.backoff * (2 ** max(0, attempts - 1)))
+        return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+    @staticmethod
+    def _attachments(row: EmailOutbox) -> list[tuple[str, bytes, str]]:
+        out = []
+        for att in row.attachments or []:
+            try:
+                out.append((att["filename"], Path(att["path"]).read_bytes(), att.get("mimetype") or "application/octet-stream"))
+            except OSError:
+                log.warning("mail outbox: anexo %s sumiu (id=%s); enviando sem ele", att.get("path"), row.id)
+        return out
+
+    @staticmethod
+    def _drop_spool(row: EmailOutbox) -> None:
+        for att in row.attachments or []:
+            if att.get("spooled"):
+                Path(att["path"]).unlink(missing_ok=True)
+
+    def send(self, row_id: int) -> str:
+        """Deliver one claimed row and record the outcome. Needs an app context."""
+        row = db.session.get(EmailOutbox, row_id)
+        if row is None or row.status != SENDING:
+            return row.status if row is not None else DEAD
+        tenant = db.session.get(Tenant, row.tenant_id) if row.tenant_id else None
+        now = datetime.utcnow()
+        row.attempts = (row.attempts or 0) + 1
+        try:
+            ok = self.deliver(
+                channel=row.channel, tenant=tenant, to=row.to_addr, subject=row.subject,
+                html=row.html or "", text_alt=row.text_alt or "", attachments=self._attachments(row),
+                wait=False,
+            )
+        except Exception as exc:
+            row.last_error = (str(exc) or exc.__class__.__name__)[:2000]
+            if _is_permanent(exc) or row.attempts >= self.max_attempts:
+                row.status = DEAD
+                self.dead += 1
+                log.error("mail outbox: id=%s to=%s morto após %s tentativa(s): %s",
+                          row.id, row.to_addr, row.attempts, row.last_error)
+            else:
+                row.status = PENDING
+                row.next_attempt_at = now + self._backoff(row.attempts)
+                self.retried += 1
+                log.warning("mail outbox: id=%s to=%s falhou (tentativa %s), nova tentativa às %s: %s",
+                            row.id, row.to_addr, row.attempts, row.next_attempt_at, row.last_error)
+        else:
+            op_id = getattr(ok, "operation_id", None)
+            if op_id:  # ACS aceitou; o resultado vem em check()
+                row.status = ACCEPTED
+                row.provider_op_id = op_id
+                row.accepted_at = now
+                row.next_attempt_at = now + timedelta(seconds=ACCEPTED_RECHECK[0])
+                row.last_error = None
+                self.accepted += 1
+            else:
+                row.status = SENT if ok else SKIPPED  # False = sem provedor configurado (mock)
+                row.sent_at = now if ok else None
+                row.last_error = None if ok else "nenhum provedor de e-mail configurado"
+                self.sent += 1 if ok else 0
+        row.locked_at = None
+        status = row.status
+        db.session.commit()
+        if status in (SENT, SKIPPED, ACCEPTED):
+            self._drop_spool(row)
+        return status
+
+    # ---------- envios aceitos (ACS) ----------
+    def claim_accepted(self, limit: int) -> list[int]:
+        """Rows whose provider status is due for a check; claimed by pushing ``next_attempt_at`` forward."""
+        now = datetime.utcnow()
+        due = (
+            db.session.query(EmailOutbox.id, EmailOutbox.next_attempt_at)
+            .filter(EmailOutbox.status == ACCEPTED, EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(limit)
+            .all()
+        )
+        claimed: list[int] = []
+        for row_id, due_at in due:
+            res = db.session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == row_id, EmailOutbox.status == ACCEPTED, EmailOutbox.next_attempt_at == due_at)
+                .values(next_attempt_at=now + timedelta(seconds=ACCEPTED_RECHECK[1]))
+            )
+            if res.rowcount == 1:
+                claimed.append(row_id)
+        db.session.commit()
+        return claimed
+
+    def check(self, row_id: int) -> str:
+        """Ask the provider about one accepted row and record the verdict. Needs an app context."""
+        row = db.session.get(EmailOutbox, row_id)
+        if row is None or row.status != ACCEPTED:
+            return row.status if row is not None else DEAD
+        now = datetime.utcnow()
+        age = now - (row.accepted_at or now)
+        try:
+            status, error = self.resolve(row.provider_op_id)
+        except Exception as exc:  # falha na consulta não diz nada sobre o envio
+            status, error = "Running", None
+            log.warning("mail outbox: status do id=%s (op=%s) indisponível: %s", row.id, row.provider_op_id, exc)
+
+        if status == "Succeeded":
+            row.status = SENT
+            row.sent_at = now
+            self.sent += 1
+        elif status not in ("NotStarted", "Running"):
+            row.status = DEAD
+            row.last_error = (error or f"ACS: {status}")[:2000]
+            self.dead += 1
+            log.error("mail outbox: id=%s to=%s recusado pelo provedor: %s", row.id, row.to_addr, row.last_error)
+        elif age > ACCEPTED_TIMEOUT:
+            row.status = DEAD
+            row.last_error = "ACS não confirmou o envio a tempo (operation %s)" % row.provider_op_id
+            self.dead += 1
+        else:
+            # ainda em andamento: consulta de novo, espaçando conforme a idade
+            delay = min(ACCEPTED_RECHECK[1], max(ACCEPTED_RECHECK[0], age.total_seconds() / 4))
+            row.next_attempt_at = now + timedelta(seconds=delay)
+        status = row.status
+        db.session.commit()
+        return status
+
+    def _check_in_context(self, row_id: int) -> str:
+        with self.app.app_context():
+            try:
+                return self.check(row_id)
+            except Exception:
+                db.session.rollback()
+                log.exception("mail outbox: erro inesperado ao consultar o id=%s", row_id)
+                return ACCEPTED
+
+    def _send_in_context(self, row_id: int) -> str:
+        with self.app.app_context():
+            try:
+                return self.send(row_id)
+            except Exception:
+                db.session.rollback()
+                log.exception("mail outbox: erro inesperado no id=%s", row_id)
+                return SENDING  # fica "sending" e volta para a fila depois de STALE_AFTER
+
+    def process_once(self) -> int:
+        """
+        Claim one batch, send it and check the accepted sends that are due (in
+        the pool, or inline with ``workers=0``); returns rows handled.
+        """
+        with self.app.app_context():
+            ids = self.claim(self.batch)
+            checks = self.claim_accepted(self.batch)
+        if not ids and not checks:
+            return 0
+        if self.workers:
+            pool = self._executor()
+            list(pool.map(self._send_in_context, ids))
+            list(pool.map(self._check_in_context, checks))
+        else:
+            for row_id in ids:
+                self._send_in_context(row_id)
+            for row_id in checks:
+                self._check_in_context(row_id)
+        return len(ids) + len(checks)
+
+    def resume_campaigns(self) -> int:
+        """Finish queuing campaigns stuck in ``preparing``; returns how many."""
+        from app.services import crm_campaigns
+        with self.app.app_context():
+            return crm_campaigns.resume_stale(self.app)
+
+    def _maybe_resume_campaigns(self) -> None:
+        now = time.monotonic()
+        if self._campaigns_checked is not None and now - self._campaigns_checked < CAMPAIGN_RESUME_EVERY:
+            return
+        self._campaigns_checked = now
+        try:
+            self.resume_campaigns()
+        except Exception:
+            log.exception("mail outbox: falha ao retomar campanhas")
+
+    # ---------- thread ----------
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mail-outbox")
+        return self._pool
+
+    def ensure_worker(self) -> None:
+        if not self.autostart or self.app is None or not self.workers:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+        self.ensure_worker()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._maybe_resume_campaigns()
+            try:
+                busy = self.process_once()
+            except Exception:
+                log.exception("mail outbox: falha ao consultar a fila")
+                busy = 0
+            if busy:
+                continue  # ainda pode haver mais na fila
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "sent": self.sent, "accepted": self.accepted,
+                "retried": self.retried, "dead": self.dead}
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> MailOutbox:
+    outbox = MailOutbox(
+        app,
+        workers=int(app.config.get("MAIL_OUTBOX_WORKERS", 2)),
+        poll_interval=float(app.config.get("MAIL_OUTBOX_POLL_INTERVAL", 5)),
+        max_attempts=int(app.config.get("MAIL_OUTBOX_MAX_ATTEMPTS", 6)),
+        backoff=float(app.config.get("MAIL_OUTBOX_BACKOFF", 30)),
+        rate_per_minute=int(app.config.get("MAIL_RATE_PER_MINUTE", 60)),
+        autostart=not app.config.get("TESTING", False),
+    )
+    app.extensions[EXT_KEY] = outbox
+    app.before_request(outbox.ensure_worker)  # fila que sobrou de antes do restart também sai
+    atexit.register(outbox.shutdown)
+    return outbox
+
+
+def get_outbox() -> MailOutbox:
+    return current_app.extensions[EXT_KEY]
+
+
+# =========================
+# Eventos SQLAlchemy
+# =========================
+@event.listens_for(Session, "after_flush")
+def _collect_queued_mail(session, _flush_context):
+    if any(isinstance(obj, EmailOutbox) for obj in session.new):
+        session.info[_SESSION_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if not session.info.pop(_SESSION_KEY, False):
+        return
+    try:
+        outbox = current_app.extensions.get(EXT_KEY)
+    except RuntimeError:  # commit fora de app context
+        return
+    if outbox is not None:
+        outbox.wake()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        return  # só um SAVEPOINT voltou: o que foi enfileirado fora dele ainda vai para o commit
+    session.info.pop(_SESSION_KEY, None)
@@ -1,10 +1,10 @@
 # app/services/mailer.py
 from __future__ import annotations
 
-import json, os, smtplib, ssl
+import json, os, threading, time, uuid
 from email.message import EmailMessage
 from email.utils import formatdate, make_msgid
-from typing import Optional
+from typing import NamedTuple, Optional
 from flask import current_app, has_app_context
 from email.message import EmailMessage
 
@@ -13,6 +13,7 @@ _ACS_IMPORT_ERR = ""
 try:
     from azure.communication.email import EmailClient
     from azure.core.exceptions import HttpResponseError
+    from azure.core.rest import HttpRequest
     _ACS_AVAILABLE = True
 except Exception as e:
     _ACS_AVAILABLE = False
@@ -36,50 +37,6 @@ def _getenv(key: str, default=None):
 def _as_bool(v) -> bool:
     return str(v).strip().lower() in ("1", "true", "yes", "on")
 
-def send_email_for_tenant_with_attachments(
-    *,
-    tenant,
-    recipients,
-    subject: str,
-    html: str,
-    text_alt: str = "",
-    attachments: list[tuple[str, bytes, str]] | None = None,  # [(filename, content_bytes, mimetype)]
-) -> bool:
-    """
-    Tenta enviar pelo SMTP do tenant com anexos.
-    Se o tenant não tiver SMTP configurado, cai no fluxo automático (plataforma),
-    que envia sem anexos (mas você pode incluir um link no corpo do e-mail).
-    """
-    to = ", ".join(r for r in recipients if r) if isinstance(recipients, (list, tuple, set)) else recipients
-    cfg = get_tenant_mail_creds(tenant)
-    if not cfg:
-        # Sem SMTP do tenant -> usa caminho automático (ACS/SMTP plataforma) sem anexos
-        return send_mail_auto(tenant=tenant, subject=subject, html=html, to=to, text_alt=text_alt)
-
-    from_name  = getattr(tenant, "mail_from_name", None) or getattr(tenant, "name", None) or "Locadora"
-    from_email = getattr(tenant, "mail_from_email", None) or cfg.get("user") or _getenv("EMAIL_FROM") or "no-reply@example.com"
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = f"{from_name} <{from_email}>"
-    msg["To"] = to
-
-    if text_alt:
-        msg.set_content(text_alt)
-    msg.add_alternative(html, subtype="html")
-
-    for filename, content, mtype in (attachments or []):
-        try:
-            maintype, subtype = (mtype.split("/", 1) if (mtype and "/" in mtype) else ("application", "octet-stream"))
-        except Exception:
-            maintype, subtype = ("application", "octet-stream")
-        msg.add_attachment(content, maintype=maintype, subtype=subtype, filename=filename)
-
-    _smtp_send(cfg, msg)
-    _log("info", "[TENANT EMAIL/SMTP] (with attachments) tenant=%s To=%s Subject=%s Attachments=%d",
-         getattr(tenant, 'slug', '?'), to, subject, len(attachments or []))
-    return True
-
 # =============================================================================
 # Cofre DEV (arquivo) — mantido
 # =============================================================================
@@ -89,6 +46,11 @@ os.makedirs(_DEV_DIR, exist_ok=True)
 def _path(alias: str) -> str:
     return os.path.join(_DEV_DIR, f"{alias.replace('/', '_')}.json")
 
+# credenciais em memória: o arquivo só é relido quando muda (stat no máximo a cada _CREDS_CHECK_S)
+_CREDS_CHECK_S = 5.0
+_creds_cache: dict[str, tuple[float, int | None, dict | None]] = {}  # alias -> (checado_em, mtime_ns, cfg)
+_creds_lock = threading.Lock()
+
 def save_tenant_mail_creds(*, tenant, host, port, user, password, use_tls, use_ssl, provider="custom-smtp") -> str:
     alias = tenant.mail_secret_id or f"mail/{tenant.slug}"
     with open(_path(alias), "w", encoding="utf-8") as f:
@@ -96,17 +58,34 @@ def save_tenant_mail_creds(*, tenant, host, port, user, password, use_tls, use_s
             "host": host, "port": int(port or 0), "user": user, "password": password,
             "use_tls": bool(use_tls), "use_ssl": bool(use_ssl), "provider": provider or "custom-smtp",
         }, f)
+    with _creds_lock:
+        _creds_cache.pop(alias, None)
     return alias
 
 def get_tenant_mail_creds(tenant) -> dict | None:
     alias = getattr(tenant, "mail_secret_id", None)
     if not alias:
         return None
+    now = time.monotonic()
+    cached = _creds_cache.get(alias)
+    if cached is not None and now - cached[0] < _CREDS_CHECK_S:
+        return dict(cached[2]) if cached[2] else None
+
     p = _path(alias)
-    if not os.path.isfile(p):
-        return None
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        mtime = os.stat(p).st_mtime_ns
+    except OSError:
+        mtime = None
+    if cached is not None and cached[1] == mtime:
+        cfg = cached[2]
+    elif mtime is None:
+        cfg = None
+    else:
+        with open(p, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    with _creds_lock:
+        _creds_cache[alias] = (now, mtime, cfg)
+    return dict(cfg) if cfg else None
 
 # =============================================================================
 # Plataforma SMTP (mantido)
@@ -174,11 +153,7 @@ def _friendly_acs_error(err: Exception) -> str:
     msg = getattr(err, "message", None) or str(err)
     return f"Falha ao enviar e-mail: {msg}"
 
-def _send_via_acs(*, subject: str, html: str, text: str, to: str, reply_to: str | None = None) -> str:
-    """
-    Envia por ACS (SDK 1.0.x) com payload em dict e mensagens de erro amigáveis.
-    """
-    client = _acs_client()
+def _acs_message(*, subject: str, html: str, text: str, to: str, reply_to: str | None = None) -> dict:
     message = {
         "senderAddress": _EMAIL_FROM,
         "content": {"subject": subject or "", "plainText": text or "", "html": html or ""},
@@ -186,6 +161,15 @@ def _send_via_acs(*, subject: str, html: str, text: str, to: str, reply_to: str
     }
     if reply_to:
         message["replyTo"] = [{"address": reply_to}]
+    return message
+
+def _send_via_acs(*, subject: str, html: str, text: str, to: str, reply_to: str | None = None) -> str:
+    """
+    Envia por ACS (SDK 1.0.x) com payload em dict e mensagens de erro amigáveis.
+    Bloqueia até o ACS concluir a operação (diagnóstico); o outbox usa _submit_via_acs.
+    """
+    client = _acs_client()
+    message = _acs_message(subject=subject, html=html, text=text, to=to, reply_to=reply_to)
     try:
         poller = client.begin_send(message)  # type: ignore
         result = poller.result()
@@ -197,6 +181,50 @@ def _send_via_acs(*, subject: str, html: str, text: str, to: str, reply_to: str
     except Exception as e:
         raise RuntimeError(_friendly_acs_error(e)) from e
 
+# ---- ACS sem bloquear: submete e guarda o operation id; o status é consultado depois ----
+_ACS_API_VERSION = "2023-03-31"
+ACS_RUNNING = ("NotStarted", "Running")
+
+class Accepted(NamedTuple):
+    """deliver(wait=False): o provedor aceitou a mensagem; o resultado final sai por acs_operation_status()."""
+    operation_id: str
+
+def _submit_via_acs(*, subject: str, html: str, text: str, to: str, reply_to: str | None = None) -> str:
+    """
+    Só o POST /emails:send (sem polling). O Operation-Id é nosso, então já o
+    conhecemos antes da resposta; retorna esse id.
+    """
+    client = _acs_client()
+    message = _acs_message(subject=subject, html=html, text=text, to=to, reply_to=reply_to)
+    op_id = str(uuid.uuid4())
+    try:
+        client.begin_send(message, polling=False, headers={"Operation-Id": op_id})  # type: ignore
+    except HttpResponseError as e:  # type: ignore
+        raise RuntimeError(_friendly_acs_error(e)) from e
+    except Exception as e:
+        raise RuntimeError(_friendly_acs_error(e)) from e
+    _log("info", "[PLATFORM EMAIL/ACS] To=%s Subject=%s aceito, OperationId=%s", to, subject, op_id)
+    return op_id
+
+def acs_operation_status(operation_id: str) -> tuple[str, str | None]:
+    """
+    Um GET no status da operação: (status, erro). status ∈ NotStarted, Running,
+    Succeeded, Failed, Canceled; erro já vem no formato amigável.
+    """
+    client = _acs_client()
+    api_version = getattr(getattr(client, "_config", None), "api_version", None) or _ACS_API_VERSION
+    api_version = getattr(api_version, "value", api_version)  # o SDK guarda um enum
+    req = HttpRequest("GET", f"/emails/operations/{operation_id}", params={"api-version": api_version})  # type: ignore
+    resp = client.send_request(req)  # type: ignore
+    resp.raise_for_status()
+    data = resp.json() or {}
+    status = data.get("status") or "Running"
+    error = None
+    if status not in ACS_RUNNING and status != "Succeeded":
+        err = data.get("error") or {}
+        error = _friendly_acs_error(RuntimeError(f"{err.get('code', status)}: {err.get('message', '')}"))
+    return status, error
+
 # =============================================================================
 # SMTP baixo nível
 # =============================================================================
@@ -207,15 +235,9 @@ def _stamp_headers(msg: EmailMessage, from_domain_hint: str | None = None):
     if "Message-ID" not in msg:
         msg["Message-ID"] = make_msgid(domain=from_domain_hint)
 
-def _smtp_send(cfg: dict, msg: EmailMessage):
-    host = (cfg.get("host") or "").strip()
-    port = int(cfg.get("port") or 0)
-    user = (cfg.get("user") or "").strip()
-    password = (cfg.get("password") or "").strip()
-    use_tls = bool(cfg.get("use_tls"))
-    use_ssl = bool(cfg.get("use_ssl"))
-    if not host:
-        raise RuntimeError("SMTP host vazio.")
+def _smtp_send(cfg: dict, msg: EmailMessage, *, pooled: bool = True):
+    """Envia pelo pool de conexões (app/services/smtp_pool.py); pooled=False abre uma sessão só para esta mensagem."""
+    from app.services import smtp_pool
 
     # aplica Date/Message-ID se faltar
     from_domain = None
@@ -225,35 +247,31 @@ def _smtp_send(cfg: dict, msg: EmailMessage):
         from_domain = None
     _stamp_headers(msg, from_domain)
 
-    if use_ssl:
-        ctx = ssl.create_default_context()
-        with smtplib.SMTP_SSL(host, port or 465, context=ctx, timeout=25) as s:
-            if user and password:
-                s.login(user, password)
-            s.send_message(msg)
-    else:
-        with smtplib.SMTP(host, port or 587, timeout=25) as s:
-            s.ehlo()
-            if use_tls:
-                s.starttls(context=ssl.create_default_context()); s.ehlo()
-            if user and password:
-                s.login(user, password)
-            s.send_message(msg)
+    if pooled:
+        smtp_pool.pool.send(cfg, msg)
+        return
+    with smtp_pool.connect(cfg) as s:
+        s.send_message(msg)
 
 # =============================================================================
+# Entrega síncrona (usada pelo worker do outbox – app/services/mail_outbox.py)
 # Envio “plataforma”: ACS → SMTP → MOCK
 #   * Se ACS falhar e NÃO houver SMTP, propaga a mensagem amigável do ACS.
 #   * Se houver SMTP, registra e faz fallback silencioso.
 # =============================================================================
-def send_platform_mail_html(*, subject: str, html: str, to: str, text_alt: str = "") -> bool:
-    # 1) ACS
+def _platform_configured() -> bool:
+    return _acs_enabled() or get_platform_mail_creds() is not None
+
+def _send_platform_now(*, subject: str, html: str, to: str, text_alt: str = "", wait: bool = True) -> bool | Accepted:
+    # 1) ACS (wait=False: só submete e devolve Accepted com o operation id)
     if _acs_enabled():
         try:
-            _send_via_acs(
+            send = _send_via_acs if wait else _submit_via_acs
+            op_id = send(
                 subject=subject, html=html, text=text_alt, to=to,
                 reply_to=_getenv("PLATFORM_REPLY_TO", "support@4ufleet.com"),
             )
-            return True
+            return True if wait else Accepted(op_id)
         except Exception as e:
             cfg = get_platform_mail_creds()
             if cfg:
@@ -283,18 +301,9 @@ def send_platform_mail_html(*, subject: str, html: str, to: str, text_alt: str =
     _log("info", "[PLATFORM EMAIL/SMTP] To=%s Subject=%s", to, subject)
     return True
 
-# =============================================================================
-# Utilitários / tenant / compat
-# =============================================================================
-def send_test_mail(*, cfg: dict, subject: str, body: str, from_name: str, from_email: str, to_email: str):
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = f"{from_name} <{from_email}>"
-    msg["To"] = to_email
-    msg.set_content(body)
-    _smtp_send(cfg, msg)
-
-def send_tenant_mail_html(*, tenant, subject: str, html: str, to: str, text_alt: str = "") -> bool:
+def _send_tenant_now(*, tenant, subject: str, html: str, to: str, text_alt: str = "",
+                     attachments: list[tuple[str, bytes, str]] | None = None) -> bool:
+    """SMTP do tenant (com anexos, se houver). False = tenant sem SMTP configurado."""
     cfg = get_tenant_mail_creds(tenant)
     if not cfg:
         _log("info", "[EMAIL MOCK] (tenant=%s) To=%s Subject=%s", getattr(tenant, 'slug', '?'), to, subject)
@@ -311,22 +320,110 @@ def send_tenant_mail_html(*, tenant, subject: str, html: str, to: str, text_alt:
         msg.set_content(text_alt)
     msg.add_alternative(html, subtype="html")
 
+    for filename, content, mtype in (attachments or []):
+        try:
+            maintype, subtype = (mtype.split("/", 1) if (mtype and "/" in mtype) else ("application", "octet-stream"))
+        except Exception:
+            maintype, subtype = ("application", "octet-stream")
+        msg.add_attachment(content, maintype=maintype, subtype=subtype, filename=filename)
+
     _smtp_send(cfg, msg)
-    _log("info", "[TENANT EMAIL/SMTP] tenant=%s To=%s Subject=%s", getattr(tenant, 'slug', '?'), to, subject)
+    _log("info", "[TENANT EMAIL/SMTP] tenant=%s To=%s Subject=%s Attachments=%d",
+         getattr(tenant, 'slug', '?'), to, subject, len(attachments or []))
+    return True
+
+def deliver(*, channel: str, tenant, to: str, subject: str, html: str, text_alt: str = "",
+            attachments: list[tuple[str, bytes, str]] | None = None, wait: bool = True) -> bool | Accepted:
+    """
+    Envia AGORA (worker do outbox ou diagnóstico). True = enviado; False = nenhum
+    provedor configurado (mock); exceção = falha (o outbox tenta de novo).
+    Com wait=False um envio via ACS volta como Accepted(operation_id) sem esperar o resultado.
+    channel "auto": SMTP do tenant e, se não houver ou falhar, plataforma (sem anexos).
+    """
+    if channel == "platform":
+        return _send_platform_now(subject=subject, html=html, to=to, text_alt=text_alt, wait=wait)
+    if channel == "tenant":
+        return _send_tenant_now(tenant=tenant, subject=subject, html=html, to=to, text_alt=text_alt,
+                                attachments=attachments)
+    if tenant is not None:
+        try:
+            if _send_tenant_now(tenant=tenant, subject=subject, html=html, to=to, text_alt=text_alt,
+                                attachments=attachments):
+                return True
+        except Exception as e:
+            if not _platform_configured():
+                raise
+            _log("error", "Falha SMTP do tenant; tentando plataforma. Err=%s", e)
+    return _send_platform_now(subject=subject, html=html, to=to, text_alt=text_alt, wait=wait)
+
+# =============================================================================
+# Utilitários / tenant / compat
+# =============================================================================
+def send_test_mail(*, cfg: dict, subject: str, body: str, from_name: str, from_email: str, to_email: str):
+    # síncrono de propósito (fora do outbox): a tela de teste precisa do erro real do SMTP
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = f"{from_name} <{from_email}>"
+    msg["To"] = to_email
+    msg.set_content(body)
+    _smtp_send(cfg, msg, pooled=False)
+
+# =============================================================================
+# API pública: tudo vai para o outbox (app/services/mail_outbox.py) e volta na hora.
+# O enqueue faz commit na hora (leva junto o que estiver pendente na sessão de quem chamou).
+# Retorno: True = enfileirado; False = nenhum provedor configurado (só log, como o MOCK de antes).
+# =============================================================================
+def _queue(*, channel: str, tenant, to: str, subject: str, html: str, text_alt: str = "",
+           attachments: list[tuple[str, bytes, str]] | None = None) -> bool:
+    from app.services import mail_outbox
+
+    refs = [mail_outbox.spool(name, content, mtype) for name, content, mtype in (attachments or [])]
+    mail_outbox.enqueue(
+        to=to, subject=subject, html=html, text_alt=text_alt,
+        tenant_id=getattr(tenant, "id", None), channel=channel, attachments=refs,
+    )
     return True
 
+def send_platform_mail_html(*, subject: str, html: str, to: str, text_alt: str = "") -> bool:
+    if not _platform_configured():
+        _log("warning", "[EMAIL MOCK] (platform) To=%s Subject=%s (sem ACS e sem PLATFORM_SMTP_HOST)", to, subject)
+        return False
+    return _queue(channel="platform", tenant=None, to=to, subject=subject, html=html, text_alt=text_alt)
+
+def send_tenant_mail_html(*, tenant, subject: str, html: str, to: str, text_alt: str = "") -> bool:
+    if not get_tenant_mail_creds(tenant):
+        _log("info", "[EMAIL MOCK] (tenant=%s) To=%s Subject=%s", getattr(tenant, 'slug', '?'), to, subject)
+        return False
+    return _queue(channel="tenant", tenant=tenant, to=to, subject=subject, html=html, text_alt=text_alt)
+
 def send_mail_auto(*, tenant, subject: str, html: str, to: str, text_alt: str = "") -> bool:
-    try:
-        if send_tenant_mail_html(tenant=tenant, subject=subject, html=html, to=to, text_alt=text_alt):
-            return True
-    except Exception as e:
-        _log("error", "Falha SMTP do tenant; tentando plataforma. Err=%s", e)
-    try:
-        return bool(send_platform_mail_html(subject=subject, html=html, to=to, text_alt=text_alt))
-    except Exception as e:
-        _log("error", "Falha no envio via plataforma. Err=%s", e)
-    return False
+    if not get_tenant_mail_creds(tenant) and not _platform_configured():
+        _log("warning", "[EMAIL MOCK] (tenant=%s) To=%s Subject=%s (sem SMTP do tenant e sem plataforma)",
+             getattr(tenant, 'slug', '?'), to, subject)
+        return False
+    return _queue(channel="auto", tenant=tenant, to=to, subject=subject, html=html, text_alt=text_alt)
 
 def send_email_for_tenant(tenant, recipients, subject: str, html: str, text_alt: str = "") -> bool:
     to = ", ".join(r for r in recipients if r) if isinstance(recipients, (list, tuple, set)) else recipients
     return send_mail_auto(tenant=tenant, subject=subject, html=html, to=to, text_alt=text_alt)
+
+def send_email_for_tenant_with_attachments(
+    *,
+    tenant,
+    recipients,
+    subject: str,
+    html: str,
+    text_alt: str = "",
+    attachments: list[tuple[str, bytes, str]] | None = None,  # [(filename, content_bytes, mimetype)]
+) -> bool:
+    """
+    SMTP do tenant com anexos; sem SMTP do tenant, a plataforma envia sem anexos
+    (inclua um link no corpo). Os anexos ficam em disco até o envio.
+    """
+    to = ", ".join(r for r in recipients if r) if isinstance(recipients, (list, tuple, set)) else recipients
+    if not get_tenant_mail_creds(tenant) and not _platform_configured():
+        _log("warning", "[EMAIL MOCK] (tenant=%s) To=%s Subject=%s (sem SMTP do tenant e sem plataforma)",
+             getattr(tenant, 'slug', '?'), to, subject)
+        return False
+    return _queue(channel="auto", tenant=tenant, to=to, subject=subject, html=html, text_alt=text_alt,
+                  attachments=attachments)
@@ -0,0 +1,349 @@
+"""
+Queue-backed payment webhook processing.
+
+``payment_webhook()`` used to look the reservation up, lock the vehicle,
+flip statuses and commit inside the provider's request, and did the whole
+thing again for every retry the provider sent. Now the webhook only
+*records* the event and answers 200:
+
+  * each notification becomes a ``PaymentEvent`` row with a unique
+    (provider, tenant, order, status) key, inserted with ``ON CONFLICT DO
+    NOTHING``; a replayed notification is a no-op insert;
+  * a single worker thread per process applies the recorded events. Rows are
+    claimed with a conditional UPDATE (``pending`` → ``processing``) and an
+    event is only eligible when no earlier event of the same reservation is
+    still open, so the transitions of one reservation happen in arrival order
+    even with several gunicorn workers polling the table;
+  * ``apply()`` is idempotent, and a late "pending"/"analysis" does not undo
+    a confirmation or a cancellation; confirming goes through
+    ``booking.confirm()`` (vehicle lock, conflict → under_review);
+  * failures are retried with exponential backoff up to
+    ``PAYMENT_EVENTS_MAX_ATTEMPTS``, then the row is dead-lettered (``dead``)
+    with the error kept; a row stuck in ``processing`` goes back to
+    ``pending`` after ``STALE_AFTER``.
+
+``PAYMENT_EVENTS_WORKER=0`` applies the events inside the webhook request
+(still deduplicated), which is handy in development.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, exists, update
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models import PaymentEvent, Reservation
+from app.services import booking, globalpays
+
+EXT_KEY = "payment_events"
+PROVIDER = "globalpays"
+STALE_AFTER = timedelta(minutes=5)
+MAX_BACKOFF_S = 3600
+log = logging.getLogger(__name__)
+
+PENDING, PROCESSING, DONE, IGNORED, DEAD = "pending", "processing", "done", "ignored", "dead"
+OPEN = (PENDING, PROCESSING)
+
+PAID = frozenset({"approved", "paid", "success", "confirmed", "delivered"})
+FAILED = frozenset({"canceled", "refused", "failed", "error", "aborted"})
+REVIEW = frozenset({"analysis", "under_review", "review", "pending"})
+
+
+# =========================
+# Transições
+# =========================
+def apply(res: Reservation, status: str, *, order_id: str | None = None) -> bool:
+    """
+    Apply a provider payment status to a reservation; True when its status
+    changed. Repeating a status is a no-op. Does not commit.
+    """
+    st = (status or "").lower().strip()
+    before = res.status
+    if st:
+        res.gp_payment_status = st[:32]
+    if order_id and not res.gp_order_id:
+        res.gp_order_id = str(order_id)[:64]
+    if st in PAID:
+        booking.confirm(res)  # lock do veículo; conflito vira under_review
+    elif st in FAILED:
+        res.status = "canceled"
+    elif st in REVIEW and res.status not in ("confirmed", "canceled"):
+        res.status = "under_review"  # "em análise" atrasado não desfaz confirmação/cancelamento
+    return res.status != before
+
+
+# =========================
+# Ingestão (lado do webhook)
+# =========================
+def parse(data: dict) -> tuple[str, int | None, str]:
+    """(order reference, reservation id, status) of a webhook payload."""
+    status = (data.get("status") or "").lower().strip()
+    ref = str(data.get("externalReference") or data.get("reference") or data.get("orderId") or "")
+    if not ref.isdigit():
+        m = re.search(r"RES-(\d+)", data.get("invoice") or "")
+        if m:
+            ref = m.group(1)
+    order_ref = str(data.get("orderId") or data.get("order_id") or ref or "").strip()[:64]
+    return order_ref, (int(ref) if ref.isdigit() else None), status[:32]
+
+
+def _insert_ignoring_duplicates():
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:  # pragma: no cover - só rodamos em Postgres/SQLite
+        raise RuntimeError(f"payment events: dialeto sem ON CONFLICT: {dialect}")
+    return insert(PaymentEvent).on_conflict_do_nothing()
+
+
+def ingest(tenant_id: int, data: dict, *, provider: str = PROVIDER) -> bool:
+    """
+    Record a webhook notification and commit. Returns False when there is
+    nothing to apply or the same (order, status) was already recorded.
+    """
+    order_ref, reservation_id, status = parse(data)
+    if reservation_id is None or not status:
+        return False
+    now = datetime.utcnow()
+    res = db.session.execute(_insert_ignoring_duplicates().values(
+        tenant_id=tenant_id,
+        provider=provider,
+        order_ref=order_ref,
+        status=status,
+        reservation_id=reservation_id,
+        payload=data,
+        state=PENDING,
+        attempts=0,
+        next_attempt_at=now,
+        received_at=now,
+    ))
+    db.session.commit()
+
+    worker = current_app.extensions.get(EXT_KEY)
+    if res.rowcount != 1:
+        if worker is not None:
+            worker.duplicates += 1
+        return False
+    if worker is not None:
+        worker.notify()
+    return True
+
+
+# =========================
+# Worker
+# =========================
+class PaymentEventWorker:
+    def __init__(
+        self,
+        app=None,
+        *,
+        inline: bool = False,
+        poll_interval: float = 5.0,
+        batch: int = 50,
+        max_attempts: int = 8,
+        backoff: float = 10.0,
+        autostart: bool = True,
+    ):
+        self.app = app
+        self.inline = inline
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.autostart = autostart
+        self._thread: threading.Thread | None = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.applied = 0
+        self.unchanged = 0
+        self.ignored = 0
+        self.retried = 0
+        self.dead = 0
+        self.duplicates = 0
+
+    # ---------- claim ----------
+    def claim(self, limit: int) -> list[int]:
+        """
+        Mark up to ``limit`` due events as ``processing``, at most one per
+        reservation and only its oldest open one. Needs an app context.
+        """
+        now = datetime.utcnow()
+        db.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.state == PROCESSING, PaymentEvent.locked_at < now - STALE_AFTER)
+            .values(state=PENDING, locked_at=None)
+        )
+
+        earlier = aliased(PaymentEvent)
+        blocked = exists().where(and_(
+            earlier.tenant_id == PaymentEvent.tenant_id,
+            earlier.reservation_id == PaymentEvent.reservation_id,
+            earlier.state.in_(OPEN),
+            earlier.id < PaymentEvent.id,
+        ))
+        candidates = (
+            db.session.query(PaymentEvent.id)
+            .filter(PaymentEvent.state == PENDING, PaymentEvent.next_attempt_at <= now, ~blocked)
+            .order_by(PaymentEvent.id)
+            .limit(limit)
+            .all()
+        )
+
+        claimed: list[int] = []
+        for (event_id,) in candidates:
+            res = db.session.execute(
+                update(PaymentEvent)
+                .where(PaymentEvent.id == event_id, PaymentEvent.state == PENDING)
+                .values(state=PROCESSING, locked_at=now)
+            )
+            if res.rowcount == 1:
+                claimed.append(event_id)
+        db.session.commit()
+        return claimed
+
+    # ---------- aplicação ----------
+    def _backoff(self, attempts: int) -> timedelta:
+        delay = min(MAX_BACKOFF_S, self.backoff * (2 ** max(0, attempts - 1)))
+        return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+    def process(self, event_id: int) -> str:
+        """Apply one claimed event to its reservation. Needs an app context."""
+        event = db.session.get(PaymentEvent, event_id)
+        if event is None or event.state != PROCESSING:
+            return event.state if event is not None else IGNORED
+        res = Reservation.query.filter_by(tenant_id=event.tenant_id, id=event.reservation_id).first()
+        if res is None:
+            event.state = IGNORED
+            event.result = "reserva não encontrada"
+            self.ignored += 1
+        else:
+            changed = apply(res, event.status, order_id=globalpays.order_id_of(event.payload or {}))
+            event.state = DONE
+            event.result = res.status
+            if changed:
+                self.applied += 1
+            else:
+                self.unchanged += 1
+        event.attempts = (event.attempts or 0) + 1
+        event.processed_at = datetime.utcnow()
+        event.locked_at = None
+        event.last_error = None
+        state = event.state
+        db.session.commit()  # libera o lock do veículo tomado em booking.confirm()
+        return state
+
+    def _fail(self, event_id: int, exc: Exception) -> str:
+        event = db.session.get(PaymentEvent, event_id)
+        if event is None:
+            return IGNORED
+        event.attempts = (event.attempts or 0) + 1
+        event.last_error = (str(exc) or exc.__class__.__name__)[:2000]
+        event.locked_at = None
+        if event.attempts >= self.max_attempts:
+            event.state = DEAD
+            self.dead += 1
+            log.error("payment events: id=%s (reserva %s, %s) morto após %s tentativa(s): %s",
+                      event.id, event.reservation_id, event.status, event.attempts, event.last_error)
+        else:
+            event.state = PENDING
+            event.next_attempt_at = datetime.utcnow() + self._backoff(event.attempts)
+            self.retried += 1
+            log.warning("payment events: id=%s falhou (tentativa %s), nova tentativa às %s: %s",
+                        event.id, event.attempts, event.next_attempt_at, event.last_error)
+        state = event.state
+        db.session.commit()
+        return state
+
+    def _process_in_context(self, event_id: int) -> str:
+        with self.app.app_context():
+            try:
+                return self.process(event_id)
+            except Exception as exc:
+                db.session.rollback()
+                try:
+                    return self._fail(event_id, exc)
+                except Exception:
+                    db.session.rollback()
+                    log.exception("payment events: erro ao registrar falha do id=%s", event_id)
+                    return PROCESSING  # volta para a fila depois de STALE_AFTER
+
+    def process_once(self) -> int:
+        """Claim one batch and apply it in order; returns events handled."""
+        with self.app.app_context():
+            ids = self.claim(self.batch)
+        for event_id in ids:
+            self._process_in_context(event_id)
+        return len(ids)
+
+    # ---------- thread ----------
+    def ensure_worker(self) -> None:
+        if self.inline or not self.autostart or self.app is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="payment-events", daemon=True)
+            self._thread.start()
+
+    def notify(self) -> None:
+        """A new event was committed: apply it now (inline) or wake the thread."""
+        if self.inline:
+            self.process_once()
+            return
+        self._wake.set()
+        self.ensure_worker()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = self.process_once()
+            except Exception:
+                log.exception("payment events: falha ao consultar a fila")
+                busy = 0
+            if busy:
+                continue  # eventos seguintes da mesma reserva ficam elegíveis agora
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {"inline": self.inline, "applied": self.applied, "unchanged": self.unchanged,
+                "ignored": self.ignored, "retried": self.retried, "dead": self.dead,
+                "duplicates": self.duplicates}
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> PaymentEventWorker:
+    worker = PaymentEventWorker(
+        app,
+        inline=not int(app.config.get("PAYMENT_EVENTS_WORKER", 1)),
+        poll_interval=float(app.config.get("PAYMENT_EVENTS_POLL_INTERVAL", 5)),
+        max_attempts=int(app.config.get("PAYMENT_EVENTS_MAX_ATTEMPTS", 8)),
+        backoff=float(app.config.get("PAYMENT_EVENTS_BACKOFF", 10)),
+        autostart=not app.config.get("TESTING", False),
+    )
+    app.extensions[EXT_KEY] = worker
+    app.before_request(worker.ensure_worker)  # eventos que sobraram de antes do restart
+    atexit.register(worker.shutdown)
+    return worker
+
+
+def get_worker() -> PaymentEventWorker:
+    return current_app.extensions[EXT_KEY]
@@ -0,0 +1,172 @@
+"""
+Batch reconciliation of open reservations against the payment provider.
+
+A reservation's payment status only moves when the customer comes back
+through ``payment_return()`` or a webhook arrives (app/services/
+payment_events.py); a lost callback leaves it in pending/under_review for
+good. ``reconcile()`` (CLI: ``python -m app.cli_payments reconcile``) walks
+the open reservations that have a ``gp_order_id`` and asks the provider:
+
+  * reservations are read in keyset pages of ``batch`` rows (``id > last``),
+    so the job never holds a cursor open across commits;
+  * lookups run in a thread pool of ``concurrency`` threads, throttled by a
+    token bucket of ``rate`` lookups/second shared by all threads; they use
+    ``globalpays.consult_order()`` (learned route, pooled session, one token
+    per tenant) and never touch the DB session. The bucket counts lookups,
+    not HTTP requests: a lookup is one GET once the tenant's consult route
+    is learned, while the first one (or one after the route broke) may probe
+    several paths × header styles;
+  * answers are applied in the main thread with ``payment_events.apply()`` –
+    the same idempotent transitions as the webhook – one query to load the
+    page's reservations and one commit per page (``dry_run`` rolls back);
+  * the returned ``Summary`` counts what changed, what was already right,
+    what the provider did not answer and which lookups failed.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable
+
+from app.extensions import db
+from app.models import Reservation, Tenant
+from app.services import globalpays, payment_events
+
+OPEN_STATUSES = ("pending", "pending_payment", "under_review")
+log = logging.getLogger(__name__)
+
+# lookup(tenant_id, creds, order_id) -> dict no formato de globalpays.consult_order ({} = sem resposta)
+Lookup = Callable[[int, dict, str], dict]
+
+
+class RateLimiter:
+    """Blocking token bucket shared by the lookup threads (``per_second`` <= 0 = unlimited); one token per lookup."""
+
+    def __init__(self, per_second: float, *, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.per_second = float(per_second)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = max(1.0, self.per_second)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.per_second <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(max(1.0, self.per_second), self._tokens + (now - self._last) * self.per_second)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.per_second
+            self.sleep(delay)
+
+
+@dataclass
+class Summary:
+    checked: int = 0
+    changed: Counter = field(default_factory=Counter)  # novo status da reserva -> quantidade
+    unchanged: int = 0
+    unanswered: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    dry_run: bool = False
+
+    def as_dict(self) -> dict:
+        return {"checked": self.checked, "changed": dict(self.changed), "unchanged": self.unchanged,
+                "unanswered": self.unanswered, "failed": self.failed, "elapsed": round(self.elapsed, 2),
+                "dry_run": self.dry_run}
+
+
+def _page(after_id: int, size: int, *, tenant_id: int | None, cutoff: datetime) -> list[tuple[int, int, str]]:
+    q = (
+        db.session.query(Reservation.id, Reservation.tenant_id, Reservation.gp_order_id)
+        .filter(
+            Reservation.id > after_id,
+            Reservation.gp_order_id.isnot(None), Reservation.gp_order_id != "",
+            Reservation.status.in_(OPEN_STATUSES),
+            Reservation.created_at <= cutoff,
+        )
+    )
+    if tenant_id is not None:
+        q = q.filter(Reservation.tenant_id == tenant_id)
+    return q.order_by(Reservation.id).limit(size).all()
+
+
+def reconcile(
+    *,
+    tenant_id: int | None = None,
+    older_than: timedelta = timedelta(minutes=15),
+    limit: int | None = None,
+    concurrency: int = 4,
+    rate: float = 5.0,
+    batch: int = 50,
+    dry_run: bool = False,
+    lookup: Lookup | None = None,
+    limiter: RateLimiter | None = None,
+) -> Summary:
+    """
+    Reconcile open reservations created more than ``older_than`` ago (younger
+    ones are still in checkout). Needs an app context; commits per page.
+    """
+    if lookup is None:
+        base = globalpays.api_base()  # lido aqui: as threads de consulta não têm app context
+
+        def lookup(t_id: int, tenant_creds: dict, order_id: str) -> dict:
+            return globalpays.consult_order(t_id, tenant_creds, base, order_id)
+
+    limiter = limiter or RateLimiter(rate)
+    summary = Summary(dry_run=dry_run)
+    cutoff = datetime.utcnow() - older_than
+    creds: dict[int, dict] = {}  # uma leitura de credenciais por tenant na execução
+    started = time.monotonic()
+
+    def _ask(row: tuple[int, int, str]) -> tuple[int, dict | None]:
+        res_id, t_id, order_id = row
+        limiter.wait()
+        try:
+            return res_id, lookup(t_id, creds[t_id], order_id) or {}
+        except Exception:
+            log.exception("reconcile: falha ao consultar pedido %s (reserva %s)", order_id, res_id)
+            return res_id, None
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency)), thread_name_prefix="pay-reconcile") as pool:
+        while limit is None or summary.checked < limit:
+            size = batch if limit is None else min(batch, limit - summary.checked)
+            rows = _page(last_id, size, tenant_id=tenant_id, cutoff=cutoff)
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for t_id in {r[1] for r in rows} - creds.keys():
+                creds[t_id] = globalpays.tenant_creds(db.session.get(Tenant, t_id))
+
+            answers = dict(pool.map(_ask, rows))
+            reservations = {r.id: r for r in Reservation.query.filter(Reservation.id.in_(answers)).all()}
+            for res_id, info in answers.items():
+                summary.checked += 1
+                res = reservations.get(res_id)
+                if info is None:
+                    summary.failed += 1
+                elif not info.get("status") or res is None:
+                    summary.unanswered += 1
+                elif payment_events.apply(res, info["status"], order_id=info.get("order_id")):
+                    summary.changed[res.status] += 1
+                else:
+                    summary.unchanged += 1
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+
+    summary.elapsed = time.monotonic() - started
+    return summary
@@ -24,7 +24,7 @@ def save_tenant_payment_creds(tenant, public_key: str, merchant_code: str, token
         "provider": "globalpay",
     }
 
-    # grava no Key Vault
+    # grava no Key Vault (kv_set_secret também atualiza o cache de segredos deste processo)
     utils.kv_set_secret(alias, json.dumps(payload), tags={"tenant": tenant.slug, "env": env, "provider": "globalpay"})
 
     # guarda só o alias/endpoint no banco
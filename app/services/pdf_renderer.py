@@ -0,0 +1,203 @@
+"""
+WeasyPrint rendering with per-process shared resources.
+
+A bare ``HTML(string=..., base_url=...).write_pdf()`` starts from scratch on
+every document: a new ``FontConfiguration`` (fontconfig scan + @font-face
+downloads), stylesheets parsed again, and every image fetched again from disk
+or over HTTP. The checklist PDF even fetched its own images back from this
+server through ``request.url_root``.
+
+This module keeps, for the lifetime of the process (a web worker or a render
+queue worker):
+  * one ``FontConfiguration``;
+  * named shared stylesheets from ``static/css/pdf/<name>.css``, parsed once
+    and re-parsed only when the file changes;
+  * an ``AssetFetcher`` (WeasyPrint ``url_fetcher``) with an in-memory LRU:
+    local files are keyed by path + mtime, URLs under a mapped local static
+    prefix are read straight from disk, and remote assets (tenant logos on a
+    CDN/blob) are kept for ``remote_ttl`` seconds.
+
+WeasyPrint is imported lazily so the fetcher can be used (and tested)
+without the native Pango libraries.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+from urllib.parse import unquote, urlsplit
+
+SHARED_CSS_DIR = Path(__file__).resolve().parents[2] / "static" / "css" / "pdf"
+
+
+class AssetFetcher:
+    """``url_fetcher`` for WeasyPrint with an LRU of asset bytes."""
+
+    def __init__(
+        self,
+        *,
+        max_items: int = 256,
+        max_bytes: int = 32 * 1024 * 1024,
+        remote_ttl: float = 300.0,
+        fallback: Callable | None = None,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.remote_ttl = remote_ttl
+        self._fallback = fallback
+        self._items: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- cache ----------
+    def _get(self, key) -> dict | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, result = item
+            if expires and expires < time.monotonic():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return result
+
+    def _drop(self, key) -> None:
+        _expires, result = self._items.pop(key)
+        self._size -= len(result["string"])
+
+    def _put(self, key, result: dict, ttl: float = 0) -> None:
+        size = len(result["string"])
+        if size > self.max_bytes // 4:  # arquivo grande não expulsa o resto
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = ((time.monotonic() + ttl) if ttl else 0, result)
+            self._size += size
+            while self._items and (len(self._items) > self.max_items or self._size > self.max_bytes):
+                self._drop(next(iter(self._items)))
+
+    # ---------- fetch ----------
+    def _fetch_file(self, path: Path, url: str) -> dict:
+        st = os.stat(path)  # FileNotFoundError vira erro de recurso no WeasyPrint, como antes
+        key = ("file", str(path), st.st_mtime_ns, st.st_size)
+        result = self._get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        mime, _compression = mimetypes.guess_type(str(path))
+        result = {
+            "string": path.read_bytes(),
+            "mime_type": mime,
+            "encoding": "utf-8" if mime and mime.startswith("text/") else None,
+            "redirected_url": url,
+            "filename": path.name,
+        }
+        self._put(key, result)
+        return result
+
+    def _fetch_remote(self, url: str, timeout: float, ssl_context) -> dict:
+        key = ("url", url)
+        result = self._get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        fallback = self._fallback
+        if fallback is None:
+            from weasyprint.urls import default_url_fetcher as fallback
+        fetched = fallback(url, timeout=timeout, ssl_context=ssl_context)
+        data = fetched.get("string")
+        if data is None and fetched.get("file_obj") is not None:
+            with fetched["file_obj"] as fh:
+                data = fh.read()
+        result = {k: v for k, v in fetched.items() if k not in ("file_obj", "string")}
+        result["string"] = data if isinstance(data, bytes) else (data or "").encode(fetched.get("encoding") or "utf-8")
+        self._put(key, result, ttl=self.remote_ttl)
+        return result
+
+    def fetch(self, url: str, timeout: float = 10, ssl_context=None, *, static_map: dict[str, str] | None = None) -> dict:
+        for prefix, folder in (static_map or {}).items():
+            if url.startswith(prefix):
+                rel = unquote(urlsplit(url).path)[len(urlsplit(prefix).path):]
+                root = Path(folder).resolve()
+                path = (root / rel).resolve()
+                if path.is_relative_to(root) and path.is_file():
+                    return self._fetch_file(path, url)
+        if url.startswith("file:"):
+            return self._fetch_file(Path(unquote(urlsplit(url).path)), url)
+        if url.startswith(("http://", "https://")):
+            return self._fetch_remote(url, timeout, ssl_context)
+        fallback = self._fallback
+        if fallback is None:
+            from weasyprint.urls import default_url_fetcher as fallback
+        return fallback(url, timeout=timeout, ssl_context=ssl_context)  # data: etc.
+
+    def bind(self, static_map: dict[str, str] | None = None) -> Callable:
+        """Callable with WeasyPrint's url_fetcher signature."""
+        def _fetcher(url, timeout=10, ssl_context=None):
+            return self.fetch(url, timeout, ssl_context, static_map=static_map)
+        return _fetcher
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._items), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+# =========================
+# Recursos por processo
+# =========================
+_lock = threading.RLock()
+_font_config = None
+_stylesheets: dict[str, tuple[int, object]] = {}
+fetcher = AssetFetcher()
+
+
+def font_config():
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def shared_stylesheet(name: str):
+    """Parsed ``static/css/pdf/<name>.css``; parsed again only when the file changes."""
+    from weasyprint import CSS
+
+    path = SHARED_CSS_DIR / f"{name}.css"
+    mtime = os.stat(path).st_mtime_ns
+    cached = _stylesheets.get(name)
+    if cached is None or cached[0] != mtime:
+        css = CSS(filename=str(path), font_config=font_config(), url_fetcher=fetcher.bind())
+        cached = _stylesheets[name] = (mtime, css)
+    return cached[1]
+
+
+def render_pdf(
+    html: str,
+    base_url: str | None = None,
+    *,
+    stylesheets: tuple[str, ...] = (),
+    static_map: dict[str, str] | None = None,
+) -> bytes:
+    """
+    HTML → PDF bytes with the shared font configuration, stylesheets and
+    fetcher. ``static_map`` maps absolute URL prefixes (e.g. this app's own
+    ``http://host/static/``) to local folders, so they never go over HTTP.
+    """
+    from weasyprint import HTML
+
+    # FontConfiguration/fontconfig não são thread-safe: um render por vez no processo
+    with _lock:
+        doc = HTML(string=html, base_url=base_url, url_fetcher=fetcher.bind(static_map))
+        sheets = [shared_stylesheet(name) for name in stylesheets]
+        return doc.write_pdf(stylesheets=sheets or None, font_config=font_config())
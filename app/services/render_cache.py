@@ -0,0 +1,81 @@
+"""
+Fingerprints for rendered PDFs.
+
+A PDF produced from HTML is fully determined by that HTML (template version
+and every context value end up in it) plus the base URL used for assets. The
+render queue stores, next to each PDF, a small sidecar with that fingerprint
+and the PDF's own sha256::
+
+    contrato_reserva_42.pdf
+    contrato_reserva_42.pdf.meta.json   {"fingerprint": "...", "sha256": "...", "size": 12345}
+
+Callers render the (cheap, cached-template) HTML, compute ``fingerprint()``
+and ask ``current_digest()``: a match means the file on disk is exactly what
+would be rendered now, and its digest is known without re-reading the PDF.
+A mismatch means the data changed and the PDF must be rendered again.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from hashlib import sha256
+from pathlib import Path
+
+META_SUFFIX = ".meta.json"
+
+
+def fingerprint(html: str, base_url: str | None = None) -> str:
+    h = sha256()
+    h.update((base_url or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update((html or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+def meta_path(pdf_path: Path) -> Path:
+    pdf_path = Path(pdf_path)
+    return pdf_path.with_name(pdf_path.name + META_SUFFIX)
+
+
+def read_meta(pdf_path: Path) -> dict | None:
+    try:
+        with open(meta_path(pdf_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(pdf_path: Path, fp: str, pdf_bytes: bytes) -> str:
+    """Record the fingerprint of a freshly written PDF; returns its sha256."""
+    digest = sha256(pdf_bytes).hexdigest()
+    path = meta_path(pdf_path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps({"fingerprint": fp, "sha256": digest, "size": len(pdf_bytes)}), encoding="utf-8")
+    os.replace(tmp, path)
+    return digest
+
+
+def current_digest(pdf_path: Path, fp: str) -> str | None:
+    """sha256 of the PDF when it exists and was rendered from ``fp``; otherwise None."""
+    meta = read_meta(pdf_path)
+    if not meta or meta.get("fingerprint") != fp or not meta.get("sha256"):
+        return None
+    if not Path(pdf_path).exists():
+        return None
+    return meta["sha256"]
+
+
+def adopt(pdf_path: Path, fp: str) -> str | None:
+    """
+    Attach ``fp`` to a PDF rendered before fingerprints existed (hashing it
+    once), so it keeps being served like before. No-op when a sidecar exists.
+    """
+    if read_meta(pdf_path) is not None:
+        return None
+    try:
+        data = Path(pdf_path).read_bytes()
+    except OSError:
+        return None
+    return write_meta(pdf_path, fp, data)
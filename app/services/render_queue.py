@@ -0,0 +1,253 @@
+"""
+Background HTML → PDF rendering for contracts.
+
+WeasyPrint is CPU bound and takes seconds per contract, so rendering inside
+``view_contract``/``sign_contract`` pinned a gunicorn worker while the
+customer stared at a blank page. The request now only renders the (cheap)
+HTML and hands it to a ``ProcessPoolExecutor``; the PDF bytes come back to a
+callback thread in this process, which writes the file atomically. Only the
+latest job per output path may write, so a re-render started after the
+customer edits their data can never be overwritten by an older one.
+
+A failed render is remembered per path and fingerprint. After
+``max_attempts`` failures of the same data, ``submit()`` stops rendering and
+hands back an already failed job (``RenderFailed``) until ``failure_ttl``
+seconds have passed, so a broken template or WeasyPrint error turns into an
+error page instead of a re-render on every refresh of every open tab.
+
+``CONTRACT_RENDER_WORKERS=0`` renders inline in the caller (old behaviour;
+handy for development and tests). Workers are started with ``spawn`` on the
+first job: forking a threaded web worker that holds DB connections is not
+safe.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from flask import current_app
+
+from app.services import render_cache
+
+EXT_KEY = "render_queue"
+log = logging.getLogger(__name__)
+
+
+def html_to_pdf(html: str, base_url: str | None) -> bytes:
+    """Runs in the worker process (fonts/assets stay loaded between jobs)."""
+    from app.services import pdf_renderer
+
+    return pdf_renderer.render_pdf(html, base_url)
+
+
+class RenderFailed(RuntimeError):
+    """The same contract data failed to render ``max_attempts`` times in a row."""
+
+
+class _Failure(NamedTuple):
+    fingerprint: str | None
+    count: int
+    error: str
+    at: float
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class RenderJob:
+    __slots__ = ("path", "future", "done", "fingerprint")
+
+    def __init__(self, path: Path, future: Future, fingerprint: str | None = None):
+        self.path = path
+        self.future = future
+        self.fingerprint = fingerprint  # ver render_cache.fingerprint()
+        self.done = threading.Event()  # setado depois que o arquivo foi gravado (ou falhou)
+
+    @property
+    def ok(self) -> bool:
+        return self.done.is_set() and self.future.exception() is None
+
+
+class RenderQueue:
+    def __init__(
+        self,
+        workers: int = 2,
+        *,
+        render: Callable[[str, str | None], bytes] = html_to_pdf,
+        max_attempts: int = 3,
+        failure_ttl: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.workers = max(0, int(workers))
+        self.render = render  # precisa ser picklable (roda no processo filho)
+        self.max_attempts = max(1, int(max_attempts))
+        self.failure_ttl = failure_ttl
+        self.clock = clock
+        self._pool: ProcessPoolExecutor | None = None
+        self._jobs: dict[str, RenderJob] = {}
+        self._failures: dict[str, _Failure] = {}  # última falha por arquivo
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.failed = 0
+
+    @property
+    def background(self) -> bool:
+        return self.workers > 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._pool
+
+    def submit(self, path: Path, html: str, base_url: str | None = None, *, fingerprint: str | None = None) -> RenderJob:
+        """
+        Render ``html`` into ``path``. Supersedes any job still running for
+        the same path. Inline mode returns an already finished job. With a
+        ``fingerprint`` the render_cache sidecar is written next to the PDF.
+        """
+        path = Path(path)
+        if self.gave_up(path, fingerprint):
+            fut: Future = Future()
+            fut.set_exception(RenderFailed(self._failures[str(path)].error))
+            job = RenderJob(path, fut, fingerprint)
+            job.done.set()
+            return job
+        if not self.background:
+            return self._render_inline(path, html, base_url, fingerprint)
+
+        try:
+            try:
+                fut = self._executor().submit(self.render, html, base_url)
+            except BrokenProcessPool:  # um worker morreu: recria o pool uma vez
+                self._reset_pool()
+                fut = self._executor().submit(self.render, html, base_url)
+        except (RuntimeError, OSError):
+            log.warning("render queue: pool indisponível, gerando %s na requisição", path, exc_info=True)
+            return self._render_inline(path, html, base_url, fingerprint)
+        job = RenderJob(path, fut, fingerprint)
+        with self._lock:
+            self._jobs[str(path)] = job
+        fut.add_done_callback(lambda _f: self._finish(job))
+        return job
+
+    def _render_inline(self, path: Path, html: str, base_url: str | None, fingerprint: str | None) -> RenderJob:
+        fut: Future = Future()
+        job = RenderJob(path, fut, fingerprint)
+        with self._lock:
+            self._jobs[str(path)] = job
+        try:
+            fut.set_result(self.render(html, base_url))
+        except Exception as exc:
+            fut.set_exception(exc)
+        self._finish(job)
+        return job
+
+    def _finish(self, job: RenderJob) -> None:
+        key = str(job.path)
+        try:
+            with self._lock:
+                current = self._jobs.get(key) is job
+            if not current:
+                return  # outro job mais novo assumiu o arquivo
+            exc = job.future.exception()
+            if exc is not None:
+                self._record_failure(job, exc)
+                log.error("render queue: falha ao gerar %s: %r", job.path, exc)
+                return
+            pdf_bytes = job.future.result()
+            write_atomic(job.path, pdf_bytes)
+            if job.fingerprint:  # depois do PDF: se cair no meio, o fingerprint antigo força novo render
+                render_cache.write_meta(job.path, job.fingerprint, pdf_bytes)
+            with self._lock:
+                self._failures.pop(key, None)
+            self.rendered += 1
+        except Exception as exc:
+            self._record_failure(job, exc)
+            log.exception("render queue: falha ao gravar %s", job.path)
+        finally:
+            with self._lock:
+                if self._jobs.get(key) is job:
+                    del self._jobs[key]
+            job.done.set()
+
+    def _record_failure(self, job: RenderJob, exc: BaseException) -> None:
+        key = str(job.path)
+        with self._lock:
+            self.failed += 1
+            prev = self._failures.get(key)
+            count = prev.count + 1 if prev and prev.fingerprint == job.fingerprint else 1
+            self._failures[key] = _Failure(job.fingerprint, count, repr(exc)[:500], self.clock())
+
+    def gave_up(self, path: Path, fingerprint: str | None = None) -> bool:
+        """True when these data already failed ``max_attempts`` times within ``failure_ttl``."""
+        with self._lock:
+            rec = self._failures.get(str(path))
+        return (
+            rec is not None
+            and rec.fingerprint == fingerprint
+            and rec.count >= self.max_attempts
+            and self.clock() - rec.at < self.failure_ttl
+        )
+
+    def pending(self, path: Path) -> RenderJob | None:
+        with self._lock:
+            return self._jobs.get(str(path))
+
+    def wait(self, path: Path, timeout: float) -> bool:
+        """Wait for the running job of ``path``; True when the file exists afterwards."""
+        job = self.pending(path)
+        if job is not None:
+            job.done.wait(timeout)
+        return Path(path).exists()
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._jobs)
+        return {"workers": self.workers, "pending": pending, "rendered": self.rendered, "failed": self.failed}
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> RenderQueue:
+    queue = RenderQueue(
+        workers=int(app.config.get("CONTRACT_RENDER_WORKERS", 2)),
+        max_attempts=int(app.config.get("CONTRACT_RENDER_MAX_ATTEMPTS", 3)),
+        failure_ttl=float(app.config.get("CONTRACT_RENDER_FAILURE_TTL", 600)),
+    )
+    app.extensions[EXT_KEY] = queue
+    atexit.register(queue.shutdown, False)
+    return queue
+
+
+def get_queue() -> RenderQueue:
+    return current_app.extensions[EXT_KEY]
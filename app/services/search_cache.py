@@ -0,0 +1,255 @@
+"""
+Cache of public search results (vehicle_search.SearchPage), per tenant.
+
+Two tiers:
+  * in-process LRU (bounded, TTL) – always on;
+  * optional shared tier (Redis, ``SEARCH_CACHE_REDIS_URL``) so every worker
+    sees the same entries and the same invalidations.
+
+Invalidation is generation based: each tenant has a counter that is part of
+every key. Committing an insert/update/delete of a Reservation, Vehicle, Rate
+or VehicleCategory bumps the tenant's counter (SQLAlchemy session events), so
+old entries simply stop being reachable and age out of the LRU. The TTL is a
+safety net for writes that bypass the ORM unit of work (bulk UPDATE/DELETE).
+"""
+from __future__ import annotations
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Rate, Reservation, Vehicle, VehicleCategory
+from app.services import vehicle_search
+
+WATCHED_MODELS = (Reservation, Vehicle, Rate, VehicleCategory)
+EXT_KEY = "search_cache"
+_SESSION_KEY = "search_cache_dirty_tenants"
+
+
+class _LocalTier:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _RedisTier:
+    """Shared tier; ``redis`` is imported only when a URL is configured."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "searchcache"):
+        import redis  # dependência opcional
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self.ttl = int(max(ttl, 1))
+        self.prefix = prefix
+
+    def _gen_key(self, tenant_id: int) -> str:
+        return f"{self.prefix}:gen:{tenant_id}"
+
+    def generation(self, tenant_id: int) -> int:
+        return int(self.client.get(self._gen_key(tenant_id)) or 0)
+
+    def bump(self, tenant_id: int) -> int:
+        return int(self.client.incr(self._gen_key(tenant_id)))
+
+    def get(self, key: str):
+        raw = self.client.get(f"{self.prefix}:{key}")
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value) -> None:
+        self.client.set(f"{self.prefix}:{key}", pickle.dumps(value), ex=self.ttl)
+
+
+class SearchCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0, shared: _RedisTier | None = None):
+        self.local = _LocalTier(maxsize, ttl)
+        self.shared = shared
+        self._generations: dict[int, int] = {}
+        self._gen_lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    # ---------- gerações ----------
+    def generation(self, tenant_id: int) -> int:
+        if self.shared is not None:
+            try:
+                return self.shared.generation(tenant_id)
+            except Exception:
+                self.errors += 1
+        return self._generations.get(tenant_id, 0)
+
+    def invalidate(self, tenant_id: int) -> None:
+        with self._gen_lock:
+            self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+        if self.shared is not None:
+            try:
+                self.shared.bump(tenant_id)
+            except Exception:
+                self.errors += 1
+        self.invalidations += 1
+
+    # ---------- leitura/escrita ----------
+    def get_or_compute(self, tenant_id: int, params: tuple, compute):
+        gen = self.generation(tenant_id)
+        key = (tenant_id, gen, params)
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        shared_key = None
+        if self.shared is not None:
+            shared_key = f"{tenant_id}:{gen}:{hashlib.sha1(repr(params).encode()).hexdigest()}"
+            try:
+                value = self.shared.get(shared_key)
+            except Exception:
+                self.errors += 1
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+                return value
+
+        self.misses += 1
+        value = compute()
+        self.local.set(key, value)
+        if shared_key is not None:
+            try:
+                self.shared.set(shared_key, value)
+            except Exception:
+                self.errors += 1
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "shared": self.shared is not None,
+        }
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> SearchCache:
+    shared = None
+    url = app.config.get("SEARCH_CACHE_REDIS_URL")
+    ttl = float(app.config.get("SEARCH_CACHE_TTL", 60))
+    if url:
+        try:
+            shared = _RedisTier(url, ttl)
+        except Exception:
+            app.logger.exception("search cache: shared tier disabled")
+    cache = SearchCache(maxsize=int(app.config.get("SEARCH_CACHE_SIZE", 512)), ttl=ttl, shared=shared)
+    app.extensions[EXT_KEY] = cache
+    return cache
+
+
+def get_cache() -> SearchCache | None:
+    if not current_app.config.get("SEARCH_CACHE_ENABLED", True):
+        return None
+    return current_app.extensions.get(EXT_KEY)
+
+
+def normalize_params(**search_kwargs) -> tuple:
+    """Hashable, order-independent form of the search arguments."""
+    items = []
+    for name, value in sorted(search_kwargs.items()):
+        if name == "category_ids":
+            value = tuple(sorted({int(c) for c in (value or [])}))
+        items.append((name, value))
+    return tuple(items)
+
+
+def cached_search(tenant_id: int, **search_kwargs) -> vehicle_search.SearchPage:
+    """vehicle_search.search_vehicles() behind the tenant cache."""
+    def compute():
+        page = vehicle_search.search_vehicles(tenant_id, **search_kwargs)
+        return page._replace(items=tuple(page.items))
+
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(tenant_id, normalize_params(**search_kwargs), compute)
+
+
+def stats() -> dict:
+    cache = current_app.extensions.get(EXT_KEY)
+    return cache.stats() if cache is not None else {}
+
+
+# =========================
+# Eventos SQLAlchemy
+# =========================
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_tenants(session, _flush_context):
+    tenants = session.info.setdefault(_SESSION_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, WATCHED_MODELS) and obj.tenant_id is not None:
+            tenants.add(obj.tenant_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    tenants = session.info.pop(_SESSION_KEY, None)
+    if not tenants:
+        return
+    try:
+        cache = current_app.extensions.get(EXT_KEY)
+    except RuntimeError:  # commit fora de app context
+        return
+    if cache is not None:
+        for tenant_id in tenants:
+            cache.invalidate(tenant_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        return  # só um SAVEPOINT voltou: o que foi gravado fora dele ainda vai para o commit
+    session.info.pop(_SESSION_KEY, None)
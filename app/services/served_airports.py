@@ -0,0 +1,152 @@
+"""
+Per-tenant "airports served" list, parsed once and kept in memory.
+
+The public search page and the results validation used to read and parse
+``instance/uploads/tenant_settings/<slug>/airports.json`` (and ``mkdir`` the
+folder) on every request. Here each tenant's file becomes a ``ServedAirports``
+value: display labels plus a pre-normalized set for membership checks.
+
+An entry is reloaded only when the file's mtime changes; the ``stat`` itself
+runs at most once per ``SERVED_AIRPORTS_CHECK_INTERVAL`` seconds per tenant.
+``save_tenant_airports`` drops the entry of the current process right away;
+other workers pick the new file up on their next mtime check.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from flask import current_app
+
+_HYPHENS = re.compile(r"[\u2010-\u2015\u2212]")
+DEFAULT_CHECK_INTERVAL = 2.0
+
+
+def normalize(label: str) -> str:
+    """Comparison key: exotic hyphens → '-', trimmed, lowercase."""
+    return _HYPHENS.sub("-", label or "").strip().lower()
+
+
+class ServedAirports(NamedTuple):
+    labels: tuple[str, ...]  # "Nome (IATA) - Cidade", na ordem do arquivo, sem duplicados
+    keys: frozenset[str]     # normalize(label) de cada um
+
+    def serves(self, label: str) -> bool:
+        return bool(label) and normalize(label) in self.keys
+
+
+EMPTY = ServedAirports((), frozenset())
+
+
+def _label_from_dict(d: dict) -> str | None:
+    lbl = (d.get("label") or "").strip()
+    if lbl:
+        return lbl
+    name = (d.get("name") or "").strip()
+    code = (d.get("code") or d.get("iata") or "").strip().upper()
+    city = (d.get("city") or "").strip()
+    if name and code:
+        return f"{name} ({code})" + (f" - {city}" if city else "")
+    return None
+
+
+def parse(data) -> ServedAirports:
+    """
+    Accepts ``{"items": [...]}`` or a bare list; items may be final label
+    strings, dicts with "label", or dicts with "name"/"code"(/"iata")/"city".
+    """
+    if isinstance(data, dict):
+        items = data.get("items") if isinstance(data.get("items"), list) else []
+    elif isinstance(data, list):
+        items = data
+    else:
+        items = []
+
+    labels: list[str] = []
+    seen: set[str] = set()
+    for it in items:
+        if isinstance(it, str):
+            s = it.strip()
+        elif isinstance(it, dict):
+            s = _label_from_dict(it) or ""
+        else:
+            continue
+        if not s:
+            continue
+        s_cmp = _HYPHENS.sub("-", s)  # duplicados só diferem por hífen exótico
+        if s_cmp not in seen:
+            seen.add(s_cmp)
+            labels.append(s)
+    return ServedAirports(tuple(labels), frozenset(k for k in map(normalize, labels) if k))
+
+
+def airports_path(instance_path: str, tenant_slug: str) -> str:
+    return os.path.join(instance_path, "uploads", "tenant_settings", tenant_slug or "default", "airports.json")
+
+
+class _Entry:
+    __slots__ = ("mtime_ns", "checked_at", "value")
+
+    def __init__(self, mtime_ns: int | None, checked_at: float, value: ServedAirports):
+        self.mtime_ns = mtime_ns
+        self.checked_at = checked_at
+        self.value = value
+
+
+_entries: dict[tuple[str, str], _Entry] = {}
+_lock = threading.Lock()
+
+
+def _mtime_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load(path: str) -> ServedAirports:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        return parse(json.loads(raw or "null"))
+    except FileNotFoundError:
+        return EMPTY
+    except Exception:
+        current_app.logger.exception("Falha ao ler airports.json do tenant (%s)", path)
+        return EMPTY
+
+
+def get(instance_path: str, tenant_slug: str, *, check_interval: float | None = None) -> ServedAirports:
+    """Served airports of the tenant; never creates folders."""
+    if check_interval is None:
+        check_interval = float(current_app.config.get("SERVED_AIRPORTS_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL))
+    key = (instance_path, tenant_slug or "default")
+    now = time.monotonic()
+    entry = _entries.get(key)
+    if entry is not None and now - entry.checked_at < check_interval:
+        return entry.value
+
+    path = airports_path(*key)
+    mtime = _mtime_ns(path)
+    if entry is not None and entry.mtime_ns == mtime:
+        entry.checked_at = now
+        return entry.value
+
+    value = EMPTY if mtime is None else _load(path)
+    with _lock:
+        _entries[key] = _Entry(mtime, now, value)
+    return value
+
+
+def invalidate(instance_path: str, tenant_slug: str | None = None) -> None:
+    """Forget one tenant (or every tenant of that instance folder)."""
+    with _lock:
+        if tenant_slug is not None:
+            _entries.pop((instance_path, tenant_slug or "default"), None)
+            return
+        for key in [k for k in _entries if k[0] == instance_path]:
+            del _entries[key]
@@ -0,0 +1,185 @@
+"""
+Stamps a drawn signature onto a contract PDF.
+
+The old loop in ``apply_signature`` decoded the PNG twice, wrote two temp
+PNGs, and for *every* page built a ReportLab canvas, embedded the images
+again and re-parsed the resulting overlay PDF before merging it.
+
+Here the signature is decoded once and resized in memory (ReportLab takes
+the PIL images directly, no temp files). One overlay document is drawn with
+a page per distinct (page size, is-last-page) combination – usually just
+two: "rubric + audit stamp" for all the middle pages and "full signature"
+for the last one. ReportLab stores each image once as an XObject shared by
+those overlay pages. Each overlay page becomes a Form XObject that is drawn
+on top of the contract pages by appending a tiny shared content stream, so
+the contract's own content streams are never parsed and re-serialized (that
+was most of the time spent in ``merge_page``). The signed PDF is written
+straight to the output stream.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas as rl_canvas
+
+
+class StampLayout(NamedTuple):
+    full_w: int = 200
+    full_h: int = 80
+    x_rel: float = 0.62
+    y_rel: float = 0.13
+    rub_w: int = 120
+    rub_h: int = 48
+    rub_margin: int = 20
+    rubric_on_last: bool = False
+    audit: bool = True
+    calibrate: bool = False  # retângulo magenta em volta da assinatura
+
+    @classmethod
+    def from_conf(cls, conf: dict, *, calibrate: bool = False) -> "StampLayout":
+        """From the per-tenant dict built by ``_sign_conf()`` in the public routes."""
+        return cls(
+            full_w=conf["w"], full_h=conf["h"], x_rel=conf["x_rel"], y_rel=conf["y_rel"],
+            rub_w=conf["rub_w"], rub_h=conf["rub_h"], rub_margin=conf["rub_m"],
+            rubric_on_last=conf["rub_on_last"], audit=conf["audit"], calibrate=calibrate,
+        )
+
+
+def _draw_overlay_page(can, w: float, h: float, is_last: bool, layout: StampLayout,
+                       full: ImageReader, rubric: ImageReader, stamp_text: str) -> None:
+    can.setPageSize((w, h))
+
+    # rubrica em todas as páginas, exceto a última (a menos que rubric_on_last)
+    if not is_last or layout.rubric_on_last:
+        can.drawImage(rubric, w - layout.rub_w - layout.rub_margin, layout.rub_margin,
+                      width=layout.rub_w, height=layout.rub_h, mask="auto")
+
+    # carimbo de auditoria (rodapé)
+    if layout.audit:
+        can.setFont("Helvetica", 7)
+        can.drawString(24, 14, stamp_text)
+
+    # assinatura completa somente na última página
+    if is_last:
+        x_full = w * layout.x_rel
+        y_full = h * layout.y_rel
+        if layout.calibrate:
+            can.setStrokeColorRGB(1, 0, 1)
+            can.setLineWidth(1)
+            can.rect(x_full, y_full, layout.full_w, layout.full_h)
+        can.drawImage(full, x_full, y_full, width=layout.full_w, height=layout.full_h, mask="auto")
+    can.showPage()
+
+
+# PyPDF2 3.0 não tem API pública para registrar objetos novos no writer
+def _add_stream(writer: PdfWriter, data: bytes) -> IndirectObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return writer._add_object(stream)
+
+
+def _form_xobject(writer: PdfWriter, overlay_page, w: float, h: float) -> IndirectObject:
+    """The overlay page as a Form XObject (its images stay shared XObjects)."""
+    raw = DecodedStreamObject()
+    raw.set_data(overlay_page.get_contents().get_data())
+    form = raw.flate_encode()  # entradas do dicionário vêm depois: flate_encode não as copia
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(w), FloatObject(h)]),
+        NameObject("/Resources"): overlay_page["/Resources"].clone(writer),
+    })
+    return writer._add_object(form)
+
+
+def _attach_stamp(writer: PdfWriter, page, name: NameObject, form: IndirectObject,
+                  push: IndirectObject, tail: IndirectObject) -> None:
+    """
+    Draw the form on top of the page without parsing its content stream:
+    /Contents becomes [q, <original streams>, Q + "Do" of the form].
+    """
+    contents = page.get("/Contents")
+    parts: list = []
+    if contents is not None:
+        current = contents.get_object()
+        if isinstance(current, ArrayObject):
+            parts = list(current)
+        else:
+            parts = [contents if isinstance(contents, IndirectObject) else writer._add_object(current)]
+    page[NameObject("/Contents")] = ArrayObject([push, *parts, tail])
+
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else None
+    if resources is None:
+        resources = DictionaryObject()
+        page[NameObject("/Resources")] = resources
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        xobjects = DictionaryObject()
+        resources[NameObject("/XObject")] = xobjects
+    else:
+        xobjects = xobjects.get_object()
+    xobjects[name] = form
+
+
+def stamp_signature(
+    base_pdf: str | Path | BinaryIO,
+    signature_png: bytes,
+    out: str | Path | BinaryIO,
+    *,
+    layout: StampLayout = StampLayout(),
+    signed_at: datetime,
+    client_ip: str,
+) -> int:
+    """Write the signed copy of ``base_pdf`` to ``out``; returns the page count."""
+    reader = PdfReader(str(base_pdf) if isinstance(base_pdf, Path) else base_pdf)
+    pages = reader.pages
+    last_idx = len(pages) - 1
+
+    # uma decodificação; os dois tamanhos saem da mesma imagem
+    img = Image.open(BytesIO(signature_png)).convert("RGBA")
+    full = ImageReader(img.resize((layout.full_w, layout.full_h)))
+    rubric = ImageReader(img.resize((layout.rub_w, layout.rub_h)))
+    stamp_text = f"Signed {signed_at:%Y-%m-%d %H:%M UTC} - IP {client_ip}"
+
+    # overlay: uma página por combinação (tamanho, última?) – normalmente só duas
+    keys: list[tuple[float, float, bool]] = []
+    for i, page in enumerate(pages):
+        key = (float(page.mediabox.width), float(page.mediabox.height), i == last_idx)
+        if key not in keys:
+            keys.append(key)
+    packet = BytesIO()
+    can = rl_canvas.Canvas(packet)
+    for w, h, is_last in keys:
+        _draw_overlay_page(can, w, h, is_last, layout, full, rubric, stamp_text)
+    can.save()
+    packet.seek(0)
+    overlay = PdfReader(packet)
+
+    writer = PdfWriter()
+    push = _add_stream(writer, b"q\n")
+    stamps: dict[tuple[float, float, bool], tuple[NameObject, IndirectObject, IndirectObject]] = {}
+    for idx, key in enumerate(keys):
+        name = NameObject(f"/SigStamp{idx}")
+        form = _form_xobject(writer, overlay.pages[idx], key[0], key[1])
+        tail = _add_stream(writer, b"Q\nq %s Do Q\n" % name.encode())
+        stamps[key] = (name, form, tail)
+
+    for i, page in enumerate(pages):
+        key = (float(page.mediabox.width), float(page.mediabox.height), i == last_idx)
+        name, form, tail = stamps[key]
+        _attach_stamp(writer, writer.add_page(page), name, form, push, tail)
+
+    if isinstance(out, (str, Path)):
+        with open(out, "wb") as fh:
+            writer.write(fh)
+    else:
+        writer.write(out)
+    return len(pages)
@@ -0,0 +1,198 @@
+"""
+Pooled SMTP connections keyed by credentials.
+
+``_smtp_send()`` used to open TCP, negotiate TLS and log in for every single
+message – three or four round trips plus the TLS handshake before ``MAIL
+FROM``. The outbox workers now borrow an authenticated connection from this
+pool instead:
+
+  * connections are keyed by (host, port, user, password hash, TLS flags), so
+    every tenant's SMTP account (and the platform's) gets its own idle list;
+  * a connection idle for more than ``noop_after`` seconds is checked with
+    ``NOOP`` before reuse; one idle longer than ``idle_timeout`` is closed;
+  * after ``max_messages`` messages the session is closed and a new one
+    opened (many providers cap messages per session);
+  * if a *reused* connection turns out to be dead while sending, the message
+    is retried once on a fresh connection. A server reply (4xx/5xx) leaves
+    the session usable and is simply raised to the caller.
+
+At most ``max_idle`` connections per key are kept; busy connections are never
+shared between threads.
+"""
+from __future__ import annotations
+
+import atexit
+import smtplib
+import ssl
+import threading
+import time
+from email.message import EmailMessage
+from hashlib import sha256
+from typing import Callable
+
+
+def connect(cfg: dict, timeout: float = 25) -> smtplib.SMTP:
+    """Open and authenticate a session with the same rules the mailer always used."""
+    host = (cfg.get("host") or "").strip()
+    port = int(cfg.get("port") or 0)
+    user = (cfg.get("user") or "").strip()
+    password = (cfg.get("password") or "").strip()
+    if not host:
+        raise RuntimeError("SMTP host vazio.")
+
+    if cfg.get("use_ssl"):
+        s = smtplib.SMTP_SSL(host, port or 465, context=ssl.create_default_context(), timeout=timeout)
+    else:
+        s = smtplib.SMTP(host, port or 587, timeout=timeout)
+    try:
+        if not cfg.get("use_ssl"):
+            s.ehlo()
+            if cfg.get("use_tls"):
+                s.starttls(context=ssl.create_default_context()); s.ehlo()
+        if user and password:
+            s.login(user, password)
+    except Exception:
+        s.close()
+        raise
+    return s
+
+
+class _Conn:
+    __slots__ = ("smtp", "last_used", "sent", "reused")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+        self.reused = False
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        *,
+        max_idle: int = 2,
+        idle_timeout: float = 60.0,
+        noop_after: float = 10.0,
+        max_messages: int = 100,
+        connect: Callable[[dict], smtplib.SMTP] = connect,
+    ):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self._connect = connect
+        self._idle: dict[tuple, list[_Conn]] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def key(cfg: dict) -> tuple:
+        return (
+            (cfg.get("host") or "").strip().lower(),
+            int(cfg.get("port") or 0),
+            (cfg.get("user") or "").strip(),
+            sha256((cfg.get("password") or "").strip().encode("utf-8")).hexdigest(),
+            bool(cfg.get("use_tls")),
+            bool(cfg.get("use_ssl")),
+        )
+
+    @staticmethod
+    def _close(conn: _Conn) -> None:
+        try:
+            conn.smtp.quit()
+        except Exception:
+            try:
+                conn.smtp.close()
+            except Exception:
+                pass
+
+    def _checkout(self, key: tuple, cfg: dict) -> _Conn:
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                break
+            age = time.monotonic() - conn.last_used
+            if age > self.idle_timeout or conn.sent >= self.max_messages:
+                self._close(conn)
+                continue
+            if age > self.noop_after:
+                try:
+                    code = conn.smtp.noop()[0]
+                except Exception:
+                    code = None
+                if code != 250:
+                    self._close(conn)
+                    continue
+            conn.reused = True
+            self.reused += 1
+            return conn
+        conn = _Conn(self._connect(cfg))
+        self.opened += 1
+        return conn
+
+    def _checkin(self, key: tuple, conn: _Conn) -> None:
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_messages:
+            self._close(conn)
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        self._close(conn)
+
+    def send(self, cfg: dict, msg: EmailMessage) -> None:
+        key = self.key(cfg)
+        while True:
+            conn = self._checkout(key, cfg)
+            try:
+                conn.smtp.send_message(msg)
+            except smtplib.SMTPResponseException:
+                self._checkin(key, conn)  # o servidor respondeu: a sessão continua boa
+                raise
+            except smtplib.SMTPRecipientsRefused:
+                self._checkin(key, conn)
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close(conn)
+                if conn.reused:
+                    continue  # conexão reaproveitada caiu: uma nova (fresh) e tenta de novo
+                raise
+            except Exception:
+                self._close(conn)
+                raise
+            conn.sent += 1
+            self._checkin(key, conn)
+            return
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = sum(len(v) for v in self._idle.values())
+            keys = len(self._idle)
+        return {"keys": keys, "idle": idle, "opened": self.opened, "reused": self.reused}
+
+
+# =========================
+# Pool do processo
+# =========================
+pool = SMTPPool()
+atexit.register(pool.close_all)
+
+
+def init_app(app) -> SMTPPool:
+    pool.max_idle = int(app.config.get("SMTP_POOL_MAX_IDLE", 2))
+    pool.idle_timeout = float(app.config.get("SMTP_POOL_IDLE_TIMEOUT", 60))
+    pool.max_messages = int(app.config.get("SMTP_POOL_MAX_MESSAGES", 100))
+    return pool
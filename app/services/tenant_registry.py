@@ -0,0 +1,170 @@
+"""
+Process-wide slug → tenant registry shared by the tenant-scoped blueprints.
+
+Blueprints get an immutable ``TenantSnapshot`` (plain ``__slots__`` object
+with the Tenant columns) instead of running ``Tenant.query.filter_by(slug=…)``
+on every request. Entries live for ``TENANT_CACHE_TTL`` seconds and are
+dropped as soon as a Tenant row is inserted/updated/deleted and committed
+(SQLAlchemy session events), which covers settings, branding, block/unblock
+and signup.
+
+Invalidations reach the other gunicorn workers through a stamp file in the
+instance folder: every lookup compares its mtime (one ``stat``) and clears
+the local entries when it moved. Workers on other hosts converge within the
+TTL.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from flask import abort, current_app, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Tenant
+
+EXT_KEY = "tenant_registry"
+_SESSION_KEY = "tenant_registry_dirty"
+_COLUMNS = tuple(attr.key for attr in Tenant.__mapper__.column_attrs)
+
+
+class TenantSnapshot:
+    """Read-only copy of a Tenant row; safe to share between requests/threads."""
+
+    __slots__ = _COLUMNS
+
+    def __init__(self, tenant: Tenant):
+        for key in _COLUMNS:
+            object.__setattr__(self, key, getattr(tenant, key))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"TenantSnapshot is read-only (tried to set {key!r})")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"TenantSnapshot is read-only (tried to delete {key!r})")
+
+    @property
+    def logo_url(self):
+        if not self.logo_path:
+            return None
+        return url_for("static", filename=self.logo_path)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<TenantSnapshot {self.slug}>"
+
+
+class TenantRegistry:
+    def __init__(self, ttl: float = 30.0, stamp_path: str | None = None):
+        self.ttl = ttl
+        self.stamp_path = stamp_path
+        self._entries: dict[str, tuple[float, TenantSnapshot | None]] = {}
+        self._lock = threading.Lock()
+        self._stamp = self._read_stamp()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_stamp(self) -> int:
+        if not self.stamp_path:
+            return 0
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _sync_with_other_workers(self) -> None:
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                self._entries.clear()
+                self._stamp = stamp
+
+    def get(self, slug: str) -> TenantSnapshot | None:
+        """Snapshot for the slug, or None when no such tenant exists (also cached)."""
+        self._sync_with_other_workers()
+        now = time.monotonic()
+        item = self._entries.get(slug)
+        if item is not None and item[0] > now:
+            self.hits += 1
+            return item[1]
+
+        self.misses += 1
+        tenant = Tenant.query.filter_by(slug=slug).first()
+        snap = TenantSnapshot(tenant) if tenant is not None else None
+        with self._lock:
+            self._entries[slug] = (now + self.ttl, snap)
+        return snap
+
+    def invalidate(self) -> None:
+        """Forget every tenant here and tell the other workers to do the same."""
+        with self._lock:
+            self._entries.clear()
+        if self.stamp_path:
+            try:
+                with open(self.stamp_path, "a"):
+                    pass
+                os.utime(self.stamp_path, None)
+                self._stamp = self._read_stamp()
+            except OSError:
+                current_app.logger.warning("tenant registry: stamp %s not writable", self.stamp_path)
+
+
+# =========================
+# Integração com o app
+# =========================
+def init_app(app) -> TenantRegistry:
+    stamp = app.config.get("TENANT_REGISTRY_STAMP")
+    if stamp is None:
+        os.makedirs(app.instance_path, exist_ok=True)
+        stamp = os.path.join(app.instance_path, "tenant_registry.stamp")
+    registry = TenantRegistry(ttl=float(app.config.get("TENANT_CACHE_TTL", 30)), stamp_path=stamp or None)
+    app.extensions[EXT_KEY] = registry
+    return registry
+
+
+def get_registry() -> TenantRegistry:
+    return current_app.extensions[EXT_KEY]
+
+
+def get_tenant(slug: str) -> TenantSnapshot | None:
+    return get_registry().get(slug)
+
+
+def get_tenant_or_404(slug: str, description: str | None = None) -> TenantSnapshot:
+    snap = get_registry().get(slug)
+    if snap is None:
+        abort(404, description=description)
+    return snap
+
+
+def invalidate() -> None:
+    get_registry().invalidate()
+
+
+# =========================
+# Eventos SQLAlchemy
+# =========================
+@event.listens_for(Session, "after_flush")
+def _collect_tenant_changes(session, _flush_context):
+    if any(isinstance(obj, Tenant) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info[_SESSION_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if not session.info.pop(_SESSION_KEY, False):
+        return
+    try:
+        registry = current_app.extensions.get(EXT_KEY)
+    except RuntimeError:  # commit fora de app context
+        return
+    if registry is not None:
+        registry.invalidate()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        return  # só um SAVEPOINT voltou: o que foi gravado fora dele ainda vai para o commit
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import func, select
+
+from app.extensions import db
+from app.models import Rate, Vehicle, VehicleCategory
+from app.services import availability
+
+SORT_OPTIONS = ("recommended", "price_asc", "price_desc")
+DEFAULT_SEATS = 5
+
+
+class VehicleCard(NamedTuple):
+    """Everything public/results.html shows for one car; no ORM instance behind it."""
+    id: int
+    brand: str | None
+    model: str | None
+    year: int | None
+    image_url: str | None
+    category_name: str
+    seats: int
+    transmission: str | None
+    large_bags: int | None
+    small_bags: int | None
+    mileage_text: str | None
+    daily: float
+    currency: str
+    days: int
+    total: float
+    discount: int | None
+
+
+# colunas do card, numa única projeção (sem carregar Vehicle/VehicleCategory)
+CARD_COLUMNS = (
+    Vehicle.id,
+    Vehicle.brand,
+    Vehicle.model,
+    Vehicle.year,
+    Vehicle.image_url,
+    VehicleCategory.id.label("cat_id"),
+    VehicleCategory.name.label("category_name"),
+    VehicleCategory.seats,
+    VehicleCategory.transmission,
+    VehicleCategory.large_bags,
+    VehicleCategory.small_bags,
+    VehicleCategory.mileage_text,
+    Rate.daily_rate,
+    Rate.currency,
+)
+
+
+def to_card(row, days: int) -> VehicleCard:
+    """Same fallbacks the template always had for vehicles without a category."""
+    has_cat = row.cat_id is not None
+    daily = float(row.daily_rate)
+    return VehicleCard(
+        id=row.id,
+        brand=row.brand,
+        model=row.model,
+        year=row.year,
+        image_url=row.image_url,
+        category_name=row.category_name if has_cat else "",
+        seats=row.seats or DEFAULT_SEATS,
+        transmission=row.transmission if has_cat else "Automatic",
+        large_bags=row.large_bags if has_cat else 1,
+        small_bags=row.small_bags if has_cat else 1,
+        mileage_text=row.mileage_text if has_cat else "Unlimited mileage",
+        daily=daily,
+        currency=row.currency or "USD",
+        days=days,
+        total=daily * days,
+        discount=10 if days >= 7 else None,
+    )
+
+
+class SearchPage(NamedTuple):
+    items: list
+    total: int
+    page: int
+    pages: int
+    per_page: int
+
+
+def _current_rate_ids(tenant_id: int):
+    """One rate per category (the most recent row), as the public pages always used."""
+    return (
+        select(func.max(Rate.id))
+        .where(Rate.tenant_id == tenant_id)
+        .group_by(Rate.category_id)
+    )
+
+
+def seats_expr():
+    # categoria sem lugares definidos (NULL/0) conta como 5, igual ao card
+    return func.coalesce(func.nullif(VehicleCategory.seats, 0), DEFAULT_SEATS)
+
+
+def build_search_stmt(
+    tenant_id: int,
+    *,
+    start_dt: datetime | None = None,
+    end_dt: datetime | None = None,
+    category_ids: Iterable[int] | None = None,
+    seats_min: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+):
+    """
+    Vehicle ⋈ Rate ⋈ VehicleCategory with every filter of the results page
+    pushed into SQL. Selects the card columns; callers add ordering/paging.
+    """
+    stmt = (
+        select(*CARD_COLUMNS)
+        .join(Rate, Rate.category_id == Vehicle.category_id)
+        .outerjoin(VehicleCategory, VehicleCategory.id == Vehicle.category_id)
+        .where(
+            Vehicle.tenant_id == tenant_id,
+            Rate.id.in_(_current_rate_ids(tenant_id)),
+        )
+    )
+    cat_ids = [int(c) for c in (category_ids or [])]
+    if cat_ids:
+        stmt = stmt.where(Vehicle.category_id.in_(cat_ids))
+    if seats_min is not None:
+        stmt = stmt.where(seats_expr() >= seats_min)
+    if min_price is not None:
+        stmt = stmt.where(Rate.daily_rate >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Rate.daily_rate <= max_price)
+    return availability.filter_available(stmt, tenant_id, start_dt, end_dt)
+
+
+def _order_by(stmt, sort: str):
+    if sort == "price_asc":
+        return stmt.order_by(Rate.daily_rate.asc(), Vehicle.model.asc(), Vehicle.id.asc())
+    if sort == "price_desc":
+        return stmt.order_by(Rate.daily_rate.desc(), Vehicle.model.asc(), Vehicle.id.asc())
+    return stmt.order_by(Vehicle.model.asc(), Vehicle.id.asc())
+
+
+def paginate(
+    stmt, *, sort: str = "recommended", page: int = 1, per_page: int = 10, days: int = 1
+) -> SearchPage:
+    """Separate COUNT, clamp the page like the template expects, then LIMIT/OFFSET."""
+    total = db.session.scalar(select(func.count()).select_from(stmt.order_by(None).subquery())) or 0
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), pages)
+    rows = []
+    if total:
+        paged = _order_by(stmt, sort).limit(per_page).offset((page - 1) * per_page)
+        rows = [to_card(row, days) for row in db.session.execute(paged)]
+    return SearchPage(items=rows, total=int(total), page=page, pages=pages, per_page=per_page)
+
+
+def search_vehicles(
+    tenant_id: int,
+    *,
+    start_dt: datetime | None = None,
+    end_dt: datetime | None = None,
+    category_ids: Iterable[int] | None = None,
+    seats_min: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    sort: str = "recommended",
+    page: int = 1,
+    per_page: int = 10,
+    days: int = 1,
+) -> SearchPage:
+    stmt = build_search_stmt(
+        tenant_id,
+        start_dt=start_dt,
+        end_dt=end_dt,
+        category_ids=category_ids,
+        seats_min=seats_min,
+        min_price=min_price,
+        max_price=max_price,
+    )
+    return paginate(stmt, sort=sort, page=page, per_page=per_page, days=days)
@@ -162,6 +162,9 @@ def save_tenant_airports(instance_path: str, tenant_slug: str, airports: list[st
         # keep as a simple JSON array of strings
         clean = [str(x).strip() for x in (airports or []) if str(x).strip()]
         f.write_text(json.dumps(clean, ensure_ascii=False, indent=2), encoding="utf-8")
-        return True
     except Exception:
         return False
+    # drop the public-site cache here; other workers notice the new mtime
+    from app.services import served_airports
+    served_airports.invalidate(instance_path, tenant_slug or "default")
+    return True
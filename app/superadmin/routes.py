@@ -6,14 +6,14 @@ from functools import wraps
 
 from flask import (
     render_template, request, redirect, url_for, flash,
-    session, jsonify, abort, current_app
+    session, jsonify, abort
 )
 from sqlalchemy import func, select, literal, or_
 
-from app.services.mailer import send_platform_mail_html
+from app.services import crm_campaigns, job_runner, search_cache
 
 from app.extensions import db
-from app.models import Tenant, User, Reservation, Payment, SupportMessage, Prospect
+from app.models import Tenant, User, Reservation, Payment, SupportMessage, Prospect, EmailCampaign
 from . import superadmin_bp
 
 # ---------------- Config ----------------
@@ -281,6 +281,12 @@ def api_tenants_series():
         for r in rows
     ])
 
+@superadmin_bp.get("/api/search_cache")
+@require_superadmin
+def api_search_cache():
+    # contadores do cache de buscas públicas deste worker (hit/miss/invalidações)
+    return jsonify(search_cache.stats())
+
 # ---------- CRM: lista ----------
 @superadmin_bp.get("/crm")
 @require_superadmin
@@ -296,7 +302,8 @@ def crm_index():
         qry = qry.filter(Prospect.status == status)
 
     rows = qry.order_by(Prospect.created_at.desc()).limit(500).all()
-    return render_template("superadmin/crm.html", rows=rows, q=q, status=status)
+    campaigns = crm_campaigns.recent(5)
+    return render_template("superadmin/crm.html", rows=rows, q=q, status=status, campaigns=campaigns)
 
 # ---------- CRM: atualizar status ----------
 @superadmin_bp.post("/crm/<int:pid>/status")
@@ -327,49 +334,39 @@ def crm_save_note(pid: int):
 @superadmin_bp.post("/crm/email")
 @require_superadmin
 def crm_bulk_email():
-    ids     = request.form.getlist("ids") or []
+    # o JS antigo mandava "ids[]"; aceita os dois
+    ids     = request.form.getlist("ids") or request.form.getlist("ids[]")
     subject = (request.form.get("subject") or "").strip()
     body    = (request.form.get("body") or "").strip()
+    wants_json = request.accept_mimetypes.best == "application/json"
 
     if not subject or not body:
+        if wants_json:
+            return jsonify(ok=False, error="Informe assunto e conteúdo do e-mail."), 400
         flash("Informe assunto e conteúdo do e-mail.", "warning")
         return redirect(url_for("superadmin.crm_index"))
 
-    q = Prospect.query
+    prospect_ids = None
     if ids and "all" not in ids:
-        ids_int = [int(i) for i in ids if str(i).isdigit()]
-        if ids_int:
-            q = q.filter(Prospect.id.in_(ids_int))
-
-    leads = q.order_by(Prospect.created_at.desc()).all()
-
-    sent = 0
-    fails = 0
-    for p in leads:
-        if not p.email:
-            continue
-        try:
-            # Usa template se existir; senão, fallback simples em HTML
-            try:
-                html = render_template(
-                    "emails/marketing_generic.html",
-                    lead=p, subject=subject,
-                    body_html=body.replace("\n", "<br>")
-                )
-            except Exception:
-                html = f"<div style='font-family:system-ui,Segoe UI,Arial'><p>{body.replace(chr(10),'<br>')}</p></div>"
-
-            send_platform_mail_html(
-                subject=subject,
-                html=html,
-                to=p.email,
-                text_alt=body
-            )
-            sent += 1
-        except Exception:
-            fails += 1
-            current_app.logger.exception("Falha ao enviar mkt para %s", p.email)
-
-    flash(f"E-mails enviados: {sent}. Falhas: {fails}.", "info")
+        prospect_ids = [int(i) for i in ids if str(i).isdigit()] or None
+
+    # render único aqui (precisa do request); destinatários entram no outbox num job
+    variants = crm_campaigns.render_variants(subject, body)
+    campaign = crm_campaigns.create(subject, body, prospect_ids)
+    job_runner.get_runner().submit("crm_campaign", crm_campaigns.queue_recipients, campaign.id, variants)
+
+    progress_url = url_for("superadmin.crm_campaign_progress", cid=campaign.id)
+    if wants_json:
+        return jsonify(ok=True, campaign_id=campaign.id, progress_url=progress_url), 202
+    flash(f"Campanha #{campaign.id} criada; acompanhe o envio no CRM.", "info")
     return redirect(url_for("superadmin.crm_index"))
 
+# ---------- CRM: progresso de campanha ----------
+@superadmin_bp.get("/crm/campaigns/<int:cid>")
+@require_superadmin
+def crm_campaign_progress(cid: int):
+    campaign = db.session.get(EmailCampaign, cid)
+    if campaign is None:
+        return jsonify(ok=False, error="campanha não encontrada"), 404
+    return jsonify(ok=True, **crm_campaigns.progress(campaign))
+
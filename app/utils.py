@@ -1,8 +1,11 @@
 # app/utils.py
 from __future__ import annotations
 
+import logging
 import os
 import re
+import threading
+import time
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 from functools import lru_cache
@@ -117,6 +120,7 @@ try:
 except Exception:
     pass
 
+from azure.core.exceptions import ResourceNotFoundError
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
 
@@ -128,16 +132,210 @@ def _client() -> SecretClient:
     cred = DefaultAzureCredential()
     return SecretClient(vault_url=vault_url, credential=cred)
 
+
+# -------------------------------------------------------------
+# Backends de segredos: Key Vault (padrão) ou stand-ins locais
+#   SECRETS_BACKEND=keyvault | file | memory  (file: SECRETS_DIR)
+#   get() devolve None quando o segredo não existe.
+# -------------------------------------------------------------
+class KeyVaultSecrets:
+    def get(self, name: str) -> str | None:
+        try:
+            return _client().get_secret(name).value
+        except ResourceNotFoundError:
+            return None
+
+    def set(self, name: str, value: str, tags: dict | None = None):
+        return _client().set_secret(name=name, value=value, tags=tags or {})
+
+
+class FileSecrets:
+    """Um arquivo por segredo (dev/testes offline); tags são ignoradas."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, re.sub(r"[^0-9A-Za-z_.-]+", "_", name) + ".secret")
+
+    def get(self, name: str) -> str | None:
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, name: str, value: str, tags: dict | None = None):
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self._path(name), "w", encoding="utf-8") as f:
+            f.write(value)
+
+
+class MemorySecrets:
+    def __init__(self, data: dict | None = None):
+        self.data = dict(data or {})
+
+    def get(self, name: str) -> str | None:
+        return self.data.get(name)
+
+    def set(self, name: str, value: str, tags: dict | None = None):
+        self.data[name] = value
+
+
+@lru_cache(maxsize=1)
+def _secrets_backend():
+    kind = (os.environ.get("SECRETS_BACKEND") or "keyvault").strip().lower()
+    if kind == "file":
+        folder = os.environ.get("SECRETS_DIR") or os.path.join(os.path.dirname(__file__), "dev_secrets")
+        return FileSecrets(folder)
+    if kind == "memory":
+        return MemorySecrets()
+    return KeyVaultSecrets()
+
+
+# -------------------------------------------------------------
+# Cache de segredos (processo)
+# -------------------------------------------------------------
+class SecretsCache:
+    """
+    In-process cache in front of a secrets backend, so hot paths (payment
+    credentials on every checkout) stop paying a Key Vault round trip:
+
+      * a value is served from memory for ``ttl`` seconds;
+      * after that, for up to ``stale_ttl`` more seconds, the old value is
+        still returned at once while a background thread refreshes it;
+      * a secret that does not exist is remembered for ``negative_ttl``;
+      * if the backend fails and an old value is known, the old value wins;
+      * concurrent misses for the same name make a single backend call.
+
+    ``put``/``invalidate`` bump a per-name generation so a refresh that was
+    already in flight can't overwrite a newer value. The cache is per
+    process: other workers see a rotated secret after ``ttl`` at most.
+    """
+
+    def __init__(self, backend, *, ttl: float = 300.0, negative_ttl: float = 30.0,
+                 stale_ttl: float = 3600.0, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries: dict[str, tuple[float, str | None]] = {}  # nome -> (buscado_em, valor | None)
+        self._gen: dict[str, int] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.errors = 0
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _fetch(self, name: str) -> str | None:
+        with self._lock:
+            gen = self._gen.get(name, 0)
+        value = self.backend.get(name)
+        with self._lock:
+            if self._gen.get(name, 0) == gen:
+                self._entries[name] = (self._clock(), value)
+        return value
+
+    def _refresh(self, name: str) -> None:
+        try:
+            with self._name_lock(name):
+                self._fetch(name)
+        except Exception:
+            self.errors += 1
+            logging.getLogger(__name__).warning("Falha ao renovar o segredo %s; mantendo o valor em cache", name)
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def _refresh_async(self, name: str) -> None:
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+        threading.Thread(target=self._refresh, args=(name,), name="secrets-refresh", daemon=True).start()
+
+    def get(self, name: str) -> str | None:
+        entry = self._entries.get(name)
+        if entry is not None:
+            fetched_at, value = entry
+            age = self._clock() - fetched_at
+            if age < (self.ttl if value is not None else self.negative_ttl):
+                self.hits += 1
+                return value
+            if value is not None and age < self.ttl + self.stale_ttl:
+                self.stale += 1
+                self._refresh_async(name)
+                return value
+
+        with self._name_lock(name):
+            current = self._entries.get(name)
+            if current is not None and current is not entry:
+                return current[1]  # outra thread buscou enquanto esperávamos
+            self.misses += 1
+            try:
+                return self._fetch(name)
+            except Exception:
+                self.errors += 1
+                if entry is not None and entry[1] is not None:
+                    logging.getLogger(__name__).warning("Backend de segredos indisponível; usando valor antigo de %s", name)
+                    return entry[1]
+                raise
+
+    def put(self, name: str, value: str | None) -> None:
+        with self._lock:
+            self._gen[name] = self._gen.get(name, 0) + 1
+            self._entries[name] = (self._clock(), value)
+
+    def invalidate(self, name: str | None = None) -> None:
+        with self._lock:
+            names = [name] if name is not None else list(self._entries)
+            for n in names:
+                self._gen[n] = self._gen.get(n, 0) + 1
+                self._entries.pop(n, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "stale": self.stale, "errors": self.errors}
+
+
+@lru_cache(maxsize=1)
+def secrets_cache() -> SecretsCache:
+    return SecretsCache(
+        _secrets_backend(),
+        ttl=float(os.environ.get("SECRETS_CACHE_TTL", "300")),
+        negative_ttl=float(os.environ.get("SECRETS_CACHE_NEGATIVE_TTL", "30")),
+        stale_ttl=float(os.environ.get("SECRETS_CACHE_STALE_TTL", "3600")),
+    )
+
+
+def get_secret_cached(name: str) -> str | None:
+    """Valor do segredo via cache do processo; None se não existir."""
+    return secrets_cache().get(name)
+
+
+def invalidate_secret(name: str) -> None:
+    secrets_cache().invalidate(name)
+
+
 def kv_set_secret(name: str, value: str, tags: dict | None = None):
     # NUNCA faça print/log do value!
-    return _client().set_secret(name=name, value=value, tags=tags or {})
+    res = _secrets_backend().set(name, value, tags=tags or {})
+    secrets_cache().put(name, value)  # este processo já enxerga o valor novo
+    return res
 
 def kv_get_secret(name: str) -> str:
-    return _client().get_secret(name).value
+    # leitura direta (sem cache); hot paths usam get_secret_cached()
+    value = _secrets_backend().get(name)
+    if value is None:
+        raise KeyError(f"Segredo {name} não encontrado.")
+    return value
 
 def kv_secret_exists(name: str) -> bool:
     try:
-        _client().get_secret(name)
-        return True
+        return _secrets_backend().get(name) is not None
     except Exception:
         return False
@@ -0,0 +1,65 @@
+"""payment_events: webhooks de pagamento gravados e aplicados por worker
+
+Revision ID: a9d4b6e2c8f5
+Revises: f4a1c7e9b2d3
+Create Date: 2026-01-24 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a9d4b6e2c8f5"
+down_revision = "f4a1c7e9b2d3"
+branch_labels = None
+depends_on = None
+
+TABLE = "payment_events"
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _has_index(table: str, name: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(ix.get("name") == name for ix in insp.get_indexes(table))
+
+
+def upgrade():
+    if not _has_table(TABLE):
+        op.create_table(
+            TABLE,
+            sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+            sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("provider", sa.String(length=20), nullable=False, server_default="globalpays"),
+            sa.Column("order_ref", sa.String(length=64), nullable=False),
+            sa.Column("status", sa.String(length=32), nullable=False),
+            sa.Column("reservation_id", sa.Integer(), nullable=False),
+            sa.Column("payload", sa.JSON(), nullable=True),
+            sa.Column("state", sa.String(length=20), nullable=False, server_default="pending"),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("next_attempt_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("locked_at", sa.DateTime(), nullable=True),
+            sa.Column("last_error", sa.Text(), nullable=True),
+            sa.Column("result", sa.String(length=120), nullable=True),
+            sa.Column("received_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("processed_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("provider", "tenant_id", "order_ref", "status", name="uq_payment_events_key"),
+        )
+
+    for name, cols in [
+        ("ix_payment_events_due", ["state", "next_attempt_at"]),
+        ("ix_payment_events_reservation", ["tenant_id", "reservation_id", "state"]),
+    ]:
+        if not _has_index(TABLE, name):
+            op.create_index(name, TABLE, cols, unique=False)
+
+
+def downgrade():
+    if _has_table(TABLE):
+        for name in ("ix_payment_events_reservation", "ix_payment_events_due"):
+            if _has_index(TABLE, name):
+                op.drop_index(name, table_name=TABLE)
+        op.drop_table(TABLE)
@@ -0,0 +1,127 @@
+"""reservations: overlap index + no double booking (exclusion/trigger)
+
+Revision ID: b3e9f1a2c4d7
+Revises: 7a1c3d4e5f6a
+Create Date: 2026-01-12 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3e9f1a2c4d7"
+down_revision = "7a1c3d4e5f6a"
+branch_labels = None
+depends_on = None
+
+OVERLAP_INDEX = "ix_reservations_overlap"
+OVERLAP_CONSTRAINT = "ex_reservations_vehicle_overlap"
+SQLITE_TRIGGERS = ("trg_reservations_no_overlap_insert", "trg_reservations_no_overlap_update")
+
+
+def _has_index(conn, name: str) -> bool:
+    insp = sa.inspect(conn)
+    return any(ix.get("name") == name for ix in insp.get_indexes("reservations"))
+
+
+def _confirmed_overlaps(conn, limit: int = 20) -> list:
+    return conn.execute(sa.text("""
+        SELECT a.id, b.id, a.vehicle_id
+        FROM reservations a
+        JOIN reservations b
+          ON a.vehicle_id = b.vehicle_id AND a.id < b.id
+        WHERE a.status = 'confirmed' AND b.status = 'confirmed'
+          AND a.pickup_dt < b.dropoff_dt AND a.dropoff_dt > b.pickup_dt
+        ORDER BY a.id, b.id
+        LIMIT :limit
+    """), {"limit": limit}).fetchall()
+
+
+def _has_constraint(conn, name: str) -> bool:
+    return bool(conn.execute(
+        sa.text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": name}
+    ).scalar())
+
+
+def _upgrade_postgresql(conn):
+    # (2) exclusion constraint: precisa do btree_gist e de dados sem sobreposição.
+    # Sem ela não há garantia contra double booking, então a migration falha em vez de seguir.
+    if _has_constraint(conn, OVERLAP_CONSTRAINT):
+        return
+
+    overlaps = _confirmed_overlaps(conn)
+    if overlaps:
+        pairs = ", ".join(f"#{a}×#{b} (veículo {v})" for a, b, v in overlaps)
+        raise RuntimeError(
+            f"[{revision}] há reservas confirmadas sobrepostas: {pairs}"
+            f"{' (lista truncada)' if len(overlaps) >= 20 else ''}. "
+            "Cancele ou mova uma reserva de cada par e rode a migration de novo."
+        )
+
+    try:
+        conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    except Exception as exc:
+        raise RuntimeError(
+            f"[{revision}] não foi possível criar a extensão btree_gist ({exc}). "
+            "Peça a um superusuário: CREATE EXTENSION btree_gist; e rode a migration de novo."
+        ) from exc
+
+    conn.execute(sa.text(f"""
+        ALTER TABLE reservations
+        ADD CONSTRAINT {OVERLAP_CONSTRAINT}
+        EXCLUDE USING gist (
+            vehicle_id WITH =,
+            tsrange(pickup_dt, dropoff_dt, '[)') WITH &&
+        ) WHERE (status = 'confirmed' AND vehicle_id IS NOT NULL)
+    """))
+
+
+def _upgrade_sqlite(conn):
+    for name, op_name, extra in (
+        (SQLITE_TRIGGERS[0], "INSERT", ""),
+        (SQLITE_TRIGGERS[1], "UPDATE", " AND r.id <> NEW.id"),
+    ):
+        conn.execute(sa.text(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}
+            BEFORE {op_name} ON reservations
+            WHEN NEW.status = 'confirmed' AND NEW.vehicle_id IS NOT NULL
+            BEGIN
+                SELECT RAISE(ABORT, '{OVERLAP_CONSTRAINT}')
+                WHERE EXISTS (
+                    SELECT 1 FROM reservations r
+                    WHERE r.vehicle_id = NEW.vehicle_id AND r.status = 'confirmed'
+                      AND r.pickup_dt < NEW.dropoff_dt AND r.dropoff_dt > NEW.pickup_dt{extra}
+                );
+            END
+        """))
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # (1) índice composto para a checagem de sobreposição (todos os bancos)
+    if not _has_index(conn, OVERLAP_INDEX):
+        op.create_index(
+            OVERLAP_INDEX,
+            "reservations",
+            ["tenant_id", "vehicle_id", "status", "pickup_dt", "dropoff_dt"],
+            unique=False,
+        )
+
+    # (2) regra "sem double booking" no próprio banco
+    if conn.dialect.name == "postgresql":
+        _upgrade_postgresql(conn)
+    elif conn.dialect.name == "sqlite":
+        _upgrade_sqlite(conn)
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == "postgresql":
+        conn.execute(sa.text(f"ALTER TABLE reservations DROP CONSTRAINT IF EXISTS {OVERLAP_CONSTRAINT}"))
+    elif conn.dialect.name == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {name}"))
+    if _has_index(conn, OVERLAP_INDEX):
+        op.drop_index(OVERLAP_INDEX, table_name="reservations")
@@ -0,0 +1,32 @@
+"""reservations: hold_expires_at (pré-reserva do checkout)
+
+Revision ID: c5d2e8f1a9b3
+Revises: b3e9f1a2c4d7
+Create Date: 2026-01-14 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5d2e8f1a9b3"
+down_revision = "b3e9f1a2c4d7"
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade():
+    # pendentes antigas ficam com NULL = sem hold (não bloqueiam, como antes)
+    if not _has_column("reservations", "hold_expires_at"):
+        op.add_column("reservations", sa.Column("hold_expires_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    if _has_column("reservations", "hold_expires_at"):
+        op.drop_column("reservations", "hold_expires_at")
@@ -0,0 +1,65 @@
+"""email_outbox: fila persistente de e-mails
+
+Revision ID: d7a3f9c2e4b1
+Revises: c5d2e8f1a9b3
+Create Date: 2026-01-20 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d7a3f9c2e4b1"
+down_revision = "c5d2e8f1a9b3"
+branch_labels = None
+depends_on = None
+
+TABLE = "email_outbox"
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _has_index(table: str, name: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(ix.get("name") == name for ix in insp.get_indexes(table))
+
+
+def upgrade():
+    if not _has_table(TABLE):
+        op.create_table(
+            TABLE,
+            sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+            sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id", ondelete="CASCADE"), nullable=True),
+            sa.Column("channel", sa.String(length=20), nullable=False, server_default="auto"),
+            sa.Column("kind", sa.String(length=40), nullable=True),
+            sa.Column("to_addr", sa.String(length=320), nullable=False),
+            sa.Column("subject", sa.String(length=255), nullable=False),
+            sa.Column("html", sa.Text(), nullable=True),
+            sa.Column("text_alt", sa.Text(), nullable=True),
+            sa.Column("attachments", sa.JSON(), nullable=True),
+            sa.Column("status", sa.String(length=20), nullable=False, server_default="pending"),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("next_attempt_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("locked_at", sa.DateTime(), nullable=True),
+            sa.Column("last_error", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("sent_at", sa.DateTime(), nullable=True),
+        )
+
+    for name, cols in [
+        ("ix_email_outbox_due", ["status", "next_attempt_at"]),
+        ("ix_email_outbox_tenant_id", ["tenant_id"]),
+    ]:
+        if not _has_index(TABLE, name):
+            op.create_index(name, TABLE, cols, unique=False)
+
+
+def downgrade():
+    if _has_table(TABLE):
+        for name in ("ix_email_outbox_tenant_id", "ix_email_outbox_due"):
+            if _has_index(TABLE, name):
+                op.drop_index(name, table_name=TABLE)
+        op.drop_table(TABLE)
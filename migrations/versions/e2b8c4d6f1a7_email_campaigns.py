@@ -0,0 +1,70 @@
+"""email_campaigns + email_outbox.campaign_id (e-mail mkt em lote)
+
+Revision ID: e2b8c4d6f1a7
+Revises: d7a3f9c2e4b1
+Create Date: 2026-01-22 15:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e2b8c4d6f1a7"
+down_revision = "d7a3f9c2e4b1"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def _has_index(table: str, name: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(ix.get("name") == name for ix in insp.get_indexes(table))
+
+
+def upgrade():
+    if not _has_table("email_campaigns"):
+        op.create_table(
+            "email_campaigns",
+            sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+            sa.Column("subject", sa.String(length=255), nullable=False),
+            sa.Column("body", sa.Text(), nullable=False),
+            sa.Column("prospect_ids", sa.JSON(), nullable=True),
+            sa.Column("status", sa.String(length=20), nullable=False, server_default="preparing"),
+            sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("queued_at", sa.DateTime(), nullable=True),
+        )
+    if not _has_index("email_campaigns", "ix_email_campaigns_created_at"):
+        op.create_index("ix_email_campaigns_created_at", "email_campaigns", ["created_at"], unique=False)
+
+    if not _has_column("email_outbox", "campaign_id"):
+        with op.batch_alter_table("email_outbox") as batch:
+            batch.add_column(sa.Column("campaign_id", sa.Integer(), nullable=True))
+            batch.create_foreign_key(
+                "fk_email_outbox_campaign_id", "email_campaigns", ["campaign_id"], ["id"], ondelete="CASCADE"
+            )
+    if not _has_index("email_outbox", "ix_email_outbox_campaign_id"):
+        op.create_index("ix_email_outbox_campaign_id", "email_outbox", ["campaign_id"], unique=False)
+
+
+def downgrade():
+    if _has_table("email_outbox") and _has_column("email_outbox", "campaign_id"):
+        if _has_index("email_outbox", "ix_email_outbox_campaign_id"):
+            op.drop_index("ix_email_outbox_campaign_id", table_name="email_outbox")
+        with op.batch_alter_table("email_outbox") as batch:
+            batch.drop_constraint("fk_email_outbox_campaign_id", type_="foreignkey")
+            batch.drop_column("campaign_id")
+    if _has_table("email_campaigns"):
+        if _has_index("email_campaigns", "ix_email_campaigns_created_at"):
+            op.drop_index("ix_email_campaigns_created_at", table_name="email_campaigns")
+        op.drop_table("email_campaigns")
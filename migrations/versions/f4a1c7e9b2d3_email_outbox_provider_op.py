@@ -0,0 +1,39 @@
+"""email_outbox: provider_op_id/accepted_at (envio ACS sem bloquear)
+
+Revision ID: f4a1c7e9b2d3
+Revises: e2b8c4d6f1a7
+Create Date: 2026-01-23 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f4a1c7e9b2d3"
+down_revision = "e2b8c4d6f1a7"
+branch_labels = None
+depends_on = None
+
+TABLE = "email_outbox"
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade():
+    with op.batch_alter_table(TABLE) as batch:
+        if not _has_column(TABLE, "provider_op_id"):
+            batch.add_column(sa.Column("provider_op_id", sa.String(length=64), nullable=True))
+        if not _has_column(TABLE, "accepted_at"):
+            batch.add_column(sa.Column("accepted_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table(TABLE) as batch:
+        if _has_column(TABLE, "accepted_at"):
+            batch.drop_column("accepted_at")
+        if _has_column(TABLE, "provider_op_id"):
+            batch.drop_column("provider_op_id")
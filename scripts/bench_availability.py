@@ -0,0 +1,130 @@
+"""
+Benchmark do motor de disponibilidade (app/services/availability.py).
+
+Compara o laço legado (uma consulta de conflito por veículo) com o anti-join
+único, medindo nº de queries e latência para frotas de 50/500/5000 carros.
+
+Uso:
+  python -m scripts.bench_availability [--sizes 50,500,5000] [--repeat 5]
+"""
+from __future__ import annotations
+
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, VehicleCategory, Vehicle, Reservation
+from app.services import availability
+
+TABLES = [Tenant.__table__, VehicleCategory.__table__, Vehicle.__table__, Reservation.__table__]
+WINDOW = (datetime(2025, 6, 10, 10, 0), datetime(2025, 6, 14, 10, 0))
+
+
+class _QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *_a, **_kw):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _seed(n_vehicles: int) -> Tenant:
+    rnd = random.Random(n_vehicles)
+    tenant = Tenant(name=f"Bench {n_vehicles}", slug=f"bench-{n_vehicles}")
+    db.session.add(tenant)
+    db.session.flush()
+    cats = [VehicleCategory(tenant_id=tenant.id, name=f"Cat {i}", slug=f"cat-{i}") for i in range(5)]
+    db.session.add_all(cats)
+    db.session.flush()
+    vehicles = [
+        Vehicle(tenant_id=tenant.id, category_id=cats[i % 5].id, model=f"Model {i}")
+        for i in range(n_vehicles)
+    ]
+    db.session.add_all(vehicles)
+    db.session.flush()
+
+    base = datetime(2025, 6, 1)
+    rows = []
+    for v in vehicles:
+        for _ in range(3):
+            start = base + timedelta(days=rnd.randint(0, 28), hours=rnd.randint(0, 23))
+            rows.append(Reservation(
+                tenant_id=tenant.id, vehicle_id=v.id, category_id=v.category_id,
+                customer_name="bench", phone="0", email="bench@example.com",
+                pickup_airport="MIA", dropoff_airport="MIA",
+                pickup_dt=start, dropoff_dt=start + timedelta(days=rnd.randint(1, 6)),
+                status=rnd.choice(("confirmed", "confirmed", "pending", "canceled")),
+            ))
+    db.session.add_all(rows)
+    db.session.commit()
+    return tenant
+
+
+def _legacy(tenant_id: int) -> list[int]:
+    pu, do = WINDOW
+    free = []
+    for v in Vehicle.query.filter_by(tenant_id=tenant_id).all():
+        conflict = (Reservation.query
+                    .filter_by(tenant_id=tenant_id, vehicle_id=v.id)
+                    .filter(Reservation.pickup_dt < do,
+                            Reservation.dropoff_dt > pu,
+                            Reservation.status.in_(("confirmed",)))
+                    .first())
+        if not conflict:
+            free.append(v.id)
+    return free
+
+
+def _engine(tenant_id: int) -> list[int]:
+    return availability.available_vehicle_ids(tenant_id, *WINDOW)
+
+
+def _measure(fn, tenant_id: int, repeat: int) -> tuple[int, float, list[int]]:
+    timings = []
+    result: list[int] = []
+    queries = 0
+    for _ in range(repeat):
+        db.session.expire_all()
+        with _QueryCounter(db.engine) as qc:
+            t0 = time.perf_counter()
+            result = fn(tenant_id)
+            timings.append(time.perf_counter() - t0)
+        queries = qc.count
+    return queries, statistics.median(timings) * 1000, result
+
+
+@click.command()
+@click.option("--sizes", default="50,500,5000", help="Tamanhos de frota separados por vírgula")
+@click.option("--repeat", default=5, show_default=True, help="Repetições por cenário (mediana)")
+def main(sizes: str, repeat: int):
+    os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"})
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+        click.echo(f"{'vehicles':>8} | {'legacy q':>8} {'legacy ms':>10} | {'engine q':>8} {'engine ms':>10}")
+        for n in [int(s) for s in sizes.split(",") if s.strip()]:
+            tenant = _seed(n)
+            lq, lms, lres = _measure(_legacy, tenant.id, repeat)
+            eq, ems, eres = _measure(_engine, tenant.id, repeat)
+            assert sorted(lres) == sorted(eres), "engine diverge do laço legado"
+            click.echo(f"{n:>8} | {lq:>8} {lms:>10.1f} | {eq:>8} {ems:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
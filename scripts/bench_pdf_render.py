@@ -0,0 +1,87 @@
+"""
+Benchmark da geração de contratos em PDF (app/services/pdf_renderer.py).
+
+Renderiza o contrato padrão (com logo) N vezes de duas formas e mostra
+contratos/s:
+  * legado: HTML(string=..., base_url=...).write_pdf() a cada documento;
+  * serviço: FontConfiguration, stylesheets e fetcher com LRU compartilhados.
+
+Precisa do WeasyPrint com as bibliotecas nativas (Pango) instaladas.
+
+Uso:
+  python -m scripts.bench_pdf_render [--count 30] [--warmup 2]
+"""
+from __future__ import annotations
+
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import click
+from PIL import Image
+
+from app.public.routes import _default_contract_template
+from app.services import contract_templates, pdf_renderer
+
+
+def _contracts(count: int, static_dir: Path) -> list[str]:
+    logo = static_dir / "uploads" / "branding" / "bench" / "logo.png"
+    logo.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (600, 180), (20, 90, 160)).save(logo)
+    src = _default_contract_template()
+    start = datetime(2025, 6, 1, 10, 0)
+    return [
+        contract_templates.render(
+            None, src,
+            tenant_name="BENCH RENT A CAR", tenant_logo_rel="uploads/branding/bench/logo.png",
+            tenant_email="contato@bench.test", currency="USD",
+            cliente_nome=f"Cliente {i}", cliente_doc=f"{i:011d}",
+            carro_marca="Toyota", carro_modelo="Corolla", carro_ano=2024, carro_cor="Prata",
+            data_inicio=start + timedelta(days=i), data_fim=start + timedelta(days=i + 4),
+            valor_total=199.9 + i,
+        )
+        for i in range(count)
+    ]
+
+
+def _legacy(html: str, base_url: str) -> bytes:
+    from weasyprint import HTML
+
+    return HTML(string=html, base_url=base_url).write_pdf()
+
+
+def _service(html: str, base_url: str) -> bytes:
+    return pdf_renderer.render_pdf(html, base_url)
+
+
+def _rate(fn, docs: list[str], base_url: str, warmup: int) -> float:
+    for html in docs[:warmup]:
+        fn(html, base_url)
+    t0 = time.perf_counter()
+    for html in docs:
+        fn(html, base_url)
+    return len(docs) / (time.perf_counter() - t0)
+
+
+@click.command()
+@click.option("--count", default=30, show_default=True, help="Contratos por cenário")
+@click.option("--warmup", default=2, show_default=True, help="Renders descartados antes de medir")
+def main(count: int, warmup: int):
+    static_dir = Path(tempfile.mkdtemp(prefix="bench-pdf-"))
+    try:
+        docs = _contracts(count, static_dir)
+        base_url = str(static_dir)
+        legacy = _rate(_legacy, docs, base_url, warmup)
+        service = _rate(_service, docs, base_url, warmup)
+        click.echo(f"{'render':>8} | {'contracts/s':>11}")
+        click.echo(f"{'legacy':>8} | {legacy:>11.2f}")
+        click.echo(f"{'service':>8} | {service:>11.2f}   ({service / legacy:.2f}x)")
+        click.echo(f"fetcher: {pdf_renderer.fetcher.stats()}")
+    finally:
+        shutil.rmtree(static_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark da aplicação de assinatura (app/services/signature_stamp.py).
+
+Compara o laço legado do apply_signature (PNG decodificado duas vezes, PNGs
+temporários em disco, um canvas + overlay por página) com o motor novo, em
+contratos de 2/10/50 páginas.
+
+Uso:
+  python -m scripts.bench_signature_stamp [--pages 2,10,50] [--repeat 5]
+"""
+from __future__ import annotations
+
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+import click
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas as rl_canvas
+
+from app.services.signature_stamp import StampLayout, stamp_signature
+
+SIGNED_AT = datetime(2025, 6, 1, 12, 0)
+CLIENT_IP = "203.0.113.7"
+
+
+def _contract(pages: int) -> bytes:
+    buf = BytesIO()
+    can = rl_canvas.Canvas(buf, pagesize=A4)
+    for i in range(pages):
+        can.setFont("Helvetica", 11)
+        for line in range(45):
+            can.drawString(60, 780 - line * 16, f"Cláusula {i + 1}.{line + 1} – texto do contrato de locação de veículo.")
+        can.showPage()
+    can.save()
+    return buf.getvalue()
+
+
+def _signature_png() -> bytes:
+    img = Image.new("RGBA", (900, 300), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.line([(40, 220), (200, 60), (330, 240), (520, 80), (860, 200)], fill=(10, 20, 120, 255), width=9)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _legacy(base: Path, sign_bytes: bytes, out: Path, tmp_dir: Path, layout: StampLayout) -> None:
+    """Cópia do laço antigo de apply_signature."""
+    with base.open("rb") as fh:
+        reader = PdfReader(fh)
+        writer = PdfWriter()
+        full_img = Image.open(BytesIO(sign_bytes)).convert("RGBA").resize((layout.full_w, layout.full_h))
+        rubric_img = Image.open(BytesIO(sign_bytes)).convert("RGBA").resize((layout.rub_w, layout.rub_h))
+        tmp_full = tmp_dir / "__tmp_full.png"
+        tmp_rub = tmp_dir / "__tmp_rub.png"
+        full_img.save(tmp_full)
+        rubric_img.save(tmp_rub)
+        try:
+            last_idx = len(reader.pages) - 1
+            for i, page in enumerate(reader.pages):
+                w = float(page.mediabox.width)
+                h = float(page.mediabox.height)
+                packet = BytesIO()
+                can = rl_canvas.Canvas(packet, pagesize=(w, h))
+                if (i != last_idx) or layout.rubric_on_last:
+                    can.drawImage(str(tmp_rub), w - layout.rub_w - layout.rub_margin, layout.rub_margin,
+                                  width=layout.rub_w, height=layout.rub_h, mask="auto")
+                if layout.audit:
+                    can.setFont("Helvetica", 7)
+                    can.drawString(24, 14, f"Signed {SIGNED_AT:%Y-%m-%d %H:%M UTC} - IP {CLIENT_IP}")
+                if i == last_idx:
+                    can.drawImage(str(tmp_full), w * layout.x_rel, h * layout.y_rel,
+                                  width=layout.full_w, height=layout.full_h, mask="auto")
+                can.save()
+                packet.seek(0)
+                page.merge_page(PdfReader(packet).pages[0])
+                writer.add_page(page)
+            with out.open("wb") as fh_out:
+                writer.write(fh_out)
+        finally:
+            tmp_full.unlink(missing_ok=True)
+            tmp_rub.unlink(missing_ok=True)
+
+
+def _engine(base: Path, sign_bytes: bytes, out: Path, _tmp_dir: Path, layout: StampLayout) -> None:
+    stamp_signature(base, sign_bytes, out, layout=layout, signed_at=SIGNED_AT, client_ip=CLIENT_IP)
+
+
+def _measure(fn, base: Path, sign_bytes: bytes, tmp_dir: Path, repeat: int) -> tuple[float, int]:
+    out = tmp_dir / f"signed_{fn.__name__}.pdf"
+    layout = StampLayout()
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(base, sign_bytes, out, tmp_dir, layout)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1000, out.stat().st_size
+
+
+@click.command()
+@click.option("--pages", default="2,10,50", help="Tamanhos de contrato (páginas) separados por vírgula")
+@click.option("--repeat", default=5, show_default=True, help="Repetições por cenário (mediana)")
+def main(pages: str, repeat: int):
+    sign_bytes = _signature_png()
+    with tempfile.TemporaryDirectory(prefix="bench-sign-") as tmp:
+        tmp_dir = Path(tmp)
+        click.echo(f"{'pages':>5} | {'legacy ms':>9} {'legacy KB':>9} | {'engine ms':>9} {'engine KB':>9} | speedup")
+        for n in [int(s) for s in pages.split(",") if s.strip()]:
+            base = tmp_dir / f"base_{n}.pdf"
+            base.write_bytes(_contract(n))
+            lms, lsize = _measure(_legacy, base, sign_bytes, tmp_dir, repeat)
+            ems, esize = _measure(_engine, base, sign_bytes, tmp_dir, repeat)
+            assert len(PdfReader(str(tmp_dir / "signed__engine.pdf")).pages) == n
+            click.echo(f"{n:>5} | {lms:>9.1f} {lsize / 1024:>9.1f} | {ems:>9.1f} {esize / 1024:>9.1f} | {lms / ems:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -328,10 +328,19 @@
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ image: img })
         });
-        const json = await res.json().catch(() => ({}));
+        let json = await res.json().catch(() => ({}));
         if (!res.ok || !json.ok) throw new Error(json.error || `Falha ao salvar (HTTP ${res.status})`);
 
-        if (json.redirect_url) window.location.href = json.redirect_url;
+        // a assinatura roda em background: acompanha o job até ficar pronta
+        for (let i = 0; !json.redirect_url && json.status_url && i < 90; i++) {
+          await new Promise(r => setTimeout(r, (json.retry_after || 1) * 1000));
+          const st = await fetch(json.status_url, { cache: 'no-store' });
+          const next = await st.json().catch(() => ({}));
+          if (!st.ok || !next.ok) throw new Error(next.error || `Falha ao assinar (HTTP ${st.status})`);
+          json = { ...json, ...next };
+        }
+        if (!json.redirect_url) throw new Error('A assinatura está demorando mais que o normal. Atualize a página em instantes.');
+        window.location.href = json.redirect_url;
       } catch (err) {
         showErr(err.message || 'Erro ao salvar assinatura.');
       } finally {
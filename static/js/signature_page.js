@@ -124,9 +124,17 @@
       body: JSON.stringify({ image: dataURL })
     })
     .then(r => r.json())
-    .then(res => {
+    .then(function follow(res, tries = 0) {
       if (res && res.ok && res.redirect_url) {
         window.location.href = res.redirect_url;
+      } else if (res && res.ok && res.status_url && tries < 90) {
+        // assinatura em background: consulta o status do job
+        setTimeout(() => {
+          fetch(res.status_url, { cache: 'no-store' })
+            .then(r => r.json())
+            .then(next => follow({ ...res, ...next }, tries + 1))
+            .catch(e => err('Erro de rede: ' + e.message));
+        }, (res.retry_after || 1) * 1000);
       } else {
         err(res?.error || 'Falha ao aplicar assinatura.');
       }
@@ -0,0 +1,37 @@
+import unittest
+
+from app.services.airport_catalog import AirportCatalog
+
+RECORDS = [
+    {"code": "ATL", "name": "Hartsfield–Jackson Atlanta Intl", "city": "Atlanta"},
+    {"code": "MIA", "name": "Miami Intl", "city": "Miami"},
+    {"code": "MCO", "name": "Orlando Intl", "city": "Orlando"},
+    {"code": "GRU", "name": "Guarulhos Intl", "city": "São Paulo"},
+    {"code": "OPF", "name": "Miami-Opa Locka Executive", "city": "Opa-locka"},
+    {"code": "", "name": "No code"},
+]
+
+
+class AirportCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.catalog = AirportCatalog.from_records(RECORDS)
+
+    def test_labels_and_invalid_rows(self):
+        self.assertEqual(len(self.catalog), 5)
+        self.assertEqual(self.catalog.labels("atl")[0], "Hartsfield-Jackson Atlanta Intl (ATL) - Atlanta")
+
+    def test_ranking_code_then_name_then_substring(self):
+        self.assertEqual([a.code for a in self.catalog.search("mia")], ["MIA", "OPF"])
+        self.assertEqual([a.code for a in self.catalog.search("mc")], ["MCO"])
+        # "ando" só aparece no meio de "Orlando": cai no fallback por substring
+        self.assertEqual([a.code for a in self.catalog.search("ando")], ["MCO"])
+
+    def test_accents_hyphens_and_limit(self):
+        self.assertEqual([a.code for a in self.catalog.search("sao pa")], ["GRU"])
+        self.assertEqual([a.code for a in self.catalog.search("hartsfield-jackson")], ["ATL"])
+        self.assertEqual(len(self.catalog.search("intl", limit=2)), 2)
+        self.assertEqual(self.catalog.search("m"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
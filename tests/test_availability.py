@@ -0,0 +1,123 @@
+import os
+import unittest
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, VehicleCategory, Vehicle, Reservation
+from app.services.availability import (
+    available_vehicle_ids,
+    busy_vehicle_ids,
+    filter_available,
+    is_overlap_violation,
+    is_vehicle_available,
+)
+
+TABLES = [Tenant.__table__, VehicleCategory.__table__, Vehicle.__table__, Reservation.__table__]
+
+
+class AvailabilityTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        self.cat = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv")
+        db.session.add(self.cat)
+        db.session.commit()
+        self.cars = [
+            Vehicle(tenant_id=self.tenant.id, category_id=self.cat.id, model=f"Car {i}")
+            for i in range(3)
+        ]
+        db.session.add_all(self.cars)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _reserve(self, vehicle, start, end, status="confirmed", tenant_id=None):
+        r = Reservation(
+            tenant_id=tenant_id or self.tenant.id,
+            vehicle_id=vehicle.id,
+            category_id=self.cat.id,
+            customer_name="x",
+            phone="1",
+            email="x@x.com",
+            pickup_airport="MIA",
+            dropoff_airport="MIA",
+            pickup_dt=start,
+            dropoff_dt=end,
+            status=status,
+        )
+        db.session.add(r)
+        db.session.commit()
+        return r
+
+    def test_confirmed_overlap_blocks_vehicle(self):
+        self._reserve(self.cars[0], datetime(2025, 5, 1), datetime(2025, 5, 5))
+        free = available_vehicle_ids(self.tenant.id, datetime(2025, 5, 4), datetime(2025, 5, 8))
+        self.assertEqual(free, [self.cars[1].id, self.cars[2].id])
+        self.assertFalse(
+            is_vehicle_available(self.tenant.id, self.cars[0].id, datetime(2025, 5, 4), datetime(2025, 5, 8))
+        )
+
+    def test_back_to_back_and_pending_do_not_block(self):
+        self._reserve(self.cars[0], datetime(2025, 5, 1), datetime(2025, 5, 5))
+        self._reserve(self.cars[1], datetime(2025, 5, 5), datetime(2025, 5, 9), status="pending")
+        busy = busy_vehicle_ids(self.tenant.id, datetime(2025, 5, 5), datetime(2025, 5, 9))
+        self.assertEqual(busy, set())
+
+    def test_other_tenant_reservations_are_ignored(self):
+        other = Tenant(name="Other", slug="other")
+        db.session.add(other)
+        db.session.commit()
+        self._reserve(self.cars[0], datetime(2025, 5, 1), datetime(2025, 5, 5), tenant_id=other.id)
+        self.assertTrue(
+            is_vehicle_available(self.tenant.id, self.cars[0].id, datetime(2025, 5, 2), datetime(2025, 5, 3))
+        )
+
+    def test_filter_available_without_dates_keeps_everything(self):
+        self._reserve(self.cars[0], datetime(2025, 5, 1), datetime(2025, 5, 5))
+        q = filter_available(Vehicle.query.filter_by(tenant_id=self.tenant.id), self.tenant.id, None, None)
+        self.assertEqual(q.count(), 3)
+
+    def test_database_rejects_overlapping_confirmed_reservations(self):
+        self._reserve(self.cars[0], datetime(2025, 5, 1), datetime(2025, 5, 5))
+        with self.assertRaises(IntegrityError) as ctx:
+            self._reserve(self.cars[0], datetime(2025, 5, 4), datetime(2025, 5, 8))
+        self.assertTrue(is_overlap_violation(ctx.exception))
+        db.session.rollback()
+
+        # pendente pode coexistir; confirmar depois esbarra na mesma regra
+        pending = self._reserve(self.cars[0], datetime(2025, 5, 4), datetime(2025, 5, 8), status="pending")
+        pending.status = "confirmed"
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # encostado (dropoff == pickup) continua permitido
+        self._reserve(self.cars[0], datetime(2025, 5, 5), datetime(2025, 5, 9))
+
+
+if __name__ == "__main__":
+    unittest.main()
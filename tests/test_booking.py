@@ -0,0 +1,88 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, VehicleCategory, Vehicle, Reservation
+from app.services import booking
+from app.services.availability import is_vehicle_available
+
+TABLES = [Tenant.__table__, VehicleCategory.__table__, Vehicle.__table__, Reservation.__table__]
+START, END = datetime(2030, 5, 1, 10), datetime(2030, 5, 4, 10)
+CONTACT = dict(
+    customer_name="x", phone="1", email="x@x.com", pickup_airport="MIA", dropoff_airport="MIA",
+)
+
+
+class BookingTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+                "BOOKING_HOLD_MINUTES": 10,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        self.cat = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv")
+        db.session.add(self.cat)
+        db.session.commit()
+        self.car = Vehicle(tenant_id=self.tenant.id, category_id=self.cat.id, model="Car")
+        db.session.add(self.car)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _hold(self, start=START, end=END):
+        return booking.place_hold(self.tenant.id, self.car.id, start, end, **CONTACT)
+
+    def test_hold_blocks_the_car_until_it_expires(self):
+        res = self._hold()
+        self.assertEqual(res.status, "pending")
+        self.assertIsNone(self._hold(START + timedelta(days=1), END + timedelta(days=1)))
+
+        res.hold_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        self.assertTrue(is_vehicle_available(self.tenant.id, self.car.id, START, END))
+        self.assertIsNotNone(self._hold())
+
+    def test_confirm_is_idempotent_and_books_the_vehicle(self):
+        res = self._hold()
+        self.assertTrue(booking.confirm(res))
+        db.session.commit()
+        self.assertTrue(booking.confirm(res))
+        self.assertEqual((res.status, res.hold_expires_at, self.car.status), ("confirmed", None, "booked"))
+
+    def test_confirm_after_car_was_taken_goes_to_review(self):
+        late = self._hold()
+        late.hold_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        winner = self._hold()
+        self.assertTrue(booking.confirm(winner))
+        db.session.commit()
+
+        self.assertFalse(booking.confirm(late))
+        db.session.commit()
+        self.assertEqual(late.status, booking.CONFLICT_STATUS)
+        self.assertIn("[booking]", late.notes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from datetime import date
+
+from jinja2.exceptions import SecurityError
+
+from app.services import contract_templates
+from app.services.contract_templates import TemplateCache
+
+
+class ContractTemplateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = TemplateCache(maxsize=2)
+
+    def test_same_source_compiles_once(self):
+        first = self.cache.get(1, "{{ valor_total|money(currency) }}")
+        self.assertIs(self.cache.get(1, "{{ valor_total|money(currency) }}"), first)
+        self.assertEqual(first.render(valor_total=1234.5, currency="BRL"), "BRL 1,234.50")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_is_tenant_and_source(self):
+        a = self.cache.get(1, "x")
+        self.assertIsNot(self.cache.get(2, "x"), a)
+        self.assertIsNot(self.cache.get(1, "y"), a)
+
+    def test_lru_bound_and_invalidate(self):
+        self.cache.get(1, "a")
+        self.cache.get(1, "b")
+        self.cache.get(2, "c")
+        self.assertEqual(len(self.cache), 2)
+        self.cache.invalidate(1)
+        self.assertEqual(len(self.cache), 1)
+        self.cache.get(1, "draft", store=False)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_filters_and_sandbox(self):
+        out = contract_templates.render(None, "{{ d|datefmt }} / {{ d|datefmt_long_pt }}", d=date(2025, 9, 11))
+        self.assertEqual(out, "11/09/2025 / 11 de setembro de 2025")
+        self.assertEqual(contract_templates.render(None, "{{ x }}", x="<b>"), "&lt;b&gt;")
+        with self.assertRaises(SecurityError):
+            contract_templates.render(None, "{{ ''.__class__.__mro__ }}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import create_app
+from app.extensions import db
+from app.models import EmailCampaign, EmailOutbox, Prospect, Tenant
+from app.services import crm_campaigns, job_runner, mail_outbox
+from app.services.job_runner import JobRunner
+from app.services.mail_outbox import MailOutbox
+
+TABLES = [Tenant.__table__, EmailCampaign.__table__, EmailOutbox.__table__, Prospect.__table__]
+
+
+class CrmCampaignTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.app.extensions[job_runner.EXT_KEY] = JobRunner(self.app, workers=0)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+        db.session.add_all([
+            Prospect(name="Ana <CEO>", email="ana@x.com"),
+            Prospect(name="Bia", email="BIA@x.com"),
+            Prospect(name="Bia 2", email="bia@x.com"),  # duplicado
+            Prospect(name="", email="anon@x.com"),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _client(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["su_id"] = 1
+        return client
+
+    def test_render_once_and_personalize_escapes(self):
+        with self.app.test_request_context("/"):
+            variants = crm_campaigns.render_variants("Oferta", "Linha 1\nLinha 2")
+        html = crm_campaigns.personalize(variants, "ana@x.com", "Ana <CEO>")
+        self.assertIn("Linha 1<br>Linha 2", html)
+        self.assertIn("ana@x.com (Ana &lt;CEO&gt;)", html)
+        anon = crm_campaigns.personalize(variants, "anon@x.com", "")
+        self.assertIn("Enviado para anon@x.com.", anon)
+        self.assertNotIn("[[campaign:", anon)
+
+    def test_bulk_email_queues_deduplicated_recipients(self):
+        resp = self._client().post(
+            "/superadmin/crm/email",
+            data={"subject": "Oferta", "body": "Oi", "ids": ["all"]},
+            headers={"Accept": "application/json"},
+        )
+        self.assertEqual(resp.status_code, 202)
+        data = resp.get_json()
+
+        campaign = db.session.get(EmailCampaign, data["campaign_id"])
+        self.assertEqual((campaign.status, campaign.total), ("sending", 3))
+        rows = EmailOutbox.query.filter_by(campaign_id=campaign.id).all()
+        self.assertEqual(sorted(r.to_addr.lower() for r in rows), ["ana@x.com", "anon@x.com", "bia@x.com"])
+        self.assertTrue(all((r.channel, r.kind, r.status) == ("platform", "crm", "pending") for r in rows))
+
+        progress = self._client().get(data["progress_url"]).get_json()
+        self.assertEqual((progress["status"], progress["pending"], progress["sent"]), ("sending", 3, 0))
+
+    def test_selected_ids_and_legacy_field_name(self):
+        ana = Prospect.query.filter_by(email="ana@x.com").one()
+        self._client().post("/superadmin/crm/email", data={"subject": "S", "body": "B", "ids[]": [str(ana.id)]})
+        self.assertEqual([r.to_addr for r in EmailOutbox.query.all()], ["ana@x.com"])
+
+    def test_progress_reports_results_and_failures(self):
+        with self.app.test_request_context("/"):
+            variants = crm_campaigns.render_variants("S", "B")
+        campaign = crm_campaigns.create("S", "B")
+        crm_campaigns.queue_recipients(campaign.id, variants)
+
+        def deliver(**kwargs):
+            if kwargs["to"] == "anon@x.com":
+                raise OSError("mailbox unavailable")
+            return True
+
+        MailOutbox(self.app, workers=0, autostart=False, max_attempts=1, deliver=deliver).process_once()
+        progress = crm_campaigns.progress(campaign)
+        self.assertEqual((progress["status"], progress["sent"], progress["dead"]), ("done", 2, 1))
+        self.assertEqual(progress["failures"], [{"to": "anon@x.com", "error": "mailbox unavailable"}])
+
+    def test_campaign_left_preparing_by_a_restart_is_resumed_once(self):
+        stuck = crm_campaigns.create("S", "B")  # job perdido antes de começar
+        busy = crm_campaigns.create("S2", "B2")
+        busy.queued_at = datetime.utcnow()  # job vivo em outro processo
+        old = datetime.utcnow() - crm_campaigns.STALE_AFTER - timedelta(minutes=1)
+        stuck.created_at = busy.created_at = old
+        db.session.commit()
+
+        outbox = MailOutbox(self.app, workers=0, autostart=False)
+        self.assertEqual(outbox.resume_campaigns(), 1)
+        self.assertEqual((stuck.status, stuck.total), ("sending", 3))
+        self.assertEqual(busy.status, "preparing")
+        self.assertEqual(EmailOutbox.query.filter_by(campaign_id=stuck.id).count(), 3)
+
+        # o job original chegando atrasado não duplica os destinatários
+        with self.app.test_request_context("/"):
+            variants = crm_campaigns.render_variants("S", "B")
+        crm_campaigns.queue_recipients(stuck.id, variants)
+        self.assertEqual(EmailOutbox.query.filter_by(campaign_id=stuck.id).count(), 3)
+        self.assertEqual(outbox.resume_campaigns(), 0)
+
+    def test_interrupted_campaign_resumes_after_queued_recipients(self):
+        campaign = crm_campaigns.create("S", "B")
+        mail_outbox.enqueue_many([{"to": "ana@x.com", "subject": "S", "campaign_id": campaign.id}])
+        campaign.created_at = campaign.queued_at = datetime.utcnow() - crm_campaigns.STALE_AFTER - timedelta(minutes=1)
+        db.session.commit()  # primeira página gravada, depois o processo caiu
+
+        with mock.patch.object(crm_campaigns, "BATCH", 2):  # várias páginas
+            self.assertEqual(crm_campaigns.resume_stale(self.app), 1)
+        rows = EmailOutbox.query.filter_by(campaign_id=campaign.id).all()
+        self.assertEqual(sorted(r.to_addr.lower() for r in rows), ["ana@x.com", "anon@x.com", "bia@x.com"])
+        self.assertEqual((campaign.status, campaign.total), ("sending", 3))
+
+    def test_job_stops_when_its_campaign_was_taken_over(self):
+        campaign = crm_campaigns.create("S", "B")
+        real_renew = crm_campaigns._renew
+
+        def renew(campaign_id, stamp, **values):
+            # outro worker achou o job parado e retomou a campanha no meio da primeira página
+            db.session.execute(db.update(EmailCampaign).values(queued_at=datetime.utcnow() + timedelta(seconds=1)))
+            return real_renew(campaign_id, stamp, **values)
+
+        with self.app.test_request_context("/"):
+            variants = crm_campaigns.render_variants("S", "B")
+        with mock.patch.object(crm_campaigns, "BATCH", 2), mock.patch.object(crm_campaigns, "_renew", renew):
+            result = crm_campaigns.queue_recipients(campaign.id, variants)
+        self.assertIsNone(result["total"])
+        self.assertEqual(EmailOutbox.query.filter_by(campaign_id=campaign.id).count(), 0)  # página desfeita
+        self.assertEqual(db.session.get(EmailCampaign, campaign.id).status, "preparing")
+
+    def test_transactional_mail_is_claimed_before_campaign_mail(self):
+        campaign = crm_campaigns.create("S", "B")
+        mail_outbox.enqueue_many([{"to": "lead@x.com", "subject": "S", "campaign_id": campaign.id}])
+        db.session.commit()
+        mail_outbox.enqueue(to="cliente@x.com", subject="Contrato")
+        claimed = MailOutbox(self.app, workers=0, autostart=False).claim(1)
+        self.assertEqual(db.session.get(EmailOutbox, claimed[0]).to_addr, "cliente@x.com")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import threading
+import unittest
+
+from unittest import mock
+
+import requests
+
+from app.services import globalpays
+from app.services.globalpays import GatewayClient, TokenManager
+
+BASE = "https://gp.test/v1"
+CREDS = {"public_key": "pk", "merchant_code": "m1", "token": ""}
+
+
+class FakeResp:
+    def __init__(self, status=200, body=None):
+        self.status_code = status
+        self.headers = {"content-type": "application/json"}
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+class FakeAuth:
+    """Only /checkoutapi/auth with pubKey alone works (the last variant the old code tried)."""
+
+    def __init__(self):
+        self.calls = []
+        self.n = 0
+        self.gate = None
+        self.down = False
+
+    def __call__(self, url, data=None, timeout=None):
+        self.calls.append((url, tuple(sorted(data))))
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.down:
+            raise ConnectionError("timeout")
+        if url.endswith("/checkoutapi/auth") and "merchantCode" not in data:
+            self.n += 1
+            return FakeResp(body={"data": {"token": f"tok{self.n}"}})
+        return FakeResp(404, {"msg": "Rota não encontrada"})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.auth = FakeAuth()
+        self.clock = Clock()
+        self.tm = TokenManager(ttl=480, refresh_margin=60, fail_ttl=30, post=self.auth, clock=self.clock)
+
+    def _join_refresh(self):
+        for t in threading.enumerate():
+            if t.name == "gp-token-refresh":
+                t.join(5)
+
+    def test_token_is_shared_and_working_variant_remembered(self):
+        self.assertEqual(self.tm.get(1, CREDS, BASE), "tok1")
+        self.assertEqual(len(self.auth.calls), 4)
+        self.assertEqual(self.tm.get(1, CREDS, BASE), "tok1")
+        self.assertEqual(len(self.auth.calls), 4)
+
+        self.clock.now += 481
+        self.assertEqual(self.tm.get(1, CREDS, BASE), "tok2")
+        self.assertEqual(self.auth.calls[4], (f"{BASE}/checkoutapi/auth", ("pubKey",)))
+        self.assertEqual(len(self.auth.calls), 5)
+
+    def test_tenants_and_rotated_credentials_get_their_own_token(self):
+        self.tm.get(1, CREDS, BASE)
+        self.assertEqual(self.tm.get(2, CREDS, BASE), "tok2")
+        self.assertEqual(self.tm.get(1, {**CREDS, "public_key": "pk-new"}, BASE), "tok3")
+
+    def test_refreshes_in_background_before_expiry(self):
+        self.tm.get(1, CREDS, BASE)
+        self.clock.now += 430
+        self.assertEqual(self.tm.get(1, CREDS, BASE), "tok1")  # ainda válido; renova por trás
+        self._join_refresh()
+        self.assertEqual(self.tm.get(1, CREDS, BASE), "tok2")
+
+    def test_concurrent_misses_authenticate_once(self):
+        self.auth.gate = threading.Event()
+        out = []
+        threads = [threading.Thread(target=lambda: out.append(self.tm.get(1, CREDS, BASE))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        self.auth.gate.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(out, ["tok1"] * 4)
+        self.assertEqual(self.auth.n, 1)
+
+    def test_stale_token_reauths_only_once(self):
+        self.tm.get(1, CREDS, BASE)
+        self.assertEqual(self.tm.get(1, CREDS, BASE, stale="tok1"), "tok2")
+        self.assertEqual(self.tm.get(1, CREDS, BASE, stale="tok1"), "tok2")  # outro request com o mesmo 401
+        self.assertEqual(self.auth.n, 2)
+
+    def test_failure_is_cached_and_env_token_used_as_fallback(self):
+        self.auth.down = True
+        creds = {**CREDS, "token": "env-tok"}
+        self.assertEqual(self.tm.get(1, creds, BASE), "env-tok")
+        calls = len(self.auth.calls)
+        self.tm.get(1, {**creds}, BASE)
+        self._join_refresh()
+        self.assertLessEqual(len(self.auth.calls), calls + 4)  # no máximo uma renovação em segundo plano
+
+        self.assertIsNone(self.tm.get(1, {**CREDS}, BASE))
+        calls = len(self.auth.calls)
+        self.assertIsNone(self.tm.get(1, {**CREDS}, BASE))
+        self.assertEqual(len(self.auth.calls), calls)
+
+    def test_without_public_key_env_token_is_used_directly(self):
+        self.assertEqual(self.tm.get(1, {"token": "env-tok"}, BASE), "env-tok")
+        self.assertEqual(self.auth.calls, [])
+        self.assertIsNone(self.tm.get(1, {}, BASE))
+
+
+class FakeHTTP:
+    """Orders only at /createOrder with a Bearer header; /order says the route doesn't exist."""
+
+    def __init__(self):
+        self.calls = []
+        self.unreachable = set()
+
+    def request(self, method, url, json=None, headers=None, timeout=None):
+        self.calls.append((url, sorted(k for k in headers if k not in ("Accept", "Content-Type"))))
+        if url in self.unreachable:
+            raise requests.ConnectionError("refused")
+        if url.endswith("/order"):
+            return FakeResp(404, {"msg": "Rota não encontrada"})
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return FakeResp(401, {"msg": "unauthorized"})
+        if json and json.get("reject"):
+            return FakeResp(422, {"msg": "invalid amount"})
+        return FakeResp(200, {"data": {"url": "https://pay/x", "split": bool(json and json.get("split"))}})
+
+
+class GatewayClientTests(unittest.TestCase):
+    URLS = [f"{BASE}/paymentapi/order", f"{BASE}/paymentapi/createOrder"]
+
+    def setUp(self):
+        self.http = FakeHTTP()
+        self.tokens = TokenManager(post=FakeAuth())
+        self.client = GatewayClient(self.tokens, http=self.http)
+
+    def _order(self, tenant=1, payloads=None):
+        return self.client.call("order", tenant, CREDS, BASE, "POST", self.URLS,
+                                payloads=payloads, accept=lambda r: r.status < 400 and bool(r.data.get("data")))
+
+    def test_working_route_is_learned_and_used_directly(self):
+        reply, _ = self._order()
+        self.assertEqual((reply.url, reply.style), (self.URLS[1], "bearer"))
+        self.assertEqual(self.client.learned(1, "order"), (self.URLS[1], "bearer"))
+        self.assertEqual(self.tokens.auth_calls, 4 + 1)  # 1ª auth + uma reautenticação (variante já conhecida)
+
+        self.http.calls.clear()
+        reply, _ = self._order()
+        self.assertIsNotNone(reply)
+        self.assertEqual(self.http.calls, [(self.URLS[1], ["Authorization"])])
+
+    def test_learned_header_style_is_tried_first_for_other_operations(self):
+        self._order()
+        self.http.calls.clear()
+        reply, _ = self.client.call("consult", 1, CREDS, BASE, "GET", [f"{BASE}/paymentapi/transaction/9"],
+                                    accept=lambda r: r.status < 400)
+        self.assertEqual(len(self.http.calls), 1)
+        self.assertEqual(reply.style, "bearer")
+
+    def test_missing_or_unreachable_url_is_not_probed_with_other_headers(self):
+        self.http.unreachable.add(self.URLS[1])
+        reply, last = self._order()
+        self.assertIsNone(reply)
+        self.assertEqual([c[0] for c in self.http.calls], self.URLS)  # um request por URL
+        self.assertIsNone(last.status)
+
+    def test_route_that_stops_working_is_forgotten(self):
+        self._order()
+        self.http.unreachable.add(self.URLS[1])
+        self.assertEqual(self._order()[0], None)
+        self.assertIsNone(self.client.learned(1, "order"))
+
+    def test_business_error_on_learned_route_keeps_it(self):
+        self._order()
+        self.http.calls.clear()
+        reply, _ = self._order(payloads=[lambda: {"reject": True}])
+        self.assertIsNone(reply)
+        self.assertEqual(self.http.calls, [(self.URLS[1], ["Authorization"])])  # 422 da rota aprendida, sem sondar
+        self.assertEqual(self.client.learned(1, "order"), (self.URLS[1], "bearer"))
+
+    def test_payload_fallback_per_route(self):
+        payloads = [lambda: {"split": True}, lambda: {"split": False}]
+        accept = lambda r: r.status < 400 and r.data["data"]["split"] is False  # noqa: E731
+        reply, _ = self.client.call("order", 1, CREDS, BASE, "POST", self.URLS, payloads=payloads, accept=accept)
+        self.assertFalse(reply.data["data"]["split"])
+
+    def test_no_token_means_no_call(self):
+        self.assertEqual(self.client.call("order", 1, {}, BASE, "POST", self.URLS, accept=bool), (None, None))
+        self.assertEqual(self.http.calls, [])
+
+
+class FakeConsultHTTP:
+    """Orders are only found at /transaction?id=<id> with a Bearer header; the other paths don't exist."""
+
+    def __init__(self, orders):
+        self.orders = orders
+        self.calls = []
+
+    def request(self, method, url, json=None, headers=None, timeout=None):
+        self.calls.append(url)
+        if "/transaction?id=" not in url:
+            return FakeResp(404, {"msg": "Rota não encontrada"})
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return FakeResp(401, {"msg": "unauthorized"})
+        order_id = url.rsplit("=", 1)[1]
+        if order_id not in self.orders:
+            return FakeResp(404, {"msg": "pedido não encontrado"})
+        return FakeResp(200, {"data": {"orderId": order_id, "status": self.orders[order_id]}})
+
+
+class ConsultOrderTests(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeConsultHTTP({"1": "approved", "2": "refused"})
+        self.client = GatewayClient(TokenManager(post=FakeAuth()), http=self.http)
+        patcher = mock.patch.object(globalpays, "client", self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_learned_route_is_reused_for_other_order_ids(self):
+        self.assertEqual(globalpays.consult_order(1, CREDS, BASE, "1")["status"], "approved")
+        self.assertEqual(self.client.learned(1, "consult"), (BASE + "/paymentapi/transaction?id={id}", "bearer"))
+
+        self.http.calls.clear()
+        self.assertEqual(globalpays.consult_order(1, CREDS, BASE, "2")["status"], "refused")
+        self.assertEqual(self.http.calls, [BASE + "/paymentapi/transaction?id=2"])
+
+    def test_unknown_order_on_learned_route_is_one_request(self):
+        globalpays.consult_order(1, CREDS, BASE, "1")
+        self.http.calls.clear()
+        self.assertEqual(globalpays.consult_order(1, CREDS, BASE, "404"), {})
+        self.assertEqual(self.http.calls, [BASE + "/paymentapi/transaction?id=404"])
+        self.assertIsNotNone(self.client.learned(1, "consult"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import threading
+import unittest
+
+from flask import current_app
+
+from app import create_app
+from app.services import job_runner
+from app.services.job_runner import JobRunner
+
+
+class JobRunnerTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"})
+
+    def tearDown(self):
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def test_inline_mode_finishes_before_returning(self):
+        runner = JobRunner(self.app, workers=0)
+        job = runner.submit("demo", lambda x: {"value": x * 2}, 21)
+        self.assertEqual(job.status, job_runner.DONE)
+        self.assertEqual(runner.get(job.id).as_dict()["value"], 42)
+
+    def test_background_job_runs_in_app_context_and_reports_status(self):
+        runner = JobRunner(self.app, workers=1)
+        gate = threading.Event()
+
+        def work():
+            gate.wait(5)
+            return {"app": current_app.name}
+
+        try:
+            job = runner.submit("demo", work)
+            self.assertIn(runner.get(job.id).status, (job_runner.QUEUED, job_runner.RUNNING))
+            gate.set()
+            self.assertIs(runner.wait(job.id, 5), job)
+            self.assertEqual(job.as_dict(), {"id": job.id, "kind": "demo", "status": "done", "app": self.app.name})
+        finally:
+            runner.shutdown()
+
+    def test_failure_is_recorded_with_message(self):
+        runner = JobRunner(self.app, workers=0)
+
+        def boom():
+            raise job_runner.JobError("Contrato ainda em preparação")
+
+        job = runner.submit("demo", boom)
+        self.assertEqual(job.status, job_runner.FAILED)
+        self.assertEqual(job.error, "Contrato ainda em preparação")
+        self.assertEqual(runner.stats()["failed"], 1)
+
+    def test_unexpected_failure_does_not_expose_its_message(self):
+        runner = JobRunner(self.app, workers=0)
+
+        def boom():
+            raise OSError("[Errno 13] Permission denied: '/srv/app/instance/uploads/contracts/x.pdf'")
+
+        with self.assertLogs("app.services.job_runner", "ERROR"):
+            job = runner.submit("demo", boom)
+        self.assertEqual(job.status, job_runner.FAILED)
+        self.assertIsNone(job.error)
+        self.assertNotIn("error", job.as_dict())
+
+    def test_follow_up_job_from_inside_a_job(self):
+        runner = JobRunner(self.app, workers=1)
+        self.app.extensions[job_runner.EXT_KEY] = runner
+        sent = threading.Event()
+
+        def sign():
+            job_runner.get_runner().submit("email", sent.set)
+            return {"redirect_url": "/checkout/1"}
+
+        try:
+            job = runner.submit("sign", sign)
+            self.assertTrue(sent.wait(5))
+            runner.wait(job.id, 5)
+            self.assertEqual(job.result, {"redirect_url": "/checkout/1"})
+        finally:
+            runner.shutdown()
+
+    def test_unknown_job_id(self):
+        self.assertIsNone(JobRunner(self.app, workers=0).get("nope"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, Lead
+from app.services import lead_buffer
+from app.services.lead_buffer import LeadBuffer
+
+TABLES = [Tenant.__table__, Lead.__table__]
+
+
+class LeadBufferTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        self.buffer = LeadBuffer(self.app, autostart=False)
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def test_burst_from_same_contact_coalesces_into_one_lead(self):
+        self.buffer.record(self.tenant.id, name="Ana", email="ana@x.com", pickup_airport="MIA")
+        self.buffer.record(self.tenant.id, email="ana@x.com", phone="555", pickup_airport="MCO")
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(Lead.query.count(), 0)  # nada gravado antes do flush
+
+        self.assertEqual(self.buffer.flush(), 1)
+        lead = Lead.query.one()
+        self.assertEqual((lead.name, lead.phone, lead.pickup_airport, lead.stage), ("Ana", "555", "MCO", "new"))
+
+    def test_upserts_onto_existing_lead_by_phone(self):
+        db.session.add(Lead(tenant_id=self.tenant.id, name="Old", phone="777", stage="contacted"))
+        db.session.commit()
+        pu = datetime(2025, 5, 1, 10, 0)
+        self.buffer.record(self.tenant.id, name="Bia", phone="777", pickup_dt=pu)
+        self.buffer.flush()
+        lead = Lead.query.one()
+        self.assertEqual((lead.name, lead.pickup_dt, lead.stage), ("Bia", pu, "contacted"))
+
+    def test_name_only_searches_are_kept_apart(self):
+        self.buffer.record(self.tenant.id, name="Carlos")
+        self.buffer.record(self.tenant.id, name="Carlos")
+        self.buffer.flush()
+        self.assertEqual(Lead.query.count(), 2)
+
+    def test_oversized_values_are_trimmed_to_the_columns(self):
+        email = "a" * 150 + "@x.com"
+        self.buffer.record(self.tenant.id, name="N" * 300, email=email, pickup_dt="amanhã")
+        self.buffer.record(self.tenant.id, email=email, phone=" 555 ")
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        lead = Lead.query.one()
+        self.assertEqual((len(lead.name), lead.email, lead.phone, lead.pickup_dt), (120, email[:120], "555", None))
+
+    def test_failed_entry_is_requeued_without_losing_the_rest(self):
+        real = LeadBuffer._upsert_tenant
+
+        def upsert(tenant_id, entries):
+            if any(e.get("email") == "bad@x.com" for e in entries):
+                raise RuntimeError("db hiccup")
+            return real(tenant_id, entries)
+
+        self.buffer.record(self.tenant.id, name="Ana", email="ana@x.com")
+        self.buffer.record(self.tenant.id, name="Bad", email="bad@x.com")
+        with mock.patch.object(LeadBuffer, "_upsert_tenant", staticmethod(upsert)):
+            self.assertEqual(self.buffer.flush(), 1)
+            self.assertEqual([lead.email for lead in Lead.query.all()], ["ana@x.com"])
+            self.assertEqual(len(self.buffer), 1)  # volta para o próximo flush
+
+            self.buffer.record(self.tenant.id, email="bad@x.com", phone="999")
+            for _ in range(lead_buffer.MAX_ATTEMPTS - 1):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer), 0)  # desiste depois de MAX_ATTEMPTS flushes
+        self.assertEqual(self.buffer.failed, 1)
+
+        self.buffer.record(self.tenant.id, name="Bad", email="bad@x.com")
+        self.buffer.flush()
+        self.assertEqual(Lead.query.count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import smtplib
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from app import create_app
+from app.extensions import db
+from app.models import EmailOutbox, Tenant
+from app.services import mail_outbox, mailer
+from app.services.mail_outbox import MailOutbox
+
+TABLES = [Tenant.__table__, EmailOutbox.__table__]
+
+
+class FakeDeliver:
+    def __init__(self, *, fail_with=None, result=True):
+        self.fail_with = fail_with
+        self.result = result
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append({**kwargs, "tenant": getattr(kwargs["tenant"], "slug", None)})
+        if self.fail_with is not None:
+            raise self.fail_with
+        return self.result
+
+
+class MailOutboxTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+        self.acme = Tenant(name="Acme", slug="acme")
+        self.beta = Tenant(name="Beta", slug="beta")
+        db.session.add_all([self.acme, self.beta])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _outbox(self, deliver, **kwargs):
+        kwargs.setdefault("workers", 0)
+        return MailOutbox(self.app, autostart=False, deliver=deliver, **kwargs)
+
+    def _row(self, row_id):
+        db.session.expire_all()
+        return db.session.get(EmailOutbox, row_id)
+
+    def test_queued_message_is_sent_and_spool_removed(self):
+        att = mail_outbox.spool("Contrato_1.pdf", b"%PDF-1.4", "application/pdf")
+        row = mail_outbox.enqueue(to="ana@x.com", subject="Contrato", html="<p>oi</p>",
+                                  tenant_id=self.acme.id, attachments=[att])
+        deliver = FakeDeliver()
+
+        self.assertEqual(self._outbox(deliver).process_once(), 1)
+
+        self.assertEqual(deliver.calls[0]["attachments"], [("Contrato_1.pdf", b"%PDF-1.4", "application/pdf")])
+        self.assertEqual(deliver.calls[0]["tenant"], "acme")
+        row = self._row(row.id)
+        self.assertEqual((row.status, row.attempts), ("sent", 1))
+        self.assertIsNotNone(row.sent_at)
+        self.assertFalse(Path(att["path"]).exists())
+
+    def test_failure_backs_off_then_dead_letters(self):
+        row = mail_outbox.enqueue(to="ana@x.com", subject="Oi", tenant_id=self.acme.id)
+        outbox = self._outbox(FakeDeliver(fail_with=OSError("timeout")), max_attempts=2, backoff=60)
+
+        outbox.process_once()
+        row = self._row(row.id)
+        self.assertEqual((row.status, row.attempts, row.last_error), ("pending", 1, "timeout"))
+        self.assertGreater(row.next_attempt_at, datetime.utcnow())
+        self.assertEqual(outbox.process_once(), 0)  # ainda no backoff
+
+        row.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        outbox.process_once()
+        self.assertEqual((self._row(row.id).status, self._row(row.id).attempts), ("dead", 2))
+
+    def test_permanent_smtp_error_dead_letters_at_once(self):
+        row = mail_outbox.enqueue(to="nope@x.com", subject="Oi")
+        err = smtplib.SMTPRecipientsRefused({"nope@x.com": (550, b"no such user")})
+        self._outbox(FakeDeliver(fail_with=err)).process_once()
+        self.assertEqual(self._row(row.id).status, "dead")
+
+    def test_no_provider_marks_skipped(self):
+        row = mail_outbox.enqueue(to="ana@x.com", subject="Oi")
+        self._outbox(FakeDeliver(result=False)).process_once()
+        self.assertEqual(self._row(row.id).status, "skipped")
+
+    def test_rate_limit_is_per_tenant(self):
+        for i in range(3):
+            mail_outbox.enqueue(to=f"a{i}@x.com", subject="Oi", tenant_id=self.acme.id)
+        mail_outbox.enqueue(to="b@x.com", subject="Oi", tenant_id=self.beta.id)
+        deliver = FakeDeliver()
+        outbox = self._outbox(deliver, rate_per_minute=2)
+
+        self.assertEqual(outbox.process_once(), 3)
+        self.assertEqual(sorted(c["to"] for c in deliver.calls), ["a0@x.com", "a1@x.com", "b@x.com"])
+        self.assertEqual(EmailOutbox.query.filter_by(status="pending").count(), 1)
+        self.assertEqual(outbox.process_once(), 0)  # acme sem tokens; beta não tem mais nada
+
+    def test_claim_is_exclusive(self):
+        mail_outbox.enqueue(to="ana@x.com", subject="Oi")
+        first, second = self._outbox(FakeDeliver()), self._outbox(FakeDeliver())
+        self.assertEqual(len(first.claim(10)), 1)
+        self.assertEqual(second.claim(10), [])
+
+    def test_accepted_acs_send_is_settled_by_status_checks(self):
+        ok = mail_outbox.enqueue(to="ana@x.com", subject="Oi")
+        bad = mail_outbox.enqueue(to="nope@x.com", subject="Oi")
+        deliver = FakeDeliver(result=mailer.Accepted("op-1"))
+        statuses = {"op-1": ("Running", None)}
+        outbox = self._outbox(deliver, resolve=lambda op: statuses[op])
+
+        self.assertEqual(outbox.process_once(), 2)
+        self.assertFalse(deliver.calls[0]["wait"])
+        row = self._row(ok.id)
+        self.assertEqual((row.status, row.provider_op_id), ("accepted", "op-1"))
+        self.assertEqual(outbox.process_once(), 0)  # primeira consulta só depois de alguns segundos
+
+        for row_id in (ok.id, bad.id):
+            self._row(row_id).next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        outbox.process_once()
+        self.assertEqual(self._row(ok.id).status, "accepted")  # ainda Running
+
+        statuses["op-1"] = ("Succeeded", None)
+        self._row(ok.id).next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(outbox.check(ok.id), "sent")
+        self.assertIsNotNone(self._row(ok.id).sent_at)
+
+        statuses["op-1"] = ("Failed", "Endereço de destinatário inválido.")
+        self.assertEqual(outbox.check(bad.id), "dead")
+        self.assertEqual(self._row(bad.id).last_error, "Endereço de destinatário inválido.")
+
+    def test_accepted_send_without_verdict_times_out(self):
+        row = mail_outbox.enqueue(to="ana@x.com", subject="Oi")
+        outbox = self._outbox(FakeDeliver(result=mailer.Accepted("op-2")), resolve=lambda op: ("Running", None))
+        outbox.process_once()
+        self._row(row.id).accepted_at = datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+        self.assertEqual(outbox.check(row.id), "dead")
+
+    def test_platform_acs_submit_does_not_wait(self):
+        client = mock.Mock()
+        with mock.patch.object(mailer, "_acs_enabled", return_value=True), \
+                mock.patch.object(mailer, "_acs_client", return_value=client):
+            result = mailer.deliver(channel="platform", tenant=None, to="ana@x.com", subject="Oi",
+                                    html="<p>oi</p>", wait=False)
+        self.assertIsInstance(result, mailer.Accepted)
+        _, kwargs = client.begin_send.call_args
+        self.assertFalse(kwargs["polling"])
+        self.assertEqual(kwargs["headers"]["Operation-Id"], result.operation_id)
+        client.begin_send.return_value.result.assert_not_called()
+
+    def test_savepoint_rollback_still_wakes_the_outbox_on_commit(self):
+        outbox = mock.Mock()
+        self.app.extensions[mail_outbox.EXT_KEY] = outbox
+        mail_outbox.enqueue(to="ana@x.com", subject="Oi", commit=False)
+        db.session.flush()
+        savepoint = db.session.begin_nested()
+        savepoint.rollback()
+        db.session.commit()
+        outbox.wake.assert_called_once_with()
+
+    def test_mailer_api_queues_instead_of_sending(self):
+        self.app.config["PLATFORM_SMTP_HOST"] = "smtp.example.com"
+        try:
+            self.assertTrue(mailer.send_platform_mail_html(subject="Oi", html="<p>oi</p>", to="ana@x.com"))
+        finally:
+            self.app.config.pop("PLATFORM_SMTP_HOST")
+        row = EmailOutbox.query.one()
+        self.assertEqual((row.channel, row.status, row.to_addr), ("platform", "pending", "ana@x.com"))
+
+    def test_mailer_api_without_provider_only_logs(self):
+        os.environ.pop("PLATFORM_SMTP_HOST", None)
+        self.assertFalse(mailer.send_tenant_mail_html(tenant=self.acme, subject="Oi", html="", to="ana@x.com"))
+        self.assertEqual(EmailOutbox.query.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import create_app
+from app.extensions import db
+from app.models import PaymentEvent, Reservation, Tenant, Vehicle, VehicleCategory
+from app.services import booking, payment_events
+from app.services.payment_events import PaymentEventWorker
+
+TABLES = [Tenant.__table__, VehicleCategory.__table__, Vehicle.__table__, Reservation.__table__,
+          PaymentEvent.__table__]
+START, END = datetime(2030, 5, 1, 10), datetime(2030, 5, 4, 10)
+CONTACT = dict(customer_name="x", phone="1", email="x@x.com", pickup_airport="MIA", dropoff_airport="MIA")
+
+
+class PaymentEventTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.worker = PaymentEventWorker(self.app, autostart=False, max_attempts=2, backoff=0)
+        self.app.extensions[payment_events.EXT_KEY] = self.worker
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        cat = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv")
+        db.session.add(cat)
+        db.session.commit()
+        self.car = Vehicle(tenant_id=self.tenant.id, category_id=cat.id, model="Car")
+        db.session.add(self.car)
+        db.session.commit()
+        self.res = booking.place_hold(self.tenant.id, self.car.id, START, END, **CONTACT)
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _event(self, status, order="O1", **extra):
+        return {"orderId": order, "externalReference": str(self.res.id), "status": status, **extra}
+
+    def _reservation(self):
+        db.session.expire_all()
+        return db.session.get(Reservation, self.res.id)
+
+    def test_webhook_records_event_and_acknowledges_without_touching_reservation(self):
+        resp = self.app.test_client().post("/acme/payments/webhook", json=self._event("approved"))
+        self.assertEqual(resp.status_code, 200)
+        event = PaymentEvent.query.one()
+        self.assertEqual((event.order_ref, event.status, event.reservation_id, event.state),
+                         ("O1", "approved", self.res.id, "pending"))
+        self.assertEqual(self._reservation().status, "pending")
+
+        self.assertEqual(self.worker.process_once(), 1)
+        self.assertEqual(self._reservation().status, "confirmed")
+        self.assertEqual(db.session.get(PaymentEvent, event.id).state, "done")
+
+    def test_replayed_notification_is_a_noop(self):
+        self.assertTrue(payment_events.ingest(self.tenant.id, self._event("approved")))
+        self.assertFalse(payment_events.ingest(self.tenant.id, self._event("APPROVED ")))
+        self.assertEqual(PaymentEvent.query.count(), 1)
+        self.assertEqual(self.worker.stats()["duplicates"], 1)
+
+        self.worker.process_once()
+        self.assertFalse(payment_events.ingest(self.tenant.id, self._event("approved")))
+        self.assertEqual(self.worker.process_once(), 0)
+
+    def test_events_of_a_reservation_are_applied_in_arrival_order(self):
+        payment_events.ingest(self.tenant.id, self._event("analysis"))
+        payment_events.ingest(self.tenant.id, self._event("approved"))
+        self.assertEqual(len(self.worker.claim(10)), 1)  # o segundo espera o primeiro
+        db.session.execute(db.update(PaymentEvent).values(state="pending"))
+        db.session.commit()
+
+        self.worker.process_once()
+        self.assertEqual(self._reservation().status, "under_review")
+        self.worker.process_once()
+        self.assertEqual(self._reservation().status, "confirmed")
+
+    def test_late_review_does_not_undo_confirmation(self):
+        payment_events.ingest(self.tenant.id, self._event("approved"))
+        payment_events.ingest(self.tenant.id, self._event("pending"))
+        while self.worker.process_once():
+            pass
+        self.assertEqual(self._reservation().status, "confirmed")
+        self.assertEqual(self.worker.stats()["unchanged"], 1)
+
+    def test_review_applies_after_payment_link_was_issued(self):
+        self.res.status = "pending_payment"
+        db.session.commit()
+        payment_events.ingest(self.tenant.id, self._event("analysis"))
+        self.worker.process_once()
+        self.assertEqual(self._reservation().status, "under_review")
+
+    def test_unknown_reservation_is_ignored_and_empty_payload_not_stored(self):
+        self.assertFalse(payment_events.ingest(self.tenant.id, {"status": "approved"}))
+        payment_events.ingest(self.tenant.id, {"orderId": "O9", "invoice": "RES-999", "status": "paid"})
+        self.worker.process_once()
+        self.assertEqual(PaymentEvent.query.one().state, "ignored")
+
+    def test_failure_is_retried_then_dead_lettered(self):
+        payment_events.ingest(self.tenant.id, self._event("approved"))
+        with mock.patch.object(payment_events, "apply", side_effect=RuntimeError("db down")):
+            self.worker.process_once()
+            event = PaymentEvent.query.one()
+            self.assertEqual((event.state, event.attempts), ("pending", 1))
+            event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            self.worker.process_once()
+        db.session.expire_all()
+        event = PaymentEvent.query.one()
+        self.assertEqual((event.state, event.last_error), ("dead", "db down"))
+        self.assertEqual(self._reservation().status, "pending")
+
+    def test_inline_mode_applies_within_the_request(self):
+        self.worker.inline = True
+        self.app.test_client().post("/acme/payments/webhook", json=self._event("refused"))
+        self.assertEqual(self._reservation().status, "canceled")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+import os
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import create_app
+from app.extensions import db
+from app.models import Reservation, Tenant, Vehicle, VehicleCategory
+from app.services import globalpays, payment_reconcile
+from app.services.globalpays import GatewayClient, TokenManager
+from app.services.payment_reconcile import RateLimiter
+
+TABLES = [Tenant.__table__, VehicleCategory.__table__, Vehicle.__table__, Reservation.__table__]
+START = datetime(2030, 5, 1, 10)
+CONTACT = dict(customer_name="x", phone="1", email="x@x.com", pickup_airport="MIA", dropoff_airport="MIA")
+
+
+class FakeProvider:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, tenant_id, creds, order_id):
+        with self._lock:
+            self.calls.append(order_id)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            status = self.statuses.get(order_id)
+            if isinstance(status, Exception):
+                raise status
+            return {"status": status, "order_id": order_id} if status else {}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class FakeResp:
+    def __init__(self, status=200, body=None):
+        self.status_code = status
+        self.headers = {"content-type": "application/json"}
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+class FakeGateway:
+    """Auth at /checkoutapi/auth; orders only at /transaction?id=<id> with a Bearer header."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def auth(self, url, data=None, timeout=None):
+        if url.endswith("/checkoutapi/auth"):
+            return FakeResp(body={"data": {"token": "tok"}})
+        return FakeResp(404, {"msg": "Rota não encontrada"})
+
+    def request(self, method, url, json=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls.append(url)
+        if "/transaction?id=" not in url:
+            return FakeResp(404, {"msg": "Rota não encontrada"})
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return FakeResp(401, {"msg": "unauthorized"})
+        order_id = url.rsplit("=", 1)[1]
+        if order_id not in self.statuses:
+            return FakeResp(404, {"msg": "pedido não encontrado"})
+        return FakeResp(200, {"data": {"orderId": order_id, "status": self.statuses[order_id]}})
+
+
+class PaymentReconcileTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        cat = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv")
+        db.session.add(cat)
+        db.session.commit()
+        self.cars = [Vehicle(tenant_id=self.tenant.id, category_id=cat.id, model=f"Car {i}") for i in range(6)]
+        db.session.add_all(self.cars)
+        db.session.commit()
+
+        old = datetime.utcnow() - timedelta(hours=1)
+        self.rows = {}
+        for i, (order, status) in enumerate([
+            ("O1", "pending_payment"), ("O2", "pending_payment"), ("O3", "under_review"),
+            ("O4", "pending"), ("O5", "confirmed"), (None, "pending"),
+        ]):
+            res = Reservation(
+                tenant_id=self.tenant.id, vehicle_id=self.cars[i].id, category_id=cat.id,
+                pickup_dt=START + timedelta(days=10 * i), dropoff_dt=START + timedelta(days=10 * i + 3),
+                status=status, gp_order_id=order, created_at=old, **CONTACT,
+            )
+            db.session.add(res)
+            self.rows[order] = res
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _status(self, order):
+        db.session.expire_all()
+        return db.session.get(Reservation, self.rows[order].id).status
+
+    def _run(self, provider, **kwargs):
+        kwargs.setdefault("rate", 0)
+        return payment_reconcile.reconcile(lookup=provider, **kwargs)
+
+    def test_open_reservations_are_reconciled_in_batches(self):
+        provider = FakeProvider({"O1": "approved", "O2": "refused", "O3": "analysis", "O4": None})
+        summary = self._run(provider, batch=2, concurrency=2)
+
+        self.assertEqual(sorted(provider.calls), ["O1", "O2", "O3", "O4"])  # O5 já confirmada; sem order id fica de fora
+        self.assertEqual(summary.as_dict()["changed"], {"confirmed": 1, "canceled": 1})
+        self.assertEqual((summary.checked, summary.unchanged, summary.unanswered, summary.failed), (4, 1, 1, 0))
+        self.assertEqual([self._status(o) for o in ("O1", "O2", "O3", "O4")],
+                         ["confirmed", "canceled", "under_review", "pending"])
+        self.assertEqual(db.session.get(Reservation, self.rows["O2"].id).gp_payment_status, "refused")
+
+    def test_dry_run_writes_nothing(self):
+        summary = self._run(FakeProvider({"O1": "approved", "O2": "approved"}), dry_run=True)
+        self.assertEqual(summary.changed["confirmed"], 2)
+        self.assertEqual((self._status("O1"), self._status("O2")), ("pending_payment", "pending_payment"))
+
+    def test_recent_reservations_limit_and_failures(self):
+        self.rows["O1"].created_at = datetime.utcnow()
+        db.session.commit()
+        provider = FakeProvider({"O2": RuntimeError("timeout"), "O3": "approved"})
+        summary = self._run(provider, limit=2)
+        self.assertEqual(provider.calls, ["O2", "O3"])
+        self.assertEqual((summary.checked, summary.failed, summary.changed["confirmed"]), (2, 1, 1))
+        self.assertEqual(self._status("O2"), "pending_payment")
+
+    def test_real_consult_sends_one_request_per_order_once_the_route_is_learned(self):
+        gateway = FakeGateway({"O1": "approved", "O2": "refused", "O3": "analysis"})  # O4: pedido não encontrado
+        client = GatewayClient(TokenManager(post=gateway.auth), http=gateway)
+        self.app.config.update(GP_API_V1_BASE="https://gp.test/v1", GP_PUB_KEY="pk", GP_MERCHANT_CODE="m1")
+        with mock.patch.object(globalpays, "client", client):
+            summary = payment_reconcile.reconcile(rate=0, concurrency=1)
+
+        self.assertEqual(summary.as_dict()["changed"], {"confirmed": 1, "canceled": 1})
+        self.assertEqual((summary.unchanged, summary.unanswered, summary.failed), (1, 1, 0))
+        first = len(gateway.calls) - 3  # só a primeira consulta sonda
+        self.assertEqual(gateway.calls[first:], [f"https://gp.test/v1/paymentapi/transaction?id={o}"
+                                                 for o in ("O2", "O3", "O4")])
+
+    def test_concurrency_is_bounded(self):
+        provider = FakeProvider({})
+        self._run(provider, concurrency=1)
+        self.assertEqual(provider.peak, 1)
+
+
+class RateLimiterTests(unittest.TestCase):
+    def test_waits_for_tokens(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(s):
+            slept.append(s)
+            now[0] += s
+
+        limiter = RateLimiter(2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            limiter.wait()
+        self.assertAlmostEqual(sum(slept), 1.0)  # 2 no balde + 2 a 2/s
+
+    def test_zero_means_unlimited(self):
+        limiter = RateLimiter(0, sleep=lambda s: self.fail("should not sleep"))
+        for _ in range(10):
+            limiter.wait()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.services.pdf_renderer import AssetFetcher
+
+
+class AssetFetcherTests(unittest.TestCase):
+    def setUp(self):
+        self.static = Path(tempfile.mkdtemp())
+        self.logo = self.static / "uploads" / "logo.png"
+        self.logo.parent.mkdir(parents=True)
+        self.logo.write_bytes(b"png-v1")
+        self.remote_calls = []
+        self.fetcher = AssetFetcher(max_items=3, remote_ttl=60, fallback=self._remote)
+
+    def tearDown(self):
+        shutil.rmtree(self.static, ignore_errors=True)
+
+    def _remote(self, url, timeout=10, ssl_context=None):
+        self.remote_calls.append(url)
+        return {"string": b"remote:" + url.encode(), "mime_type": "image/png", "redirected_url": url}
+
+    def test_local_file_cached_until_mtime_changes(self):
+        url = self.logo.as_uri()
+        first = self.fetcher.fetch(url)
+        self.assertEqual(first["string"], b"png-v1")
+        self.assertEqual(first["mime_type"], "image/png")
+        self.assertIs(self.fetcher.fetch(url), first)
+
+        self.logo.write_bytes(b"png-v2")
+        os.utime(self.logo, ns=(1, 1))
+        self.assertEqual(self.fetcher.fetch(url)["string"], b"png-v2")
+
+    def test_own_static_urls_are_read_from_disk(self):
+        static_map = {"http://app.test/static/": str(self.static)}
+        got = self.fetcher.fetch("http://app.test/static/uploads/logo.png", static_map=static_map)
+        self.assertEqual(got["string"], b"png-v1")
+        self.assertEqual(self.remote_calls, [])
+        # fora da pasta mapeada (path traversal) não vira leitura local
+        self.fetcher.fetch("http://app.test/static/../secret.txt", static_map=static_map)
+        self.assertEqual(self.remote_calls, ["http://app.test/static/../secret.txt"])
+
+    def test_remote_cached_and_lru_bounded(self):
+        for _ in range(2):
+            self.fetcher.fetch("https://cdn.test/a.png")
+        self.assertEqual(self.remote_calls, ["https://cdn.test/a.png"])
+        for name in ("b", "c", "d"):
+            self.fetcher.fetch(f"https://cdn.test/{name}.png")
+        self.assertEqual(self.fetcher.stats()["items"], 3)
+        self.fetcher.fetch("https://cdn.test/a.png")  # expulso pelo LRU: busca de novo
+        self.assertEqual(self.remote_calls.count("https://cdn.test/a.png"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
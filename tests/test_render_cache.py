@@ -0,0 +1,49 @@
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+from pathlib import Path
+
+from app.services import render_cache
+from app.services.render_queue import RenderQueue
+
+
+class RenderCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.pdf = self.tmp / "contrato_reserva_1.pdf"
+        self.queue = RenderQueue(workers=0, render=bytes)  # bytes(html, "utf-8") no lugar do WeasyPrint
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_fingerprint_depends_on_html_and_base_url(self):
+        fp = render_cache.fingerprint("<p>a</p>", "/static")
+        self.assertEqual(fp, render_cache.fingerprint("<p>a</p>", "/static"))
+        self.assertNotEqual(fp, render_cache.fingerprint("<p>b</p>", "/static"))
+        self.assertNotEqual(fp, render_cache.fingerprint("<p>a</p>", "/other"))
+
+    def test_queue_writes_sidecar_and_digest_matches(self):
+        fp = render_cache.fingerprint("v1", "utf-8")
+        self.assertIsNone(render_cache.current_digest(self.pdf, fp))
+        self.queue.submit(self.pdf, "v1", "utf-8", fingerprint=fp)
+        self.assertEqual(render_cache.current_digest(self.pdf, fp), sha256(b"v1").hexdigest())
+        # dados mudaram: fingerprint novo não casa com o PDF em disco
+        self.assertIsNone(render_cache.current_digest(self.pdf, render_cache.fingerprint("v2", "utf-8")))
+
+    def test_missing_pdf_never_matches(self):
+        fp = render_cache.fingerprint("v1", "utf-8")
+        self.queue.submit(self.pdf, "v1", "utf-8", fingerprint=fp)
+        self.pdf.unlink()
+        self.assertIsNone(render_cache.current_digest(self.pdf, fp))
+
+    def test_adopt_only_without_sidecar(self):
+        self.pdf.write_bytes(b"old")
+        fp = render_cache.fingerprint("whatever")
+        self.assertEqual(render_cache.adopt(self.pdf, fp), sha256(b"old").hexdigest())
+        self.assertIsNone(render_cache.adopt(self.pdf, "other"))
+        self.assertEqual(render_cache.current_digest(self.pdf, fp), sha256(b"old").hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
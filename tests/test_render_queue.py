@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.services.render_queue import RenderFailed, RenderQueue
+
+
+def _fail(html, base_url):
+    raise ValueError("boom")
+
+
+class RenderQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.out = self.tmp / "contracts" / "contrato_reserva_1.pdf"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_inline_mode_writes_before_returning(self):
+        # bytes(html, "utf-8") faz o papel do WeasyPrint (picklable, sem dependências)
+        queue = RenderQueue(workers=0, render=bytes)
+        job = queue.submit(self.out, "<p>oi</p>", "utf-8")
+        self.assertTrue(job.ok)
+        self.assertEqual(self.out.read_bytes(), b"<p>oi</p>")
+        self.assertIsNone(queue.pending(self.out))
+        self.assertEqual(queue.stats()["rendered"], 1)
+
+    def test_failure_keeps_file_absent(self):
+        queue = RenderQueue(workers=0, render=_fail)
+        job = queue.submit(self.out, "<p>oi</p>")
+        self.assertFalse(job.ok)
+        self.assertFalse(self.out.exists())
+        self.assertEqual(queue.stats()["failed"], 1)
+
+    def test_gives_up_after_max_attempts_of_the_same_data(self):
+        calls = []
+
+        def render(html, base_url):
+            calls.append(html)
+            raise ValueError("boom")
+
+        now = [0.0]
+        queue = RenderQueue(workers=0, render=render, max_attempts=2, failure_ttl=60, clock=lambda: now[0])
+        queue.submit(self.out, "<p>oi</p>", fingerprint="fp1")
+        self.assertFalse(queue.gave_up(self.out, "fp1"))
+        queue.submit(self.out, "<p>oi</p>", fingerprint="fp1")
+        self.assertTrue(queue.gave_up(self.out, "fp1"))
+
+        job = queue.submit(self.out, "<p>oi</p>", fingerprint="fp1")
+        self.assertFalse(job.ok)
+        self.assertIsInstance(job.future.exception(), RenderFailed)
+        self.assertEqual(len(calls), 2)  # não gera de novo
+        self.assertIsNone(queue.pending(self.out))
+
+        self.assertFalse(queue.gave_up(self.out, "fp2"))  # dados novos: tenta de novo
+        now[0] = 61
+        self.assertFalse(queue.gave_up(self.out, "fp1"))  # passou o failure_ttl
+
+    def test_success_clears_the_failure(self):
+        queue = RenderQueue(workers=0, render=_fail, max_attempts=1)
+        queue.submit(self.out, "<p>oi</p>", fingerprint="fp1")
+        self.assertTrue(queue.gave_up(self.out, "fp1"))
+        queue.render = bytes
+        queue.submit(self.out, "<p>oi</p>", "utf-8", fingerprint="fp2")
+        self.assertFalse(queue.gave_up(self.out, "fp1"))
+
+    def test_process_pool_latest_job_wins(self):
+        queue = RenderQueue(workers=1, render=bytes)
+        try:
+            first = queue.submit(self.out, "v1", "utf-8")
+            second = queue.submit(self.out, "v2", "utf-8")
+            self.assertIs(queue.pending(self.out), second)
+            self.assertTrue(queue.wait(self.out, timeout=60))
+            first.future.result(timeout=60)
+            self.assertTrue(second.done.wait(60))
+            self.assertEqual(self.out.read_bytes(), b"v2")
+            self.assertIsNone(queue.pending(self.out))
+        finally:
+            queue.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import unittest
+from datetime import datetime
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, VehicleCategory, Vehicle, Rate, Reservation
+from app.services import search_cache
+
+TABLES = [
+    Tenant.__table__,
+    VehicleCategory.__table__,
+    Vehicle.__table__,
+    Rate.__table__,
+    Reservation.__table__,
+]
+WINDOW = dict(start_dt=datetime(2025, 5, 2), end_dt=datetime(2025, 5, 3))
+
+
+class SearchCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        self.other = Tenant(name="Other", slug="other")
+        db.session.add_all([self.tenant, self.other])
+        db.session.commit()
+        self.cat = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv")
+        db.session.add(self.cat)
+        db.session.commit()
+        db.session.add(Rate(tenant_id=self.tenant.id, category_id=self.cat.id, daily_rate=50))
+        self.cars = [
+            Vehicle(tenant_id=self.tenant.id, category_id=self.cat.id, model=f"Car {i}")
+            for i in range(2)
+        ]
+        db.session.add_all(self.cars)
+        db.session.commit()
+        self.cache = self.app.extensions[search_cache.EXT_KEY]
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _confirmed(self, tenant_id=None):
+        return Reservation(
+            tenant_id=tenant_id or self.tenant.id, vehicle_id=self.cars[0].id, category_id=self.cat.id,
+            customer_name="x", phone="1", email="x@x.com", pickup_airport="MIA", dropoff_airport="MIA",
+            pickup_dt=datetime(2025, 5, 1), dropoff_dt=datetime(2025, 5, 5), status="confirmed",
+        )
+
+    def test_identical_search_is_served_from_cache(self):
+        first = search_cache.cached_search(self.tenant.id, category_ids=["1"], **WINDOW)
+        again = search_cache.cached_search(self.tenant.id, category_ids=[1, 1], **WINDOW)
+        self.assertIs(first, again)
+        stats = search_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_reservation_commit_invalidates_only_that_tenant(self):
+        self.assertEqual(search_cache.cached_search(self.tenant.id, **WINDOW).total, 2)
+        other_gen = self.cache.generation(self.other.id)
+
+        db.session.add(self._confirmed())
+        db.session.commit()
+
+        self.assertEqual(search_cache.cached_search(self.tenant.id, **WINDOW).total, 1)
+        self.assertEqual(self.cache.generation(self.other.id), other_gen)
+        self.assertEqual(search_cache.stats()["misses"], 2)
+
+    def test_rollback_does_not_invalidate(self):
+        search_cache.cached_search(self.tenant.id, **WINDOW)
+        before = self.cache.generation(self.tenant.id)
+        db.session.add(self._confirmed())
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.cache.generation(self.tenant.id), before)
+        search_cache.cached_search(self.tenant.id, **WINDOW)
+        self.assertEqual(search_cache.stats()["hits"], 1)
+
+    def test_savepoint_rollback_keeps_outer_changes(self):
+        before = self.cache.generation(self.tenant.id)
+        db.session.add(self._confirmed())
+        db.session.flush()
+        savepoint = db.session.begin_nested()
+        savepoint.rollback()
+        db.session.commit()
+        self.assertEqual(self.cache.generation(self.tenant.id), before + 1)
+
+    def test_local_tier_is_bounded(self):
+        small = search_cache.SearchCache(maxsize=2, ttl=60)
+        for page in range(1, 4):
+            small.get_or_compute(self.tenant.id, (("page", page),), lambda: object())
+        self.assertEqual(small.stats()["size"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
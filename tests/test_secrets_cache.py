@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app import utils
+from app.utils import FileSecrets, MemorySecrets, SecretsCache
+
+
+class CountingBackend(MemorySecrets):
+    def __init__(self, data=None):
+        super().__init__(data)
+        self.calls = 0
+        self.fail = False
+        self.gate = None
+
+    def get(self, name):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise ConnectionError("vault down")
+        return super().get(name)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SecretsCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.backend = CountingBackend({"gpay-acme-dev": '{"public_key": "pk1"}'})
+        self.clock = Clock()
+        self.cache = SecretsCache(self.backend, ttl=60, negative_ttl=10, stale_ttl=600, clock=self.clock)
+
+    def _wait_refresh(self):
+        for t in threading.enumerate():
+            if t.name == "secrets-refresh":
+                t.join(5)
+
+    def test_value_is_fetched_once_within_ttl(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.get("gpay-acme-dev"), '{"public_key": "pk1"}')
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_missing_secret_is_negatively_cached(self):
+        self.assertIsNone(self.cache.get("gpay-ghost-dev"))
+        self.assertIsNone(self.cache.get("gpay-ghost-dev"))
+        self.assertEqual(self.backend.calls, 1)
+        self.clock.now += 11
+        self.cache.get("gpay-ghost-dev")
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self.cache.get("gpay-acme-dev")
+        self.backend.data["gpay-acme-dev"] = '{"public_key": "pk2"}'
+        self.clock.now += 61
+        self.assertEqual(self.cache.get("gpay-acme-dev"), '{"public_key": "pk1"}')
+        self._wait_refresh()
+        self.assertEqual(self.cache.get("gpay-acme-dev"), '{"public_key": "pk2"}')
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_backend_failure_falls_back_to_expired_value(self):
+        self.cache.get("gpay-acme-dev")
+        self.backend.fail = True
+        self.clock.now += 61 + 600
+        self.assertEqual(self.cache.get("gpay-acme-dev"), '{"public_key": "pk1"}')
+        with self.assertRaises(ConnectionError):
+            self.cache.get("other")
+
+    def test_concurrent_misses_make_one_backend_call(self):
+        self.backend.gate = threading.Event()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get("gpay-acme-dev"))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        self.backend.gate.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.backend.calls, 1)
+
+    def test_put_wins_over_refresh_in_flight(self):
+        self.cache.get("gpay-acme-dev")
+        self.backend.gate = threading.Event()
+        self.clock.now += 61
+        self.cache.get("gpay-acme-dev")  # dispara refresh (bloqueado no gate)
+        self.cache.put("gpay-acme-dev", '{"public_key": "new"}')
+        self.backend.gate.set()
+        self._wait_refresh()
+        self.assertEqual(self.cache.get("gpay-acme-dev"), '{"public_key": "new"}')
+
+
+class SecretHelpersTests(unittest.TestCase):
+    def setUp(self):
+        self.backend = CountingBackend()
+        self.cache = SecretsCache(self.backend)
+        for name, value in (("_secrets_backend", self.backend), ("secrets_cache", self.cache)):
+            patcher = mock.patch.object(utils, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_set_secret_refreshes_cache(self):
+        self.assertIsNone(utils.get_secret_cached("gpay-acme-dev"))
+        utils.kv_set_secret("gpay-acme-dev", '{"token": "t"}', tags={"tenant": "acme"})
+        self.assertEqual(utils.get_secret_cached("gpay-acme-dev"), '{"token": "t"}')
+        self.assertEqual(self.backend.calls, 1)
+
+    def test_kv_get_secret_is_uncached_and_raises_when_missing(self):
+        with self.assertRaises(KeyError):
+            utils.kv_get_secret("nope")
+        self.assertFalse(utils.kv_secret_exists("nope"))
+
+
+class FileSecretsTests(unittest.TestCase):
+    def test_round_trip(self):
+        backend = FileSecrets(os.path.join(tempfile.mkdtemp(), "secrets"))
+        self.assertIsNone(backend.get("gpay-acme-dev"))
+        backend.set("gpay-acme-dev", "{}")
+        self.assertEqual(backend.get("gpay-acme-dev"), "{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
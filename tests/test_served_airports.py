@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.services import served_airports
+from app.storage import save_tenant_airports
+
+
+class ServedAirportsTests(unittest.TestCase):
+    def setUp(self):
+        self.instance = tempfile.mkdtemp()
+        self.path = served_airports.airports_path(self.instance, "acme")
+
+    def tearDown(self):
+        served_airports.invalidate(self.instance)
+        shutil.rmtree(self.instance, ignore_errors=True)
+
+    def _write(self, data, mtime_ns=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_parse_formats_and_dedup(self):
+        parsed = served_airports.parse({"items": [
+            "Miami Intl (MIA) - Miami",
+            "Miami Intl (MIA) – Miami",
+            {"label": "Orlando Intl (MCO) - Orlando"},
+            {"name": "Guarulhos", "iata": "gru", "city": "São Paulo"},
+            {"name": "sem código"},
+            "  ",
+        ]})
+        self.assertEqual(parsed.labels, (
+            "Miami Intl (MIA) - Miami",
+            "Orlando Intl (MCO) - Orlando",
+            "Guarulhos (GRU) - São Paulo",
+        ))
+        self.assertTrue(parsed.serves("  miami intl (mia) − miami "))
+        self.assertFalse(parsed.serves(""))
+        self.assertEqual(served_airports.parse("x"), served_airports.EMPTY)
+
+    def test_missing_file_does_not_create_folders(self):
+        self.assertEqual(served_airports.get(self.instance, "acme", check_interval=0), served_airports.EMPTY)
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+
+    def test_reloads_only_when_mtime_changes(self):
+        self._write(["Miami Intl (MIA) - Miami"], mtime_ns=1_000_000_000)
+        first = served_airports.get(self.instance, "acme", check_interval=0)
+        self.assertIs(served_airports.get(self.instance, "acme", check_interval=0), first)
+
+        self._write(["Orlando Intl (MCO) - Orlando"], mtime_ns=1_000_000_000)
+        self.assertIs(served_airports.get(self.instance, "acme", check_interval=0), first)
+
+        os.utime(self.path, ns=(2_000_000_000, 2_000_000_000))
+        self.assertEqual(served_airports.get(self.instance, "acme", check_interval=0).labels,
+                         ("Orlando Intl (MCO) - Orlando",))
+
+    def test_check_interval_skips_stat(self):
+        self._write(["Miami Intl (MIA) - Miami"], mtime_ns=1_000_000_000)
+        first = served_airports.get(self.instance, "acme", check_interval=3600)
+        os.remove(self.path)
+        self.assertIs(served_airports.get(self.instance, "acme", check_interval=3600), first)
+
+    def test_save_invalidates_immediately(self):
+        self._write(["Miami Intl (MIA) - Miami"], mtime_ns=1_000_000_000)
+        served_airports.get(self.instance, "acme", check_interval=3600)
+        self.assertTrue(save_tenant_airports(self.instance, "acme", ["Orlando Intl (MCO) - Orlando"]))
+        got = served_airports.get(self.instance, "acme", check_interval=3600)
+        self.assertEqual(got.labels, ("Orlando Intl (MCO) - Orlando",))
+
+
+if __name__ == "__main__":
+    unittest.main()
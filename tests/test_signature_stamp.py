@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab.pdfgen import canvas as rl_canvas
+
+from app.services.signature_stamp import StampLayout, stamp_signature
+
+STAMP = "Signed 2025-06-01 12:00 UTC - IP 203.0.113.7"
+
+
+def _pdf(sizes):
+    buf = BytesIO()
+    can = rl_canvas.Canvas(buf)
+    for i, size in enumerate(sizes):
+        can.setPageSize(size)
+        can.drawString(72, 720, f"Pagina {i + 1}")
+        can.showPage()
+    can.save()
+    return buf.getvalue()
+
+
+def _png():
+    buf = BytesIO()
+    Image.new("RGBA", (300, 100), (0, 0, 120, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class SignatureStampTests(unittest.TestCase):
+    def _stamp(self, sizes, **layout):
+        out = BytesIO()
+        n = stamp_signature(BytesIO(_pdf(sizes)), _png(), out, layout=StampLayout(**layout),
+                            signed_at=datetime(2025, 6, 1, 12, 0), client_ip="203.0.113.7")
+        out.seek(0)
+        return n, PdfReader(out)
+
+    def test_every_page_keeps_content_and_gets_audit_stamp(self):
+        n, reader = self._stamp([(595, 842)] * 4)
+        self.assertEqual(n, 4)
+        for i, page in enumerate(reader.pages):
+            text = page.extract_text()
+            self.assertIn(f"Pagina {i + 1}", text)
+            self.assertIn(STAMP, text)
+
+    def test_middle_pages_share_one_overlay(self):
+        _n, reader = self._stamp([(595, 842)] * 5)
+        forms = [page["/Resources"]["/XObject"] for page in reader.pages]
+        middle = {forms[i].raw_get("/SigStamp0").idnum for i in range(4)}
+        self.assertEqual(len(middle), 1)
+        self.assertIn("/SigStamp1", forms[4])  # última página: assinatura completa
+
+    def test_mixed_page_sizes_and_no_audit(self):
+        _n, reader = self._stamp([(595, 842), (842, 595), (595, 842)], audit=False)
+        self.assertEqual(len(reader.pages), 3)
+        self.assertNotIn(STAMP, reader.pages[1].extract_text())
+        self.assertEqual(float(reader.pages[1].mediabox.width), 842)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import smtplib
+import tempfile
+import types
+import unittest
+from email.message import EmailMessage
+from unittest import mock
+
+from app.services import mailer
+from app.services.smtp_pool import SMTPPool
+
+CFG = {"host": "smtp.acme.test", "port": 587, "user": "acme", "password": "s3cret", "use_tls": True}
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.sent = []
+        self.noop_code = 250
+        self.dead = False
+        self.closed = False
+
+    def send_message(self, msg):
+        if self.dead:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        if msg["To"] == "refused@x.com":
+            raise smtplib.SMTPRecipientsRefused({"refused@x.com": (550, b"no")})
+        self.sent.append(msg["To"])
+
+    def noop(self):
+        if self.dead:
+            raise smtplib.SMTPServerDisconnected()
+        return (self.noop_code, b"ok")
+
+    def quit(self):
+        self.closed = True
+
+
+def _msg(to="ana@x.com"):
+    m = EmailMessage()
+    m["To"] = to
+    m.set_content("oi")
+    return m
+
+
+class SMTPPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+        def connect(cfg):
+            conn = FakeSMTP()
+            self.opened.append(conn)
+            return conn
+
+        self.pool = SMTPPool(connect=connect, max_messages=3, noop_after=1000)
+
+    def test_connection_is_reused_per_credentials(self):
+        for _ in range(2):
+            self.pool.send(CFG, _msg())
+        self.pool.send({**CFG, "user": "beta"}, _msg())
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.opened[0].sent, ["ana@x.com", "ana@x.com"])
+        self.assertEqual(self.pool.stats()["reused"], 1)
+
+    def test_session_rotates_after_max_messages(self):
+        for _ in range(4):
+            self.pool.send(CFG, _msg())
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(len(self.opened[0].sent), 3)
+
+    def test_dead_reused_connection_reconnects_and_sends(self):
+        self.pool.send(CFG, _msg())
+        self.opened[0].dead = True
+        self.pool.send(CFG, _msg("bia@x.com"))
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.opened[1].sent, ["bia@x.com"])
+
+    def test_failed_noop_discards_idle_connection(self):
+        self.pool.noop_after = 0
+        self.pool.send(CFG, _msg())
+        self.opened[0].noop_code = 421
+        self.pool.send(CFG, _msg())
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(self.opened[0].closed)
+
+    def test_server_rejection_keeps_session(self):
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            self.pool.send(CFG, _msg("refused@x.com"))
+        self.pool.send(CFG, _msg())
+        self.assertEqual(len(self.opened), 1)
+
+    def test_idle_timeout_closes_connection(self):
+        self.pool.idle_timeout = 0
+        self.pool.send(CFG, _msg())
+        self.pool.send(CFG, _msg())
+        self.assertEqual(len(self.opened), 2)
+
+
+class TenantMailCredsCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        patcher = mock.patch.object(mailer, "_DEV_DIR", self.tmp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mailer._creds_cache.clear()
+        self.tenant = types.SimpleNamespace(slug="acme", mail_secret_id=None)
+
+    def test_saved_creds_are_read_once_and_refreshed_on_save(self):
+        alias = mailer.save_tenant_mail_creds(tenant=self.tenant, host="h1", port=587, user="u",
+                                              password="p", use_tls=True, use_ssl=False)
+        self.tenant.mail_secret_id = alias
+        real_open = open
+        with mock.patch("builtins.open", side_effect=real_open) as opened:
+            self.assertEqual(mailer.get_tenant_mail_creds(self.tenant)["host"], "h1")
+            self.assertEqual(mailer.get_tenant_mail_creds(self.tenant)["host"], "h1")
+        self.assertEqual(opened.call_count, 1)
+
+        mailer.save_tenant_mail_creds(tenant=self.tenant, host="h2", port=587, user="u",
+                                      password="p", use_tls=True, use_ssl=False)
+        self.assertEqual(mailer.get_tenant_mail_creds(self.tenant)["host"], "h2")
+
+    def test_missing_file_is_none(self):
+        self.tenant.mail_secret_id = "mail/ghost"
+        self.assertIsNone(mailer.get_tenant_mail_creds(self.tenant))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "mail_ghost.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()
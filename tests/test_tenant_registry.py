@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant
+from app.services import tenant_registry
+from app.services.tenant_registry import TenantRegistry, TenantSnapshot
+
+TABLES = [Tenant.__table__]
+
+
+class TenantRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stamp = os.path.join(self.tmp.name, "tenant_registry.stamp")
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+                "TENANT_REGISTRY_STAMP": self.stamp,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        db.session.add(Tenant(name="Acme", slug="acme"))
+        db.session.commit()
+        self.registry = tenant_registry.get_registry()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        self.tmp.cleanup()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _count_queries(self, fn):
+        statements = []
+        listener = lambda *a, **kw: statements.append(a[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        return len(statements)
+
+    def test_second_lookup_does_not_hit_the_database(self):
+        self.assertEqual(self._count_queries(lambda: tenant_registry.get_tenant("acme")), 1)
+        self.assertEqual(self._count_queries(lambda: tenant_registry.get_tenant("acme")), 0)
+        self.assertEqual(self._count_queries(lambda: tenant_registry.get_tenant("nope")), 1)
+        self.assertIsNone(tenant_registry.get_tenant("nope"))
+
+    def test_snapshot_is_read_only(self):
+        snap = tenant_registry.get_tenant("acme")
+        self.assertIsInstance(snap, TenantSnapshot)
+        with self.assertRaises(AttributeError):
+            snap.name = "Other"
+        self.assertIsNone(getattr(snap, "support_email", None))
+
+    def test_tenant_update_invalidates_this_and_other_workers(self):
+        other_worker = TenantRegistry(ttl=300, stamp_path=self.stamp)
+        self.assertFalse(tenant_registry.get_tenant("acme").is_blocked)
+        self.assertFalse(other_worker.get("acme").is_blocked)
+
+        tenant = Tenant.query.filter_by(slug="acme").one()
+        tenant.is_blocked = True
+        db.session.commit()
+
+        self.assertTrue(tenant_registry.get_tenant("acme").is_blocked)
+        self.assertTrue(other_worker.get("acme").is_blocked)
+
+    def test_savepoint_rollback_keeps_the_pending_invalidation(self):
+        self.assertEqual(tenant_registry.get_tenant("acme").name, "Acme")
+        tenant = Tenant.query.filter_by(slug="acme").one()
+        tenant.name = "Acme Rent"
+        db.session.flush()
+        savepoint = db.session.begin_nested()
+        savepoint.rollback()
+        db.session.commit()
+        self.assertEqual(tenant_registry.get_tenant("acme").name, "Acme Rent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import unittest
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import Tenant, VehicleCategory, Vehicle, Rate, Reservation
+from app.services.vehicle_search import search_vehicles
+
+TABLES = [
+    Tenant.__table__,
+    VehicleCategory.__table__,
+    Vehicle.__table__,
+    Rate.__table__,
+    Reservation.__table__,
+]
+
+
+class VehicleSearchTests(unittest.TestCase):
+    def setUp(self):
+        self._old_db_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app(
+            {
+                "TESTING": True,
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            }
+        )
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.metadata.create_all(bind=db.engine, tables=TABLES)
+
+        self.tenant = Tenant(name="Acme", slug="acme")
+        db.session.add(self.tenant)
+        db.session.commit()
+        self.suv = VehicleCategory(tenant_id=self.tenant.id, name="SUV", slug="suv", seats=7)
+        self.eco = VehicleCategory(tenant_id=self.tenant.id, name="Eco", slug="eco", seats=None)
+        self.bare = VehicleCategory(tenant_id=self.tenant.id, name="No rate", slug="bare")
+        db.session.add_all([self.suv, self.eco, self.bare])
+        db.session.commit()
+        db.session.add_all([
+            Rate(tenant_id=self.tenant.id, category_id=self.suv.id, daily_rate=80),
+            Rate(tenant_id=self.tenant.id, category_id=self.eco.id, daily_rate=40),
+            Rate(tenant_id=self.tenant.id, category_id=self.eco.id, daily_rate=30),  # mais recente vale
+        ])
+        self.cars = []
+        for i, cat in enumerate([self.suv, self.eco, self.suv, self.eco, self.bare]):
+            self.cars.append(Vehicle(tenant_id=self.tenant.id, category_id=cat.id, model=f"Model {i}"))
+        db.session.add_all(self.cars)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.metadata.drop_all(bind=db.engine, tables=TABLES)
+        self.ctx.pop()
+        if self._old_db_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = self._old_db_url
+
+    def _models(self, page):
+        return [card.model for card in page.items]
+
+    def test_vehicles_without_rate_are_skipped_and_latest_rate_wins(self):
+        page = search_vehicles(self.tenant.id)
+        self.assertEqual(page.total, 4)
+        self.assertEqual({c.daily for c in page.items if c.category_name == "Eco"}, {30.0})
+
+    def test_price_and_seat_filters(self):
+        self.assertEqual(self._models(search_vehicles(self.tenant.id, min_price=50)), ["Model 0", "Model 2"])
+        self.assertEqual(self._models(search_vehicles(self.tenant.id, max_price=30)), ["Model 1", "Model 3"])
+        # categoria sem lugares conta como 5
+        self.assertEqual(search_vehicles(self.tenant.id, seats_min=5).total, 4)
+        self.assertEqual(search_vehicles(self.tenant.id, seats_min=6).total, 2)
+
+    def test_sort_and_pagination(self):
+        page = search_vehicles(self.tenant.id, sort="price_desc", page=2, per_page=3)
+        self.assertEqual((page.total, page.pages, page.page), (4, 2, 2))
+        self.assertEqual(self._models(page), ["Model 3"])
+        page = search_vehicles(self.tenant.id, sort="price_asc", page=9, per_page=3)
+        self.assertEqual(page.page, 2)
+        self.assertEqual(self._models(page), ["Model 2"])
+
+    def test_cards_are_projected_in_one_query(self):
+        tenant_id = self.tenant.id
+        db.session.expire_all()
+        statements = []
+        listener = lambda *a, **kw: statements.append(a[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            page = search_vehicles(tenant_id, sort="price_asc", days=7)
+            cards = [(c.category_name, c.seats, c.transmission, c.total, c.discount) for c in page.items]
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        # COUNT + página; nenhum lazy-load de categoria ao montar os cards
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(cards[0], ("Eco", 5, "Automatic", 210.0, 10))
+        self.assertEqual(cards[-1], ("SUV", 7, "Automatic", 560.0, 10))
+
+    def test_confirmed_reservation_excludes_vehicle(self):
+        db.session.add(Reservation(
+            tenant_id=self.tenant.id, vehicle_id=self.cars[0].id, category_id=self.suv.id,
+            customer_name="x", phone="1", email="x@x.com", pickup_airport="MIA", dropoff_airport="MIA",
+            pickup_dt=datetime(2025, 5, 1), dropoff_dt=datetime(2025, 5, 5), status="confirmed",
+        ))
+        db.session.commit()
+        page = search_vehicles(
+            self.tenant.id, start_dt=datetime(2025, 5, 2), end_dt=datetime(2025, 5, 3),
+            category_ids=[self.suv.id],
+        )
+        self.assertEqual(self._models(page), ["Model 2"])
+
+
+if __name__ == "__main__":
+    unittest.main()